@@ -10,6 +10,8 @@ from flask import Flask, request, current_app
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.executors.pool import ThreadPoolExecutor
 from app.utils.cleanup import cleanup_old_images
+from app.core.font_utils import configure_fonts, preload_fonts
+from app.core.image_processing import configure_image_processing
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +35,12 @@ def create_app(config_object=None):
     os.makedirs(app.config['OUTPUT_IMAGES_DIR'], exist_ok=True)
     os.makedirs(app.config['OUTPUT_TEMP_DIR'], exist_ok=True)
     
+    # Apply font settings (cache sizes etc.) and warm the font cache (frozen for
+    # copy-on-write sharing when the workers are forked from this process)
+    configure_fonts(app.config)
+    preload_fonts(app.config.get('FONT_PRELOAD', []), freeze=app.config.get('PRELOAD_APP', False))
+    configure_image_processing(app.config)
+    
     # Register blueprints
     from app.api.routes import api_bp
     from app.web.routes import web_bp
@@ -53,6 +61,24 @@ def create_app(config_object=None):
                 logger.warning(f"Request took {elapsed:.2f}s, exceeding timeout of {app.config['REQUEST_TIMEOUT']}s")
         return response
     
+    # Threads do not survive a fork, so with --preload gunicorn.conf.py starts the
+    # scheduler in each worker instead
+    if not app.config.get('PRELOAD_APP', False):
+        start_scheduler(app)
+    
+    # Log startup configuration
+    logger.info(f"App configured with REQUEST_TIMEOUT={app.config['REQUEST_TIMEOUT']}s, "
+                f"TASK_TIMEOUT={app.config['TASK_TIMEOUT']}s")
+    
+    return app
+
+def start_scheduler(app):
+    """
+    Start the background scheduler that removes old processed images
+    
+    Args:
+        app (Flask): Application whose OUTPUT_DIR is cleaned
+    """
     # Set up image cleanup scheduler with timeout limits
     executors = {
         'default': ThreadPoolExecutor(max_workers=2)
@@ -74,9 +100,3 @@ def create_app(config_object=None):
     scheduler.start()
     
     app.scheduler = scheduler  # Store scheduler instance in app for later reference
-    
-    # Log startup configuration
-    logger.info(f"App configured with REQUEST_TIMEOUT={app.config['REQUEST_TIMEOUT']}s, "
-                f"TASK_TIMEOUT={app.config['TASK_TIMEOUT']}s")
-    
-    return app 
\ No newline at end of file
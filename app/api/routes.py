@@ -9,13 +9,18 @@ import uuid
 import json
 import logging
 import requests
-from PIL import Image
+from PIL import Image, UnidentifiedImageError
 from io import BytesIO
 from flask import Blueprint, request, jsonify, current_app, send_file
 
-from app.core.image_processing import apply_custom_text, crop_to_fit
-from app.core.font_utils import get_available_fonts
-from app.api.validation import validate_process_custom_request
+from app.core.image_processing import (
+    QUALITY_TIERS, apply_text_layers, crop_to_fit, get_background_cache_stats, get_layout_cache_stats,
+    measure_text_layers, probe_image
+)
+from app.core.font_utils import get_available_fonts, get_font_families, get_font_cache_stats
+from app.core.glyph_cache import get_glyph_cache_stats
+from app.core.text_shaping import get_shaping_cache_stats
+from app.api.validation import validate_process_custom_request, validate_layout_request
 
 # Create blueprint
 api_bp = Blueprint('api', __name__, url_prefix='/api')
@@ -28,9 +33,21 @@ def health_check():
 
 @api_bp.route('/fonts', methods=['GET'])
 def get_fonts():
-    """Get a list of available fonts"""
+    """Get a list of available fonts and the catalogued font families"""
     fonts = get_available_fonts()
-    return jsonify({"fonts": fonts})
+    return jsonify({"fonts": fonts, "families": get_font_families()})
+
+@api_bp.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    """Get hit rates and sizes of this worker's in-process caches"""
+    return jsonify({
+        "fonts": get_font_cache_stats(),
+        "probe_fonts": get_font_cache_stats(probe=True),
+        "layouts": get_layout_cache_stats(),
+        "shaping": get_shaping_cache_stats(),
+        "glyph_runs": get_glyph_cache_stats(),
+        "backgrounds": get_background_cache_stats()
+    })
 
 @api_bp.route('/process_custom', methods=['POST'])
 def process_custom():
@@ -54,46 +71,48 @@ def process_custom():
         if response.status_code != 200:
             return jsonify({"error": f"Error downloading image: {response.status_code}"}), 400
         
-        # Load the image
-        img = Image.open(BytesIO(response.content))
-        logger.info(f"Image loaded successfully. Original size: {img.width}x{img.height}")
+        # Read the image, giving up on downloads larger than MAX_IMAGE_SIZE
+        image_data = _read_download(response, current_app.config['MAX_IMAGE_SIZE'])
+        if image_data is None:
+            return jsonify({"error": f"Image is larger than {current_app.config['MAX_IMAGE_SIZE']} bytes"}), 413
         
-        # Process image dimensions
+        # Open the image, which only reads its header (pixels are decoded when first used)
+        try:
+            img = Image.open(image_data)
+        except Image.DecompressionBombError as e:
+            return jsonify({"error": f"Image is too large: {str(e)}"}), 413
+        except UnidentifiedImageError:
+            return jsonify({"error": "Unsupported or corrupt image"}), 400
+        
+        # Resampling filter, decoding and encoder effort of the requested quality tier
+        quality = QUALITY_TIERS[data.get('quality', current_app.config['DEFAULT_QUALITY'])]
+        
+        # Check the source against the configured limits before decoding it
         target_width = data.get('width', current_app.config['DEFAULT_WIDTH'])
         target_height = data.get('height', current_app.config['DEFAULT_HEIGHT'])
+        probe = probe_image(img, target_width, target_height, quality['resize']['draft_oversampling'])
+        logger.info(f"Image header read. Format: {probe['format']}, original size: {probe['width']}x{probe['height']}, "
+                    f"mode: {probe['mode']}, decoded size: {probe['decoded_bytes'] / 2 ** 20:.1f} MiB")
+        error = _check_image_limits(probe, target_width, target_height)
+        if error is not None:
+            logger.warning(f"Image rejected: {error[0]}")
+            return jsonify({"error": error[0]}), error[1]
+        
+        # Process image dimensions
         if target_width != img.width or target_height != img.height:
             logger.info(f"Resizing image to: {target_width}x{target_height}")
-            img = crop_to_fit(img, target_width, target_height)
-        
-        # Extract parameters
-        text = data.get('text', '')
-        language = data.get('language', 'en')
-        font_family = data.get('font_family', current_app.config['DEFAULT_FONT_FAMILY'])
-        font_size = data.get('font_size', current_app.config['DEFAULT_FONT_SIZE'])
-        text_color = data.get('text_color', '#FFFFFF')
-        background_color = data.get('background_color', '#000000')
-        text_position = data.get('text_position')
-        alignment = data.get('alignment', 'bottom-center')
-        padding = data.get('padding', 20)
-        bg_curve = data.get('bg_curve', 0)
-        container_margin = data.get('container_margin', 0)
-        container_width_percent = data.get('container_width_percent', 90)
-        
-        # Handle text color (convert hex to RGB tuple)
-        if isinstance(text_color, str) and text_color.startswith('#'):
-            text_color = hex_to_rgba(text_color)
+            img = crop_to_fit(img, target_width, target_height, **quality['resize'])
         
-        # Handle background color with opacity
-        if isinstance(background_color, str) and background_color.startswith('#'):
-            bg_opacity = data.get('bg_opacity', 1.0)
-            bg_color = hex_to_rgba(background_color, bg_opacity)
-        else:
-            bg_color = background_color
+        # Extract the text layers
+        layers = _text_layers(data)
         
-        # Apply text overlay
-        processed_img = apply_custom_text(
-            img, text, language, font_family, font_size, text_color, bg_color,
-            text_position, alignment, padding, bg_curve, container_margin, container_width_percent
+        # Apply all text overlays in one pass, drawing onto the downloaded image itself
+        # since nothing else uses it
+        processed_img = apply_text_layers(
+            img, layers,
+            min_font_size=current_app.config['FIT_MIN_FONT_SIZE'],
+            max_font_size=current_app.config['FIT_MAX_FONT_SIZE'],
+            in_place=True
         )
         
         # Generate a unique filename
@@ -101,19 +120,169 @@ def process_custom():
         output_path = os.path.join(current_app.config['OUTPUT_DIR'], output_filename)
         
         # Save the processed image with DPI information
-        processed_img.save(output_path, dpi=(current_app.config['DEFAULT_DPI'], current_app.config['DEFAULT_DPI']))
+        processed_img.save(output_path, dpi=(current_app.config['DEFAULT_DPI'], current_app.config['DEFAULT_DPI']),
+                           **quality['save'])
         
         # Log processing time
         processing_time = time.time() - start_time
         logger.info(f"Image processed successfully in {processing_time:.2f} seconds. Size: {processed_img.width}x{processed_img.height}")
         
-        # Return the processed image
-        return send_file(output_path, mimetype='image/png')
+        # Return the processed image, reporting the font size used by each layer (it
+        # differs from the requested one when the text was fitted or shrunk)
+        response = send_file(output_path, mimetype='image/png')
+        response.headers['X-Font-Size'] = ','.join(str(size) for size in processed_img.info['font_sizes'])
+        return response
         
     except Exception as e:
         logger.error(f"Error processing image: {str(e)}")
         return jsonify({"error": f"Error processing image: {str(e)}"}), 500
 
+@api_bp.route('/layout', methods=['POST'])
+def layout():
+    """
+    Lay out the text of a process_custom request without rendering it
+    
+    Takes the same JSON as /api/process_custom (image_url is not needed) and
+    returns the line breaks, line boxes, container, font size and overflow
+    flags of each text layer, without downloading or encoding any image.
+    """
+    validation_result = validate_layout_request(request)
+    if validation_result['success'] is False:
+        return jsonify({"error": validation_result['message']}), 400
+    
+    data = request.json
+    width = data.get('width', current_app.config['DEFAULT_WIDTH'])
+    height = data.get('height', current_app.config['DEFAULT_HEIGHT'])
+    
+    try:
+        layers = measure_text_layers(
+            (width, height), _text_layers(data),
+            min_font_size=current_app.config['FIT_MIN_FONT_SIZE'],
+            max_font_size=current_app.config['FIT_MAX_FONT_SIZE']
+        )
+    except Exception as e:
+        logger.error(f"Error laying out text: {str(e)}")
+        return jsonify({"error": f"Error laying out text: {str(e)}"}), 500
+    
+    return jsonify({"width": width, "height": height, "layers": layers})
+
+def _read_download(response, max_bytes):
+    """
+    Read a streamed image download into memory
+    
+    Returns:
+        BytesIO: Downloaded bytes, or None if there are more than max_bytes (the
+        download is abandoned as soon as Content-Length or the data read says so)
+    """
+    content_length = response.headers.get('Content-Length', '')
+    if content_length.isdigit() and int(content_length) > max_bytes:
+        response.close()
+        return None
+    
+    data = BytesIO()
+    for chunk in response.iter_content(chunk_size=64 * 1024):
+        data.write(chunk)
+        if data.tell() > max_bytes:
+            response.close()
+            return None
+    data.seek(0)
+    return data
+
+def _check_image_limits(probe, target_width, target_height):
+    """
+    Check an image header against the ALLOWED_IMAGE_TYPES, MAX_IMAGE_PIXELS and
+    MAX_DECODED_BYTES limits
+    
+    The decoded size is that of the source (at its reduced JPEG decoding scale,
+    if any) plus the RGBA output frame, both of which are held during the crop.
+    
+    Returns:
+        tuple: Error message and HTTP status code, or None if the image is within the limits
+    """
+    config = current_app.config
+    if probe['mime_type'] not in config['ALLOWED_IMAGE_TYPES']:
+        return f"Unsupported image type: {probe['mime_type'] or probe['format']}", 415
+    
+    if probe['pixels'] > config['MAX_IMAGE_PIXELS']:
+        return (f"Image is too large: {probe['width']}x{probe['height']} is more than "
+                f"{config['MAX_IMAGE_PIXELS']} pixels"), 413
+    
+    decoded_bytes = probe['decoded_bytes'] + target_width * target_height * 4
+    if decoded_bytes > config['MAX_DECODED_BYTES']:
+        return (f"Image is too large: decoding {probe['width']}x{probe['height']} to {target_width}x{target_height} "
+                f"needs {decoded_bytes} bytes, more than {config['MAX_DECODED_BYTES']}"), 413
+    
+    return None
+
+def _text_layers(data):
+    """
+    Get the text layers of a process_custom or layout request
+    
+    A request without "layers" has a single layer made of its top-level text
+    options; otherwise those options are the defaults of its layers.
+    """
+    if 'layers' in data:
+        return [_text_layer(layer, data) for layer in data['layers']]
+    return [_text_layer(data, {})]
+
+# Text options of a layer that are taken from the top level of the request if the layer omits them
+_INHERITED_LAYER_OPTIONS = (
+    'language', 'font_family', 'font_size', 'font_weight', 'font_style', 'text_color',
+    'background_color', 'bg_opacity', 'alignment', 'padding', 'bg_curve', 'container_margin',
+    'container_width_percent', 'fit', 'max_height', 'gradient_colors', 'gradient_direction'
+)
+
+def _text_layer(options, defaults):
+    """
+    Get the apply_custom_text keyword arguments of one text layer
+    
+    Args:
+        options (dict): Text options of the layer
+        defaults (dict): Options used where the layer does not set them
+        
+    Returns:
+        dict: Layer for apply_text_layers
+    """
+    def get(key, default=None):
+        if key in options:
+            return options[key]
+        if key in _INHERITED_LAYER_OPTIONS:
+            return defaults.get(key, default)
+        return default
+    
+    # Handle text color (convert hex to RGB tuple)
+    text_color = get('text_color', '#FFFFFF')
+    if isinstance(text_color, str) and text_color.startswith('#'):
+        text_color = hex_to_rgba(text_color)
+    
+    # Handle background color with opacity
+    background_color = get('background_color', '#000000')
+    if isinstance(background_color, str) and background_color.startswith('#'):
+        bg_color = hex_to_rgba(background_color, get('bg_opacity', 1.0))
+    else:
+        bg_color = background_color
+    
+    return {
+        'text': get('text', ''),
+        'language': get('language', 'en'),
+        'font_family': get('font_family', current_app.config['DEFAULT_FONT_FAMILY']),
+        'font_size': get('font_size', current_app.config['DEFAULT_FONT_SIZE']),
+        'font_weight': get('font_weight', 400),
+        'font_style': get('font_style', 'normal'),
+        'text_color': text_color,
+        'bg_color': bg_color,
+        'text_position': get('text_position'),
+        'alignment': get('alignment', 'bottom-center'),
+        'padding': get('padding', 20),
+        'bg_curve': get('bg_curve', 0),
+        'container_margin': get('container_margin', 0),
+        'container_width_percent': get('container_width_percent', 90),
+        'fit': get('fit'),
+        'gradient_colors': get('gradient_colors'),
+        'gradient_direction': get('gradient_direction', 'vertical'),
+        'max_height': get('max_height')
+    }
+
 def hex_to_rgba(hex_color, alpha=1.0):
     """Convert hex color to RGBA tuple"""
     hex_color = hex_color.lstrip('#')
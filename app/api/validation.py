@@ -3,8 +3,10 @@
 Request validation utilities for the API
 """
 
+import math
 import logging
 from flask import current_app
+from app.core.image_processing import GRADIENT_DIRECTIONS, QUALITY_TIERS, parse_gradient_stops
 
 logger = logging.getLogger(__name__)
 
@@ -46,12 +48,109 @@ def validate_process_custom_request(request):
             'message': 'Invalid image_url format. Must be a valid HTTP, HTTPS, or file URL.'
         }
     
+    return _validate_render_options(data)
+
+def validate_layout_request(request):
+    """
+    Validate the request data for the layout endpoint
+    
+    Takes the same options as process_custom, without the image.
+    
+    Args:
+        request: Flask request object
+        
+    Returns:
+        dict: Validation result with 'success' and 'message' keys
+    """
+    # Check for JSON data
+    if not request.is_json:
+        return {
+            'success': False,
+            'message': 'Request must contain JSON data'
+        }
+    
+    return _validate_render_options(request.json)
+
+def _validate_render_options(data):
+    """
+    Validate the output size and text options shared by process_custom and layout
+    
+    Args:
+        data (dict): Request data
+        
+    Returns:
+        dict: Validation result with 'success' and 'message' keys
+    """
+    # Optional parameters validation
+    # Width and height
+    width = data.get('width')
+    height = data.get('height')
+    
+    if width is not None and not isinstance(width, int):
+        return {
+            'success': False,
+            'message': 'Invalid width. Must be an integer.'
+        }
+    
+    if height is not None and not isinstance(height, int):
+        return {
+            'success': False,
+            'message': 'Invalid height. Must be an integer.'
+        }
+    
+    quality = data.get('quality')
+    if quality is not None and quality not in QUALITY_TIERS:
+        return {
+            'success': False,
+            'message': "Invalid quality. Must be 'fast', 'balanced' or 'best'."
+        }
+    
+    # Text options, of the request itself and of each layer
+    result = _validate_text_options(data)
+    if result is not None:
+        return result
+    
+    layers = data.get('layers')
+    if layers is not None:
+        max_layers = current_app.config['MAX_TEXT_LAYERS']
+        if not isinstance(layers, list) or not 1 <= len(layers) <= max_layers:
+            return {
+                'success': False,
+                'message': f'Invalid layers. Must be a list of 1 to {max_layers} text layers.'
+            }
+        for index, layer in enumerate(layers):
+            if not isinstance(layer, dict):
+                return {
+                    'success': False,
+                    'message': f'Invalid layers[{index}]. Must be an object with text options.'
+                }
+            result = _validate_text_options(layer, f'layers[{index}]: ')
+            if result is not None:
+                return result
+    
+    # All validation passed
+    return {
+        'success': True,
+        'message': 'Validation successful'
+    }
+
+def _validate_text_options(options, prefix=''):
+    """
+    Validate the text options of a request or of one of its layers
+    
+    Args:
+        options (dict): Text options
+        prefix (str): Prefix for error messages (e.g. 'layers[0]: ')
+        
+    Returns:
+        dict: Failed validation result, or None if the options are valid
+    """
     # Validate padding format if provided
-    padding = data.get('padding')
+    padding = options.get('padding')
     if padding is not None and not isinstance(padding, (int, dict)):
         return {
             'success': False,
-            'message': 'Invalid padding format. Must be an integer or a dictionary with top, right, bottom, left keys.'
+            'message': prefix + 'Invalid padding format. Must be an integer or a dictionary with top, right, bottom, left keys.'
         }
     
     # Validate dictionary padding if provided
@@ -61,33 +160,77 @@ def validate_process_custom_request(request):
             if key not in padding:
                 return {
                     'success': False,
-                    'message': f'Missing required padding key: {key}'
+                    'message': prefix + f'Missing required padding key: {key}'
                 }
             if not isinstance(padding[key], (int, float)):
                 return {
                     'success': False,
-                    'message': f'Invalid padding value for {key}. Must be a number.'
+                    'message': prefix + f'Invalid padding value for {key}. Must be a number.'
                 }
     
-    # Optional parameters validation
-    # Width and height
-    width = data.get('width')
-    height = data.get('height')
+    # Font weight and style
+    font_weight = options.get('font_weight')
+    if font_weight is not None and (not isinstance(font_weight, int) or not 1 <= font_weight <= 1000):
+        return {
+            'success': False,
+            'message': prefix + 'Invalid font_weight. Must be an integer between 1 and 1000.'
+        }
     
-    if width is not None and not isinstance(width, int):
+    font_style = options.get('font_style')
+    if font_style is not None and font_style not in ('normal', 'italic'):
         return {
             'success': False,
-            'message': 'Invalid width. Must be an integer.'
+            'message': prefix + "Invalid font_style. Must be 'normal' or 'italic'."
         }
     
-    if height is not None and not isinstance(height, int):
+    # Text fitting
+    fit = options.get('fit')
+    if fit is not None and fit not in ('shrink', 'fill'):
         return {
             'success': False,
-            'message': 'Invalid height. Must be an integer.'
+            'message': prefix + "Invalid fit. Must be 'shrink' or 'fill'."
         }
     
-    # All validation passed
-    return {
-        'success': True,
-        'message': 'Validation successful'
-    } 
\ No newline at end of file
+    max_height = options.get('max_height')
+    if max_height is not None and (not isinstance(max_height, int) or max_height <= 0):
+        return {
+            'success': False,
+            'message': prefix + 'Invalid max_height. Must be a positive integer.'
+        }
+    
+    # Gradient background
+    gradient_colors = options.get('gradient_colors')
+    if gradient_colors is not None:
+        if not isinstance(gradient_colors, list) or len(gradient_colors) < 2:
+            return {
+                'success': False,
+                'message': prefix + 'Invalid gradient_colors. Must be a list of at least 2 color stops.'
+            }
+        try:
+            parse_gradient_stops(gradient_colors)
+        except (ValueError, TypeError, AttributeError):
+            return {
+                'success': False,
+                'message': prefix + 'Invalid gradient_colors. Each stop must be a color or an object with '
+                                    'a color and a position between 0 and 1.'
+            }
+    
+    gradient_direction = options.get('gradient_direction')
+    if (gradient_direction is not None and gradient_direction not in GRADIENT_DIRECTIONS and
+            not _is_finite_number(gradient_direction)):
+        return {
+            'success': False,
+            'message': prefix + "Invalid gradient_direction. Must be 'vertical', 'horizontal', 'diagonal', "
+                                "'radial' or an angle in degrees."
+        }
+    
+    return None
+
+def _is_finite_number(value):
+    """Whether a JSON value is a number (not a bool, NaN or Infinity) that fits in a float"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return False
+    try:
+        return math.isfinite(value)
+    except OverflowError:
+        return False
@@ -0,0 +1,516 @@
+#!/usr/bin/env python3
+"""
+Font catalog for Dila Headless Image Editor
+
+Reads family names, weight/width classes, style and character coverage
+directly from the sfnt tables (name, OS/2, head, cmap) of the font files,
+and keeps the result in a compact on-disk index so the files only have to
+be parsed again when they change.
+"""
+
+import os
+import re
+import json
+import struct
+import logging
+import tempfile
+
+try:
+    import brotli
+except ImportError:  # WOFF2 files are then catalogued from their file name only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Bump when the entry format changes so stale catalogs are rebuilt
+CATALOG_VERSION = 1
+
+# name table IDs
+NAME_FAMILY = 1
+NAME_SUBFAMILY = 2
+NAME_FULL_NAME = 4
+NAME_TYPOGRAPHIC_FAMILY = 16
+NAME_TYPOGRAPHIC_SUBFAMILY = 17
+
+# OS/2 usWidthClass of a normal (not condensed or expanded) face
+WIDTH_NORMAL = 5
+
+# Tables the catalog reads
+_CATALOG_TABLES = ('name', 'OS/2', 'head', 'cmap')
+
+# Known table tags of the WOFF2 table directory, by index
+_WOFF2_KNOWN_TAGS = (
+    'cmap', 'head', 'hhea', 'hmtx', 'maxp', 'name', 'OS/2', 'post', 'cvt ', 'fpgm', 'glyf', 'loca',
+    'prep', 'CFF ', 'VORG', 'EBDT', 'EBLC', 'gasp', 'hdmx', 'kern', 'LTSH', 'PCLT', 'VDMX', 'vhea',
+    'vmtx', 'BASE', 'GDEF', 'GPOS', 'GSUB', 'EBSC', 'JSTF', 'MATH', 'CBDT', 'CBLC', 'COLR', 'CPAL',
+    'SVG ', 'sbix', 'acnt', 'avar', 'bdat', 'bloc', 'bsln', 'cvar', 'fdsc', 'feat', 'fmtx', 'fvar',
+    'gvar', 'hsty', 'just', 'lcar', 'mort', 'morx', 'opbd', 'prop', 'trak', 'Zapf', 'Silf', 'Glat',
+    'Gloc', 'Feat', 'Sill'
+)
+
+# File names written by the Google Fonts downloader: <family>_<weight>_<style>
+_GOOGLE_FONT_ID = re.compile(r'^([a-z0-9]+)_(\d{3})_(normal|italic)$')
+
+def normalize_family_name(name):
+    """Normalize a family name for lookups ('Noto Sans Arabic' -> 'notosansarabic')"""
+    return ''.join(ch for ch in name.lower() if ch.isalnum())
+
+def _read_table_directory(data):
+    """Return a dict of table tag -> (buffer, offset) for the tables the catalog reads"""
+    # Font collections (.ttc) are catalogued by their first font, which is what gets loaded
+    base = struct.unpack_from('>I', data, 12)[0] if data[:4] == b'ttcf' else 0
+    num_tables = struct.unpack_from('>H', data, base + 4)[0]
+    tables = {}
+    for i in range(num_tables):
+        tag, _, offset, _ = struct.unpack_from('>4sIII', data, base + 12 + i * 16)
+        tag = tag.decode('latin-1')
+        if tag in _CATALOG_TABLES:
+            tables[tag] = (data, offset)
+    return tables
+
+def _read_uint_base128(data, offset):
+    value = 0
+    for i in range(5):
+        byte = data[offset + i]
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, offset + i + 1
+    raise ValueError('Invalid UIntBase128 value')
+
+def _read_woff2_table_directory(data):
+    """
+    Return a dict of table tag -> (buffer, offset) for a WOFF2 file.
+
+    The catalog tables are never transformed by WOFF2, so they can be read
+    straight from the decompressed table stream.
+    """
+    if brotli is None:
+        return None
+    flavor, _, num_tables = struct.unpack_from('>4sIH', data, 4)
+    if flavor == b'ttcf':
+        return None
+    compressed_size = struct.unpack_from('>I', data, 20)[0]
+
+    offset = 48
+    directory = []
+    for _ in range(num_tables):
+        flags = data[offset]
+        offset += 1
+        if flags & 0x3F == 0x3F:
+            tag = data[offset:offset + 4].decode('latin-1')
+            offset += 4
+        else:
+            tag = _WOFF2_KNOWN_TAGS[flags & 0x3F]
+        length, offset = _read_uint_base128(data, offset)
+        transform_version = flags >> 6
+        if (tag in ('glyf', 'loca')) == (transform_version == 0):
+            length, offset = _read_uint_base128(data, offset)
+        directory.append((tag, length))
+
+    stream = brotli.decompress(data[offset:offset + compressed_size])
+    tables = {}
+    position = 0
+    for tag, length in directory:
+        if tag in _CATALOG_TABLES:
+            tables[tag] = (stream, position)
+        position += length
+    return tables
+
+def _read_names(data, offset):
+    """Return a dict of name ID -> string, preferring Windows/Unicode English records"""
+    _, count, string_offset = struct.unpack_from('>HHH', data, offset)
+    names = {}
+    priorities = {}
+    for i in range(count):
+        platform_id, encoding_id, language_id, name_id, length, str_offset = struct.unpack_from(
+            '>HHHHHH', data, offset + 6 + i * 12)
+        if platform_id == 3 and encoding_id in (1, 10):
+            priority = 0 if language_id == 0x409 else 1
+            encoding = 'utf-16-be'
+        elif platform_id == 0:
+            priority = 2
+            encoding = 'utf-16-be'
+        elif platform_id == 1 and encoding_id == 0:
+            priority = 3
+            encoding = 'mac_roman'
+        else:
+            continue
+        if name_id in priorities and priorities[name_id] <= priority:
+            continue
+        start = offset + string_offset + str_offset
+        try:
+            names[name_id] = data[start:start + length].decode(encoding).strip()
+            priorities[name_id] = priority
+        except UnicodeDecodeError:
+            continue
+    return names
+
+def _read_cmap_coverage(data, offset):
+    """
+    Return the codepoints mapped to a glyph as a sorted list of [start, end] ranges
+    """
+    num_subtables = struct.unpack_from('>H', data, offset + 2)[0]
+    subtables = {}
+    for i in range(num_subtables):
+        platform_id, encoding_id, sub_offset = struct.unpack_from('>HHI', data, offset + 4 + i * 8)
+        fmt = struct.unpack_from('>H', data, offset + sub_offset)[0]
+        subtables[(platform_id, encoding_id, fmt)] = offset + sub_offset
+
+    # Prefer full-repertoire format 12 subtables over BMP-only format 4 ones
+    for key in ((3, 10, 12), (0, 6, 12), (0, 4, 12), (3, 1, 4), (0, 3, 4), (0, 1, 4), (0, 0, 4)):
+        if key in subtables:
+            if key[2] == 12:
+                return _read_cmap_format12(data, subtables[key])
+            return _read_cmap_format4(data, subtables[key])
+    return []
+
+def _read_cmap_format4(data, offset):
+    seg_count = struct.unpack_from('>H', data, offset + 6)[0] // 2
+    ends_at = offset + 14
+    starts_at = ends_at + seg_count * 2 + 2
+    deltas_at = starts_at + seg_count * 2
+    range_offsets_at = deltas_at + seg_count * 2
+
+    ends = struct.unpack_from(f'>{seg_count}H', data, ends_at)
+    starts = struct.unpack_from(f'>{seg_count}H', data, starts_at)
+    deltas = struct.unpack_from(f'>{seg_count}H', data, deltas_at)
+    range_offsets = struct.unpack_from(f'>{seg_count}H', data, range_offsets_at)
+
+    covered = []
+    for i in range(seg_count):
+        start, end = starts[i], ends[i]
+        if start == 0xFFFF:
+            continue
+        if range_offsets[i] == 0:
+            # Glyph id is (codepoint + delta) & 0xFFFF, which is .notdef for at most one codepoint
+            missing = (-deltas[i]) & 0xFFFF
+            if start <= missing <= end:
+                if start < missing:
+                    covered.append([start, missing - 1])
+                if missing < end:
+                    covered.append([missing + 1, end])
+            else:
+                covered.append([start, end])
+        else:
+            glyphs_at = range_offsets_at + i * 2 + range_offsets[i]
+            for codepoint in range(start, end + 1):
+                glyph_offset = glyphs_at + (codepoint - start) * 2
+                if glyph_offset + 2 > len(data):
+                    break
+                if struct.unpack_from('>H', data, glyph_offset)[0] != 0:
+                    covered.append([codepoint, codepoint])
+    return _merge_ranges(covered)
+
+def _read_cmap_format12(data, offset):
+    num_groups = struct.unpack_from('>I', data, offset + 12)[0]
+    covered = []
+    for i in range(num_groups):
+        start, end, start_glyph = struct.unpack_from('>III', data, offset + 16 + i * 12)
+        if start_glyph == 0:
+            start += 1
+        if start <= end:
+            covered.append([start, end])
+    return _merge_ranges(covered)
+
+def _merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+def read_font_metadata(font_path):
+    """
+    Read catalog metadata from a TrueType/OpenType font file.
+
+    Args:
+        font_path (str): Path to the font file
+
+    Returns:
+        dict: Family, subfamily, full name, weight, width, italic flag and
+            cmap coverage ranges
+    """
+    with open(font_path, 'rb') as f:
+        data = f.read()
+
+    if data[:4] == b'wOF2':
+        tables = _read_woff2_table_directory(data) or {}
+    else:
+        tables = _read_table_directory(data)
+
+    names = _read_names(*tables['name']) if 'name' in tables else {}
+
+    weight, width, italic = 400, WIDTH_NORMAL, False
+    if 'OS/2' in tables:
+        buffer, os2_offset = tables['OS/2']
+        weight, width = struct.unpack_from('>HH', buffer, os2_offset + 4)
+        fs_selection = struct.unpack_from('>H', buffer, os2_offset + 62)[0]
+        italic = bool(fs_selection & 0x0201)  # ITALIC or OBLIQUE
+    elif 'head' in tables:
+        buffer, head_offset = tables['head']
+        mac_style = struct.unpack_from('>H', buffer, head_offset + 44)[0]
+        weight = 700 if mac_style & 0x01 else 400
+        italic = bool(mac_style & 0x02)
+
+    stem = os.path.splitext(os.path.basename(font_path))[0]
+    family = names.get(NAME_TYPOGRAPHIC_FAMILY) or names.get(NAME_FAMILY) or stem
+    aliases = {names.get(NAME_FAMILY, family)}
+
+    # Downloaded Google Fonts are named after the family/weight/style that was requested
+    google_font_id = _GOOGLE_FONT_ID.match(stem)
+    if google_font_id:
+        aliases.add(google_font_id.group(1))
+        weight = int(google_font_id.group(2))
+        italic = google_font_id.group(3) == 'italic'
+
+    aliases.discard(family)
+    return {
+        'family': family,
+        'aliases': sorted(aliases),
+        'subfamily': names.get(NAME_TYPOGRAPHIC_SUBFAMILY) or names.get(NAME_SUBFAMILY, 'Regular'),
+        'full_name': names.get(NAME_FULL_NAME, stem),
+        'weight': weight,
+        'width': width,
+        'italic': italic,
+        # None when the cmap could not be read (coverage unknown)
+        'coverage': _read_cmap_coverage(*tables['cmap']) if 'cmap' in tables else None
+    }
+
+class CoverageBitmap:
+    """
+    Codepoint coverage of a font as a bitmap, so coverage checks are O(1) bit tests
+    """
+
+    __slots__ = ('_bits', '_limit')
+
+    def __init__(self, ranges):
+        """
+        Args:
+            ranges (list): Sorted [start, end] codepoint ranges covered by the font
+        """
+        self._limit = ranges[-1][1] + 1 if ranges else 0
+        bits = bytearray((self._limit + 7) >> 3)
+        for start, end in ranges:
+            codepoint = start
+            # Leading bits up to a byte boundary, whole bytes, then the trailing bits
+            while codepoint <= end and codepoint & 7:
+                bits[codepoint >> 3] |= 1 << (codepoint & 7)
+                codepoint += 1
+            full_end = (end + 1) & ~7
+            if codepoint < full_end:
+                bits[codepoint >> 3:full_end >> 3] = b'\xff' * ((full_end - codepoint) >> 3)
+                codepoint = full_end
+            while codepoint <= end:
+                bits[codepoint >> 3] |= 1 << (codepoint & 7)
+                codepoint += 1
+        self._bits = bytes(bits)
+
+    def covers(self, codepoint):
+        """Return True if the font maps codepoint to a glyph"""
+        return codepoint < self._limit and bool(self._bits[codepoint >> 3] & (1 << (codepoint & 7)))
+
+    def covers_text(self, text):
+        """Return True if the font maps every character of text to a glyph"""
+        bits, limit = self._bits, self._limit
+        for ch in text:
+            codepoint = ord(ch)
+            if codepoint >= limit or not bits[codepoint >> 3] & (1 << (codepoint & 7)):
+                return False
+        return True
+
+def _is_downloaded(entry):
+    """Whether a catalog entry is a font file written by the Google Fonts downloader"""
+    stem = os.path.splitext(os.path.basename(entry['file']))[0]
+    return _GOOGLE_FONT_ID.match(stem) is not None
+
+def _weight_rank(desired, available):
+    """
+    Rank a font weight against the desired one following the CSS font matching order
+    (lower is better)
+    """
+    if available == desired:
+        return 0
+    if 400 <= desired <= 500:
+        if desired < available <= 500:
+            return available - desired
+        if available < desired:
+            return 1000 + desired - available
+        return 2000 + available - desired
+    if desired < 400:
+        if available < desired:
+            return desired - available
+        return 1000 + available - desired
+    if available > desired:
+        return available - desired
+    return 1000 + desired - available
+
+class FontCatalog:
+    """
+    Catalog of font files with their sfnt metadata, persisted as a compact JSON index.
+
+    Entries are keyed by file path relative to the fonts directory and are
+    only re-read when a file's size or mtime changes.
+    """
+
+    def __init__(self, fonts_dir, catalog_file):
+        self.fonts_dir = fonts_dir
+        self.catalog_file = catalog_file
+        self._entries = {}
+        self._families = {}
+        self._bitmaps = {}
+        self._loaded = False
+
+    def refresh(self, font_paths):
+        """
+        Bring the catalog in line with the given font files.
+
+        Args:
+            font_paths (iterable): Absolute paths of the font files to catalog
+        """
+        if not self._loaded:
+            self._entries = self._load()
+            self._loaded = True
+
+        entries = {}
+        changed = False
+        for font_path in font_paths:
+            relative_path = os.path.relpath(font_path, self.fonts_dir)
+            try:
+                stat = os.stat(font_path)
+            except OSError:
+                continue
+
+            entry = self._entries.get(relative_path)
+            if entry is None or entry['mtime_ns'] != stat.st_mtime_ns or entry['size'] != stat.st_size:
+                try:
+                    entry = read_font_metadata(font_path)
+                except Exception as e:
+                    logger.error(f"Error reading font metadata from {relative_path}: {str(e)}")
+                    continue
+                entry.update({'file': relative_path, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size})
+                changed = True
+            entries[relative_path] = entry
+
+        if changed or len(entries) != len(self._entries):
+            self._save(entries)
+        self._entries = entries
+        self._bitmaps = {}
+        self._index_families()
+
+    def find(self, font_family, weight=400, style='normal', downloaded=True):
+        """
+        Find the best matching variant of a family.
+
+        Normal-width faces in the requested style are preferred, then the
+        weight is matched following the CSS font matching rules.
+
+        Args:
+            font_family (str): Family name (case, spaces and dashes are ignored)
+            weight (int): Desired weight (100-900)
+            style (str): 'normal' or 'italic'
+            downloaded (bool): Whether downloaded Google Fonts variants may be returned
+
+        Returns:
+            dict: Catalog entry, or None if the family is unknown
+        """
+        variants = self._families.get(normalize_family_name(font_family))
+        if variants and not downloaded:
+            variants = [entry for entry in variants if not _is_downloaded(entry)]
+        if not variants:
+            return None
+        want_italic = style == 'italic'
+        return min(variants, key=lambda entry: (
+            entry['italic'] != want_italic,
+            abs(entry['width'] - WIDTH_NORMAL),
+            _weight_rank(weight, entry['weight']),
+            entry['file']
+        ))
+
+    def coverage(self, font_path):
+        """
+        Get the coverage bitmap of a font file.
+
+        Bitmaps are built on first use and kept until the catalog changes.
+        Files outside the fonts directory (e.g. system fonts) are read on
+        first use.
+
+        Args:
+            font_path (str): Absolute path of the font file
+
+        Returns:
+            CoverageBitmap: Coverage bitmap, or None if the coverage is unknown
+        """
+        if font_path in self._bitmaps:
+            return self._bitmaps[font_path]
+
+        entry = self._entries.get(os.path.relpath(font_path, self.fonts_dir))
+        ranges = entry['coverage'] if entry else None
+        if entry is None:
+            try:
+                ranges = read_font_metadata(font_path)['coverage']
+            except Exception as e:
+                logger.error(f"Error reading font coverage from {font_path}: {str(e)}")
+
+        bitmap = CoverageBitmap(ranges) if ranges is not None else None
+        self._bitmaps[font_path] = bitmap
+        return bitmap
+
+    def families(self):
+        """
+        Summarize the catalog by family
+
+        Returns:
+            list: Dicts with family name and its variants (file, weight, width, style)
+        """
+        summary = {}
+        for entry in sorted(self._entries.values(), key=lambda e: (e['family'], e['width'], e['weight'], e['file'])):
+            family = summary.setdefault(entry['family'], {'family': entry['family'], 'variants': []})
+            family['variants'].append({
+                'file': entry['file'],
+                'name': entry['full_name'],
+                'subfamily': entry['subfamily'],
+                'weight': entry['weight'],
+                'width': entry['width'],
+                'style': 'italic' if entry['italic'] else 'normal'
+            })
+        return list(summary.values())
+
+    def _index_families(self):
+        families = {}
+        for entry in self._entries.values():
+            keys = {normalize_family_name(name) for name in [entry['family']] + entry['aliases']}
+            for key in keys:
+                families.setdefault(key, []).append(entry)
+        self._families = families
+
+    def _load(self):
+        try:
+            with open(self.catalog_file, 'r') as f:
+                catalog = json.load(f)
+            if catalog.get('version') != CATALOG_VERSION:
+                return {}
+            return {entry['file']: entry for entry in catalog['fonts']}
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.error(f"Error loading font catalog: {str(e)}")
+            return {}
+
+    def _save(self, entries):
+        # Write to a temporary file of this process and swap it in, so workers saving at
+        # the same time never leave an interleaved or truncated catalog
+        partial_path = None
+        try:
+            with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(os.path.abspath(self.catalog_file)),
+                                             suffix='.part', delete=False) as f:
+                partial_path = f.name
+                json.dump({'version': CATALOG_VERSION, 'fonts': list(entries.values())}, f,
+                          separators=(',', ':'))
+            os.replace(partial_path, self.catalog_file)
+            logger.info(f"Saved font catalog with {len(entries)} fonts")
+        except Exception as e:
+            logger.error(f"Error saving font catalog: {str(e)}")
+            if partial_path is not None and os.path.exists(partial_path):
+                os.remove(partial_path)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Font fallback for Dila Headless Image Editor
+
+Splits text into script runs and renders each run with the first font of a
+fallback chain whose character coverage includes the whole run, so mixed
+Kurdish/Arabic/English text does not come out as tofu.
+"""
+
+import unicodedata
+import logging
+
+from app.core.glyph_cache import draw_text
+
+logger = logging.getLogger(__name__)
+
+# Characters without a script of their own take the script of the run they are in
+COMMON = 'Common'
+INHERITED = 'Inherited'
+
+_script_cache = {}
+
+def char_script(ch):
+    """
+    Get the script of a character.
+
+    Letters are classified by the script prefix of their Unicode name
+    (e.g. 'ARABIC', 'LATIN', 'CJK'); combining marks are Inherited and
+    everything else (spaces, digits, punctuation, symbols) is Common.
+
+    Args:
+        ch (str): A single character
+
+    Returns:
+        str: Script name
+    """
+    script = _script_cache.get(ch)
+    if script is None:
+        category = unicodedata.category(ch)
+        if category.startswith('M'):
+            script = INHERITED
+        elif category.startswith('L'):
+            script = unicodedata.name(ch, 'UNKNOWN').split(' ', 1)[0]
+        else:
+            script = COMMON
+        _script_cache[ch] = script
+    return script
+
+def has_rtl(text):
+    """
+    Check whether text contains right-to-left characters.
+
+    Args:
+        text (str): Text to check
+
+    Returns:
+        bool: True if any character has bidi class R or AL
+    """
+    return any(unicodedata.bidirectional(ch) in ('R', 'AL') for ch in text)
+
+def script_runs(text):
+    """
+    Split text into runs of a single script.
+
+    Common and Inherited characters join the run they follow (or, at the
+    start of the text, the run they precede).
+
+    Args:
+        text (str): Text to split
+
+    Returns:
+        list: (run, script) tuples in text order
+    """
+    runs = []
+    run_start = 0
+    run_script = None
+    for i, ch in enumerate(text):
+        script = char_script(ch)
+        if script in (COMMON, INHERITED) or script == run_script:
+            continue
+        if run_script is None:
+            run_script = script
+            continue
+        runs.append((text[run_start:i], run_script))
+        run_start = i
+        run_script = script
+    if run_start < len(text):
+        runs.append((text[run_start:], run_script or COMMON))
+    return runs
+
+class FontChain:
+    """
+    A primary font plus fallback fonts, each with its coverage bitmap.
+
+    Provides the getbbox/getlength subset of the PIL font interface used by
+    the text layout, and draws text run by run. Text the primary font fully
+    covers is measured and drawn with the primary font alone, exactly as if
+    no fallback chain were in use.
+    """
+
+    def __init__(self, fonts):
+        """
+        Args:
+            fonts (list): (font, coverage) tuples, primary font first. A coverage
+                of None means unknown and is treated as complete.
+        """
+        self.fonts = fonts
+        self.font = fonts[0][0]
+
+    def runs(self, text):
+        """
+        Split text into (run, font) tuples.
+
+        Args:
+            text (str): Text in display order
+
+        Returns:
+            list: (run, font) tuples; adjacent runs using the same font are merged
+        """
+        coverage = self.fonts[0][1]
+        if len(self.fonts) == 1 or coverage is None or coverage.covers_text(text):
+            return [(text, self.font)]
+
+        runs = []
+        for run, _ in script_runs(text):
+            font = self._font_for(run)
+            if runs and runs[-1][1] is font:
+                runs[-1] = (runs[-1][0] + run, font)
+            else:
+                runs.append((run, font))
+        return runs
+
+    def _font_for(self, run):
+        for font, coverage in self.fonts:
+            if coverage is None or coverage.covers_text(run):
+                return font
+        # Nothing covers the whole run, prefer the font covering most of it
+        return max(self.fonts, key=lambda item: sum(item[1].covers(ord(ch)) for ch in run))[0]
+
+    def _visual_runs(self, text, direction):
+        """
+        Get (run, font, direction) tuples in drawing order.
+
+        Text for the basic layout is already in visual order (direction None).
+        With Raqm, text is in logical order: each run is laid out in its own
+        direction and, in a right-to-left paragraph, runs go right to left.
+        """
+        runs = self.runs(text)
+        if direction is None:
+            return [(run, font, None) for run, font in runs]
+        if len(runs) == 1:
+            return [(text, runs[0][1], direction)]
+        visual_runs = [(run, font, 'rtl' if has_rtl(run) else 'ltr') for run, font in runs]
+        return visual_runs[::-1] if direction == 'rtl' else visual_runs
+
+    def getlength(self, text, direction=None, language=None):
+        """Return the advance width of text"""
+        return sum(font.getlength(run, direction=run_direction, language=language)
+                   for run, font, run_direction in self._visual_runs(text, direction))
+
+    def getbbox(self, text, direction=None, language=None):
+        """Return the (left, top, right, bottom) box of text drawn at (0, 0)"""
+        runs = self._visual_runs(text, direction)
+        if len(runs) == 1:
+            return runs[0][1].getbbox(text, direction=direction, language=language)
+
+        # Runs are laid out on the primary font's baseline
+        ascent = self.font.getmetrics()[0]
+        x = 0
+        box = None
+        for run, font, run_direction in runs:
+            left, top, right, bottom = font.getbbox(run, direction=run_direction, language=language, anchor='ls')
+            run_box = (left + x, top + ascent, right + x, bottom + ascent)
+            if box is None:
+                box = run_box
+            else:
+                box = (min(box[0], run_box[0]), min(box[1], run_box[1]),
+                       max(box[2], run_box[2]), max(box[3], run_box[3]))
+            x += font.getlength(run, direction=run_direction, language=language)
+        return box
+
+    def draw_text(self, image, draw, xy, text, fill, direction=None, language=None):
+        """
+        Draw text, switching fonts between runs
+
+        Runs are drawn through the glyph run cache, so repeated lines are
+        composited from cached masks instead of being rasterized again.
+
+        Args:
+            image (PIL.Image): Image to draw on
+            draw (PIL.ImageDraw.Draw): Draw object of image
+            xy (tuple): Top-left position, as for ImageDraw.text
+            text (str): Text as returned by the line shaper
+            fill: Text color
+            direction (str, optional): Paragraph direction ('rtl'/'ltr'), Raqm layout only
+            language (str, optional): Language tag, Raqm layout only
+        """
+        runs = self._visual_runs(text, direction)
+        if len(runs) == 1:
+            draw_text(image, draw, xy, text, runs[0][1], fill, direction=direction, language=language)
+            return
+
+        x, y = xy
+        baseline = y + self.font.getmetrics()[0]
+        for run, font, run_direction in runs:
+            draw_text(image, draw, (x, baseline), run, font, fill, anchor='ls',
+                      direction=run_direction, language=language)
+            x += font.getlength(run, direction=run_direction, language=language)
@@ -4,11 +4,21 @@ Font utilities for Dila Headless Image Editor
 """
 
 import os
+import re
+import gc
+import time
+import queue
 import requests
 import json
 import logging
+import tempfile
+import threading
 from pathlib import Path
-from PIL import ImageFont
+from PIL import ImageFont, features
+
+from app.utils.cache import LRUCache
+from app.core.font_catalog import FontCatalog
+from app.core.font_fallback import FontChain
 
 logger = logging.getLogger(__name__)
 
@@ -16,11 +26,254 @@ logger = logging.getLogger(__name__)
 FONTS_DIR = Path('./fonts')
 GOOGLE_FONTS_CACHE_DIR = FONTS_DIR / 'google_fonts'
 GOOGLE_FONTS_MAPPING_FILE = FONTS_DIR / 'google_fonts_mapping.json'
+FONT_CATALOG_FILE = FONTS_DIR / 'font_catalog.json'
 
 # Ensure directories exist
 FONTS_DIR.mkdir(exist_ok=True)
 GOOGLE_FONTS_CACHE_DIR.mkdir(exist_ok=True)
 
+# Loaded FreeTypeFont objects, keyed by (path, size, weight, style, layout engine)
+DEFAULT_FONT_CACHE_SIZE = 64
+_font_cache = LRUCache(max_entries=DEFAULT_FONT_CACHE_SIZE, name='fonts')
+
+# Fonts at the sizes tried while fitting text, kept apart so the many one-off
+# sizes do not evict the (preloaded) fonts requests are drawn with
+DEFAULT_PROBE_FONT_CACHE_SIZE = 32
+_probe_font_cache = LRUCache(max_entries=DEFAULT_PROBE_FONT_CACHE_SIZE, name='probe_fonts')
+
+# Layout engine Pillow picks when none is requested
+_DEFAULT_LAYOUT_ENGINE = ImageFont.Layout.RAQM if features.check('raqm') else ImageFont.Layout.BASIC
+
+# Google Fonts download settings
+GOOGLE_FONTS_CSS_URL = 'https://fonts.googleapis.com/css2'
+DEFAULT_FONT_DOWNLOAD_TIMEOUT = 10
+DEFAULT_FONT_NEGATIVE_CACHE_TTL = 3600
+_download_timeout = DEFAULT_FONT_DOWNLOAD_TIMEOUT
+
+# @font-face rules of the Google Fonts CSS, with the subset comment browsers get before each
+_FONT_FACE_RULE = re.compile(r'(?:/\*\s*([\w-]+)\s*\*/\s*)?@font-face\s*{[^}]*?src:\s*url\(([^)]+)\)')
+
+# Families rendered instead of a font that is not available (yet)
+_fallback_families = {
+    'default': 'Roboto',
+    'rtl': 'Noto Sans Arabic'
+}
+
+# Families (or absolute font file paths) tried, in order, for text the requested font does not cover
+_fallback_chain = ['Noto Sans Arabic', 'Noto Sans']
+
+# Minimum number of seconds between mtime checks of the font index
+DEFAULT_FONT_INDEX_CHECK_INTERVAL = 5.0
+
+class _FontIndex:
+    """
+    Resident index of font names to font file paths.
+    
+    The index is built once per process from the font mapping file and the
+    fonts directory, and rebuilt only when the mapping file or one of the
+    font directories changes mtime. The mtimes are checked at most once
+    per check_interval seconds, so lookups are plain dictionary reads.
+    
+    The index also keeps the font catalog (family names, weights and
+    coverage read from the font files) up to date.
+    """
+    
+    def __init__(self, check_interval=DEFAULT_FONT_INDEX_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self.catalog = FontCatalog(FONTS_DIR, FONT_CATALOG_FILE)
+        self._lock = threading.RLock()
+        self._paths = {}
+        self._signature = None
+        self._next_check = 0.0
+    
+    def lookup(self, font_name):
+        """Return the absolute path registered for font_name, or None"""
+        self._refresh_if_stale()
+        return self._paths.get(font_name)
+    
+    def find_variant(self, font_family, weight=400, style='normal', downloaded=True):
+        """
+        Return the absolute path of the closest catalogued variant of a family, or None
+        (only among the bundled fonts unless downloaded is True)
+        """
+        self._refresh_if_stale()
+        entry = self.catalog.find(font_family, weight, style, downloaded)
+        return os.path.abspath(FONTS_DIR / entry['file']) if entry else None
+    
+    def families(self):
+        """Return the catalogued families and their variants"""
+        self._refresh_if_stale()
+        return self.catalog.families()
+    
+    def coverage(self, font_path):
+        """Return the coverage bitmap of a font file (None if unknown)"""
+        self._refresh_if_stale()
+        return self.catalog.coverage(font_path)
+    
+    def names(self):
+        """Return all registered font names"""
+        self._refresh_if_stale()
+        return list(self._paths.keys())
+    
+    def invalidate(self):
+        """Force a rebuild on the next lookup"""
+        self._signature = None
+        self._next_check = 0.0
+    
+    def _current_signature(self):
+        signature = []
+        for path in (GOOGLE_FONTS_MAPPING_FILE, FONTS_DIR, GOOGLE_FONTS_CACHE_DIR):
+            try:
+                signature.append(path.stat().st_mtime_ns)
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+    
+    def _refresh_if_stale(self):
+        if time.monotonic() < self._next_check:
+            return
+        with self._lock:
+            if time.monotonic() < self._next_check:
+                return
+            signature = self._current_signature()
+            if signature != self._signature:
+                self._rebuild()
+                # Rebuilding may rewrite the mapping file, so take the signature afterwards
+                signature = self._current_signature()
+            self._signature = signature
+            self._next_check = time.monotonic() + self.check_interval
+    
+    def _rebuild(self):
+        paths = {}
+        for font_name, relative_path in get_font_mapping().items():
+            font_path = FONTS_DIR / relative_path
+            if font_path.exists():
+                paths[font_name] = os.path.abspath(font_path)
+        
+        # Fonts dropped into the fonts directory after the mapping was written
+        for font_file in FONTS_DIR.glob('*.ttf'):
+            paths.setdefault(font_file.stem, os.path.abspath(font_file))
+        
+        self._paths = paths
+        self.catalog.refresh(set(paths.values()))
+        logger.info(f"Built font index with {len(paths)} fonts")
+
+_font_index = _FontIndex()
+
+class _FontDownloader:
+    """
+    Background worker that fetches Google Fonts which are not available locally.
+    
+    Requests are de-duplicated while in flight, and variants that failed to
+    download are kept in a TTL-based negative cache so an unknown family does
+    not hit the network on every request.
+    """
+    
+    def __init__(self, negative_ttl=DEFAULT_FONT_NEGATIVE_CACHE_TTL):
+        self.negative_ttl = negative_ttl
+        self._failed = LRUCache(max_entries=1024, name='font_download_failures')
+        self._reset()
+    
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._thread = None
+    
+    def request(self, font_family, weight=400, style='normal'):
+        """
+        Queue a download of the font variant unless it is already queued or recently failed.
+        
+        Returns:
+            bool: True if a new download was queued
+        """
+        font_id = _google_font_id(font_family, weight, style)
+        with self._lock:
+            if font_id in self._pending or self.is_failed(font_id):
+                return False
+            self._pending.add(font_id)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='font-downloader', daemon=True)
+                self._thread.start()
+        self._queue.put((font_id, font_family, weight, style))
+        return True
+    
+    def is_failed(self, font_id):
+        """Return True if the variant failed to download within the negative cache TTL"""
+        expiry = self._failed.get(font_id)
+        return expiry is not None and time.monotonic() < expiry
+    
+    def join(self):
+        """Block until all queued downloads have finished"""
+        self._queue.join()
+    
+    def _run(self):
+        while True:
+            font_id, font_family, weight, style = self._queue.get()
+            try:
+                font_path = download_google_font(font_family, weight, style)
+                if font_path is None:
+                    logger.warning(f"Caching failed download of {font_family} for {self.negative_ttl}s")
+                    self._failed.put(font_id, time.monotonic() + self.negative_ttl)
+            finally:
+                with self._lock:
+                    self._pending.discard(font_id)
+                self._queue.task_done()
+
+_font_downloader = _FontDownloader()
+
+# The worker thread does not survive a fork, start fresh in the child
+os.register_at_fork(after_in_child=_font_downloader._reset)
+
+def configure_fonts(config):
+    """
+    Apply font settings from the application config.
+    
+    Args:
+        config (dict): Flask config (or any mapping) with font settings
+    """
+    global GOOGLE_FONTS_CSS_URL, _download_timeout
+    
+    _font_cache.resize(config.get('FONT_CACHE_SIZE', DEFAULT_FONT_CACHE_SIZE))
+    _font_index.check_interval = config.get('FONT_INDEX_CHECK_INTERVAL', DEFAULT_FONT_INDEX_CHECK_INTERVAL)
+    
+    GOOGLE_FONTS_CSS_URL = config.get('GOOGLE_FONTS_CSS_URL', GOOGLE_FONTS_CSS_URL)
+    _download_timeout = config.get('FONT_DOWNLOAD_TIMEOUT', DEFAULT_FONT_DOWNLOAD_TIMEOUT)
+    _font_downloader.negative_ttl = config.get('FONT_NEGATIVE_CACHE_TTL', DEFAULT_FONT_NEGATIVE_CACHE_TTL)
+    
+    _fallback_families['default'] = config.get('DEFAULT_FONT_FAMILY', _fallback_families['default'])
+    _fallback_families['rtl'] = config.get('RTL_FONT_FAMILY', _fallback_families['rtl'])
+    
+    # Font files given by path (e.g. system CJK fonts) are only used where they exist
+    _fallback_chain[:] = [
+        entry for entry in config.get('FONT_FALLBACK_CHAIN', _fallback_chain)
+        if not os.path.isabs(entry) or os.path.exists(entry)
+    ]
+
+def get_fallback_font_family(is_rtl=False):
+    """
+    Get the configured family used while a requested font is unavailable
+    
+    Args:
+        is_rtl (bool): Whether the text is in a right-to-left script
+        
+    Returns:
+        str: Fallback font family name
+    """
+    return _fallback_families['rtl' if is_rtl else 'default']
+
+def get_font_cache_stats(probe=False):
+    """
+    Get hit/miss/eviction statistics of the loaded font cache
+    
+    Args:
+        probe (bool): Report the cache of fonts loaded while fitting text instead
+        
+    Returns:
+        dict: Cache statistics
+    """
+    return (_probe_font_cache if probe else _font_cache).stats()
+
 def update_font_mapping():
     """
     Update the mapping of Google Font names to actual font files.
@@ -50,6 +303,7 @@ def update_font_mapping():
             json.dump(mapping, f, indent=2)
         
         logger.info(f"Updated font mapping with {len(mapping)} fonts")
+        _font_index.invalidate()
         return mapping
     except Exception as e:
         logger.error(f"Error updating font mapping: {str(e)}")
@@ -73,10 +327,38 @@ def get_font_mapping():
         logger.error(f"Error loading font mapping: {str(e)}")
         return update_font_mapping()
 
+def _google_font_id(font_family, font_weight=400, font_style='normal'):
+    """Return the cache file stem used for a Google Font variant"""
+    safe_name = font_family.replace(' ', '').lower()
+    return f"{safe_name}_{font_weight}_{font_style}"
+
+def _font_url_from_css(css):
+    """
+    Get the font file URL from Google Fonts CSS
+    
+    Args:
+        css (str): Stylesheet returned by the CSS API
+        
+    Returns:
+        str: URL of the whole font or, if the CSS is split into subsets, of
+        its latin subset (the first subset if it has none); None if the CSS
+        has no font URL
+    """
+    rules = _FONT_FACE_RULE.findall(css)
+    if not rules:
+        return None
+    for subset, url in rules:
+        if subset == 'latin':
+            return url.strip('\'" ')
+    return rules[0][1].strip('\'" ')
+
 def download_google_font(font_family, font_weight=400, font_style='normal'):
     """
     Download a Google Font and return the path to the local file.
     
+    This blocks on the network; request handlers should go through
+    get_font_path, which queues the download on the background worker.
+    
     Args:
         font_family (str): The name of the font family (e.g., 'Roboto', 'Open Sans')
         font_weight (int): The weight of the font (e.g., 400, 700)
@@ -86,11 +368,8 @@ def download_google_font(font_family, font_weight=400, font_style='normal'):
         Path: Path to the local font file or None if download failed
     """
     try:
-        # Create a sanitized filename
-        safe_name = font_family.replace(' ', '').lower()
-        
         # Create a unique identifier for this specific font variant
-        font_id = f"{safe_name}_{font_weight}_{font_style}"
+        font_id = _google_font_id(font_family, font_weight, font_style)
         filename = f"{font_id}.ttf"
         font_path = GOOGLE_FONTS_CACHE_DIR / filename
         
@@ -101,42 +380,45 @@ def download_google_font(font_family, font_weight=400, font_style='normal'):
             
         # Format the Google Fonts API URL for direct font file download
         # This uses the CSS2 API which doesn't require an API key
-        css_url = f"https://fonts.googleapis.com/css2?family={font_family.replace(' ', '+')}"
+        css_url = f"{GOOGLE_FONTS_CSS_URL}?family={font_family.replace(' ', '+')}"
         if font_weight != 400 or font_style != 'normal':
             css_url += f":wght@{font_weight}"
         if font_style == 'italic':
             css_url += f";ital,wght@1,{font_weight}"
             
-        # Add user agent to ensure we get the TTF format
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
+        # Browsers get WOFF2 files split into unicode-range subsets; other clients get
+        # the whole font as a single TTF, which covers every script the font supports
+        headers = {'User-Agent': 'dilaHeadlessImageEditor'}
         
         # Get the CSS which contains the font file URL
-        response = requests.get(css_url, headers=headers)
+        response = requests.get(css_url, headers=headers, timeout=_download_timeout)
         if response.status_code != 200:
             logger.error(f"Failed to fetch Google Font CSS: {response.status_code}")
             return None
             
         # Extract the font URL from the CSS
-        css = response.text
-        url_start = css.find("src: url(") + 9
-        url_end = css.find(")", url_start)
-        if url_start < 9 or url_end < 0:
+        font_url = _font_url_from_css(response.text)
+        if not font_url:
             logger.error(f"Could not find font URL in CSS")
             return None
-            
-        font_url = css[url_start:url_end]
         
         # Download the actual font file
-        font_response = requests.get(font_url, headers=headers)
+        font_response = requests.get(font_url, headers=headers, timeout=_download_timeout)
         if font_response.status_code != 200:
             logger.error(f"Failed to download Google Font file: {font_response.status_code}")
             return None
             
-        # Save the font file
-        with open(font_path, 'wb') as f:
-            f.write(font_response.content)
+        # Save the font file atomically through a temporary file of this process, so a
+        # half-written file is never picked up, even with several workers downloading it
+        partial_file = tempfile.NamedTemporaryFile('wb', dir=GOOGLE_FONTS_CACHE_DIR, prefix=f"{font_id}.",
+                                                   suffix='.part', delete=False)
+        try:
+            with partial_file:
+                partial_file.write(font_response.content)
+            os.replace(partial_file.name, font_path)
+        except OSError:
+            os.remove(partial_file.name)
+            raise
             
         logger.info(f"Successfully downloaded Google Font: {font_family}")
         
@@ -152,38 +434,127 @@ def get_font_path(font_family, weight=400, style='normal'):
     """
     Get the path to a font file.
     
-    This handles both local fonts and Google Fonts.
+    This handles both local fonts and Google Fonts. Families with bundled
+    font files resolve to their closest bundled weight/style variant, so the
+    result does not depend on which Google Fonts happen to be downloaded.
+    Other families use a downloaded Google Fonts variant, or the closest
+    downloaded one. Google Fonts that are not available locally are
+    downloaded in the background, so this never blocks on the network; None
+    is returned until the download completes.
     
     Args:
         font_family (str): The name of the font family
-        weight (int): The weight of the font (for Google Fonts)
-        style (str): The style of the font (for Google Fonts)
+        weight (int): The weight of the font (e.g., 400, 700)
+        style (str): The style of the font ('normal', 'italic')
         
     Returns:
-        str: Path to the font file or None if not found
-    """
-    # First check if this is a local font
-    mapping = get_font_mapping()
-    if font_family in mapping:
-        font_path = FONTS_DIR / mapping[font_family]
-        if os.path.exists(font_path):
-            return str(font_path)
-    
-    # If not found or not a local font, try with .ttf extension
-    local_path = FONTS_DIR / f"{font_family}.ttf"
-    if local_path.exists():
-        return str(local_path)
-    
-    # If not a local font, try to download from Google Fonts
-    google_font_path = download_google_font(font_family, weight, style)
-    if google_font_path:
-        return str(google_font_path)
-    
-    # Fallback to default font if nothing else works
-    logger.warning(f"Font '{font_family}' not found locally and could not be downloaded. Using fallback.")
+        str: Path to the font file or None if not (yet) available
+    """
+    # First check if this is a local font (mapped name or file stem)
+    font_path = _font_index.lookup(font_family)
+    if font_path:
+        return font_path
+    
+    # Then pick the closest weight/style variant of a family with bundled font files
+    font_path = _font_index.find_variant(font_family, weight, style, downloaded=False)
+    if font_path:
+        return font_path
+    
+    # Then check for a previously downloaded Google Font variant
+    font_path = _font_index.lookup(_google_font_id(font_family, weight, style))
+    if font_path:
+        return font_path
+    
+    # Then pick the closest downloaded variant of the family
+    font_path = _font_index.find_variant(font_family, weight, style)
+    if font_path:
+        return font_path
+    
+    # If not a local font, fetch it from Google Fonts in the background
+    if _font_downloader.request(font_family, weight, style):
+        logger.info(f"Font '{font_family}' not available locally, queued Google Fonts download")
+    else:
+        logger.debug(f"Font '{font_family}' not available locally (download pending or recently failed)")
     return None
 
-def get_font(font_family, font_size, weight=400, style='normal'):
+def load_font_file(font_path, font_size, weight=400, style='normal', layout_engine=None,
+                   probe=False):
+    """
+    Load a font file through the process-wide font cache.
+    
+    Repeat requests for the same file, size and layout engine return the
+    already parsed FreeTypeFont instead of setting up FreeType again.
+    
+    Args:
+        font_path (str): Path to the font file
+        font_size (int): Font size in pixels
+        weight (int): Font weight the path was resolved for
+        style (str): Font style the path was resolved for
+        layout_engine: ImageFont.Layout value, or None for Pillow's default
+        probe (bool): Whether the font is only measured while fitting text
+            (cached separately from the fonts text is drawn with)
+        
+    Returns:
+        PIL.ImageFont.FreeTypeFont: Loaded font object
+    """
+    if layout_engine is None:
+        layout_engine = _DEFAULT_LAYOUT_ENGINE
+    resolved_path = os.path.abspath(font_path)
+    key = (resolved_path, font_size, weight, style, layout_engine)
+    cache = _probe_font_cache if probe else _font_cache
+    return cache.get_or_create(
+        key, lambda: ImageFont.truetype(resolved_path, font_size, layout_engine=layout_engine)
+    )
+
+def get_font_coverage(font_path):
+    """
+    Get the precomputed codepoint coverage of a font file
+    
+    Args:
+        font_path (str): Absolute path of the font file
+        
+    Returns:
+        CoverageBitmap: Coverage bitmap, or None if the coverage is unknown
+    """
+    return _font_index.coverage(font_path)
+
+def get_font_chain(font, font_size, weight=400, style='normal', probe=False):
+    """
+    Build the fallback chain for a loaded font.
+    
+    The chain is the font itself followed by the configured
+    FONT_FALLBACK_CHAIN fonts at the same size, each with its coverage
+    bitmap, so glyphs the font lacks are rendered with the first fallback
+    that covers them.
+    
+    Args:
+        font (PIL.ImageFont): Primary font, as returned by get_font
+        font_size (int): Font size in pixels
+        weight (int): Font weight for the fallback fonts
+        style (str): Font style for the fallback fonts
+        probe (bool): Whether the chain is only measured while fitting text
+        
+    Returns:
+        FontChain: Primary font plus fallbacks
+    """
+    if not isinstance(font, ImageFont.FreeTypeFont):
+        return FontChain([(font, None)])
+    
+    fonts = [(font, get_font_coverage(font.path))]
+    for entry in _fallback_chain:
+        font_path = entry if os.path.isabs(entry) else get_font_path(entry, weight, style)
+        if not font_path or font_path == font.path:
+            continue
+        try:
+            fallback = load_font_file(font_path, font_size, weight, style, font.layout_engine, probe)
+        except Exception as e:
+            logger.error(f"Error loading fallback font {entry}: {str(e)}")
+            continue
+        fonts.append((fallback, get_font_coverage(font_path)))
+    return FontChain(fonts)
+
+def get_font(font_family, font_size, weight=400, style='normal', layout_engine=None,
+             fallback_family=None, probe=False):
     """
     Get a font object for the specified family and size
     
@@ -192,14 +563,20 @@ def get_font(font_family, font_size, weight=400, style='normal'):
         font_size (int): Font size in pixels
         weight (int): Font weight (e.g., 400, 700)
         style (str): Font style ('normal', 'italic')
+        layout_engine: ImageFont.Layout value, or None for Pillow's default
+        fallback_family (str, optional): Family to render with while font_family is unavailable
+        probe (bool): Whether the font is only measured while fitting text
         
     Returns:
         PIL.ImageFont: Font object or None if font could not be loaded
     """
     try:
         font_path = get_font_path(font_family, weight, style)
+        if not font_path and fallback_family and fallback_family != font_family:
+            logger.info(f"Using fallback font {fallback_family} instead of {font_family}")
+            font_path = get_font_path(fallback_family, weight, style)
         if font_path:
-            return ImageFont.truetype(font_path, font_size)
+            return load_font_file(font_path, font_size, weight, style, layout_engine, probe)
         
         # Fallback to default font
         logger.warning(f"Using default font instead of {font_family}")
@@ -208,6 +585,49 @@ def get_font(font_family, font_size, weight=400, style='normal'):
         logger.error(f"Error loading font {font_family}: {str(e)}")
         return ImageFont.load_default()
 
+def preload_fonts(font_specs, freeze=False):
+    """
+    Load fonts (and their fallback chains and coverage bitmaps) into the
+    font cache before the worker accepts traffic.
+    
+    When the app is created in the gunicorn master (--preload), the parsed
+    fonts are inherited by every forked worker and shared copy-on-write.
+    With freeze, objects allocated up to this point are then frozen out of
+    the garbage collector so collections in the workers do not touch (and
+    un-share) their pages.
+    
+    Args:
+        font_specs (list): (family, size) or (family, size, weight) tuples
+        freeze (bool): Whether worker processes will be forked from this one
+        
+    Returns:
+        int: Number of fonts loaded
+    """
+    start_time = time.perf_counter()
+    loaded = 0
+    
+    for spec in font_specs:
+        font_family, font_size = spec[0], spec[1]
+        weight = spec[2] if len(spec) > 2 else 400
+        
+        font_path = get_font_path(font_family, weight)
+        if not font_path:
+            logger.warning(f"Skipping preload of {font_family}: font is not available locally")
+            continue
+        
+        try:
+            get_font_chain(load_font_file(font_path, font_size, weight), font_size, weight)
+            loaded += 1
+        except Exception as e:
+            logger.error(f"Error preloading font {font_family}: {str(e)}")
+    
+    if freeze:
+        gc.freeze()
+    
+    elapsed = time.perf_counter() - start_time
+    logger.info(f"Preloaded {loaded}/{len(font_specs)} fonts in {elapsed * 1000:.1f} ms")
+    return loaded
+
 def get_available_fonts():
     """
     Get a list of available fonts (local and Google Fonts)
@@ -215,8 +635,16 @@ def get_available_fonts():
     Returns:
         list: Available font families
     """
-    mapping = get_font_mapping()
-    return list(mapping.keys())
+    return _font_index.names()
+
+def get_font_families():
+    """
+    Get the catalogued font families with their variants
+    
+    Returns:
+        list: Dicts with 'family' and 'variants' (file, name, subfamily, weight, width, style)
+    """
+    return _font_index.families()
 
 # Initialize the font mapping when the module is loaded
 if not GOOGLE_FONTS_MAPPING_FILE.exists():
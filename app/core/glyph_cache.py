@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Glyph run cache for Dila Headless Image Editor
+
+Caches the rasterized coverage masks of text runs, so a caption line that
+was rendered before is composited with Image.paste(color, box, mask)
+instead of being rasterized by FreeType again. Masks hold coverage only;
+the text colour is applied when pasting, so one mask serves every colour.
+"""
+
+import math
+import logging
+from PIL import Image, ImageDraw, ImageFont
+
+from app.utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GLYPH_CACHE_MAX_BYTES = 16 * 1024 * 1024
+DEFAULT_GLYPH_CACHE_SIZE = 4096
+
+# Image modes whose colours paste exactly like ImageDraw.text fills them
+_CACHED_MODES = ('RGB', 'RGBA', 'L')
+
+# FreeType positions glyphs in 1/64 pixel units, so fractional start
+# positions within the same 1/64 step rasterize identically
+_SUBPIXEL_STEPS = 64
+
+# Blank margin around a rendered run, covering ink that the fractional start
+# pushes past the box reported by getbbox
+_MARGIN = 2
+
+_EMPTY = object()
+
+def _mask_bytes(entry):
+    return entry[0].width * entry[0].height if entry is not _EMPTY else 0
+
+_glyph_cache = LRUCache(DEFAULT_GLYPH_CACHE_SIZE, 'glyph_runs',
+                        max_bytes=DEFAULT_GLYPH_CACHE_MAX_BYTES, sizeof=_mask_bytes)
+
+def configure_glyph_cache(max_bytes=DEFAULT_GLYPH_CACHE_MAX_BYTES, max_entries=DEFAULT_GLYPH_CACHE_SIZE):
+    """
+    Set the memory budget of the glyph run cache
+
+    Args:
+        max_bytes (int): Maximum total size of the cached masks in bytes
+        max_entries (int): Maximum number of cached masks
+    """
+    _glyph_cache.resize(max_entries, max_bytes)
+
+def get_glyph_cache_stats():
+    """
+    Get hit/miss/eviction statistics and memory use of the glyph run cache
+
+    Returns:
+        dict: Cache statistics
+    """
+    return _glyph_cache.stats()
+
+def _render_mask(text, font, anchor, fontmode, start, direction, language):
+    """
+    Rasterize text into a cropped coverage mask
+
+    Returns:
+        tuple: (mask, dx, dy) with the mask's offset from the integer draw position,
+        or _EMPTY if the text has no ink (e.g. only spaces)
+    """
+    left, top, right, bottom = font.getbbox(text, direction=direction, language=language, anchor=anchor)
+    # Integer origin inside the mask that keeps all ink at non-negative coordinates
+    origin_x = max(0, _MARGIN - left)
+    origin_y = max(0, _MARGIN - top)
+    mask = Image.new('L', (origin_x + right + _MARGIN, origin_y + bottom + _MARGIN), 0)
+    mask_draw = ImageDraw.Draw(mask)
+    mask_draw.fontmode = fontmode
+    mask_draw.text((origin_x + start[0], origin_y + start[1]), text, font=font, fill=255, anchor=anchor,
+                   direction=direction, language=language)
+
+    box = mask.getbbox()
+    if box is None:
+        return _EMPTY
+    return mask.crop(box), box[0] - origin_x, box[1] - origin_y
+
+def draw_text(image, draw, xy, text, font, fill, anchor=None, direction=None, language=None):
+    """
+    Draw text like ImageDraw.text, reusing the cached mask of the same run.
+
+    The result is pixel-identical to draw.text(xy, text, font=font, fill=fill,
+    anchor=anchor, direction=direction, language=language). Bitmap fonts,
+    negative positions and image modes whose fills are not plain colours
+    (e.g. palette images) are drawn uncached.
+
+    Args:
+        image (PIL.Image): Image that draw draws on
+        draw (PIL.ImageDraw.Draw): Draw object of image
+        xy (tuple): Position, as for ImageDraw.text
+        text (str): Text in display order
+        font (PIL.ImageFont.FreeTypeFont): Font
+        fill: Text color
+        anchor (str, optional): Text anchor, as for ImageDraw.text
+        direction (str, optional): Text direction (Raqm layout only)
+        language (str, optional): Language tag (Raqm layout only)
+    """
+    x, y = xy
+    if (not isinstance(font, ImageFont.FreeTypeFont) or image.mode not in _CACHED_MODES
+            or x < 0 or y < 0):
+        draw.text(xy, text, font=font, fill=fill, anchor=anchor, direction=direction, language=language)
+        return
+
+    # Same split into integer position and fractional start as ImageDraw.text
+    start_x, start_y = math.modf(x)[0], math.modf(y)[0]
+    step_x = int(start_x * _SUBPIXEL_STEPS)
+    step_y = int(start_y * _SUBPIXEL_STEPS)
+    key = (text, font.path, font.size, font.index, font.layout_engine, anchor, direction, language,
+           draw.fontmode, step_x, step_y)
+    entry = _glyph_cache.get_or_create(
+        key,
+        lambda: _render_mask(text, font, anchor, draw.fontmode, (start_x, start_y), direction, language)
+    )
+    if entry is _EMPTY:
+        return
+
+    mask, dx, dy = entry
+    image.paste(fill, (int(x) + dx, int(y) + dy), mask)
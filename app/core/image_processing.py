@@ -6,22 +6,66 @@ Image processing functionality for Dila Headless Image Editor
 import os
 import math
 import logging
-from PIL import Image, ImageDraw, ImageColor
-import arabic_reshaper
-from bidi.algorithm import get_display
-
-from app.core.font_utils import get_font
+from PIL import Image, ImageChops, ImageDraw, ImageColor
+from app.core.glyph_cache import configure_glyph_cache, DEFAULT_GLYPH_CACHE_MAX_BYTES
+from app.core.font_utils import get_font, get_font_chain, get_fallback_font_family
+from app.core.text_shaping import LineShaper, configure_shaping_cache, DEFAULT_SHAPING_CACHE_SIZE
+from app.core.text_layout import (
+    LINE_SPACING, TextLayout, TextMeasurer, fit_text, has_overlong_words, text_block_height, wrap_text
+)
+from app.utils.cache import LRUCache
 
 logger = logging.getLogger(__name__)
 
-def crop_to_fit(img, target_width, target_height):
+# Large JPEGs are decoded at a reduced scale when the crop keeps at least this
+# many pixels per output pixel, leaving the final LANCZOS resize room to filter
+DEFAULT_DRAFT_OVERSAMPLING = 1.5
+
+# Large downscales first reduce() by an integer factor, leaving at least this ratio
+# for the LANCZOS pass (Pillow's reducing_gap; 3 is indistinguishable from a full LANCZOS)
+DEFAULT_REDUCING_GAP = 3.0
+
+# crop_to_fit options and encoder options (Image.save) of each quality tier. The
+# balanced tier is the default; its draft and reducing_gap settings come from the config.
+QUALITY_TIERS = {
+    'fast': {
+        'resize': {'resample': Image.BILINEAR, 'reducing_gap': 2.0, 'draft_oversampling': 1.0},
+        'save': {'compress_level': 1}
+    },
+    'balanced': {
+        'resize': {'resample': Image.LANCZOS, 'reducing_gap': DEFAULT_REDUCING_GAP,
+                   'draft_oversampling': DEFAULT_DRAFT_OVERSAMPLING},
+        'save': {}
+    },
+    'best': {
+        'resize': {'resample': Image.LANCZOS, 'reducing_gap': None, 'draft_oversampling': None},
+        'save': {'optimize': True}
+    }
+}
+
+DEFAULT_QUALITY = 'balanced'
+
+def crop_to_fit(img, target_width, target_height, draft_oversampling=DEFAULT_DRAFT_OVERSAMPLING,
+                reducing_gap=DEFAULT_REDUCING_GAP, resample=Image.LANCZOS):
     """
     Crop and resize an image to fit the target dimensions
     
+    The crop and the resize are a single resize of the crop box, so no cropped
+    copy is made, and large downscales start with a cheap integer reduce().
+    A JPEG that has not been loaded yet is decoded at 1/2, 1/4 or 1/8 scale
+    (libjpeg DCT scaling) if the cropped area still has draft_oversampling
+    times the target resolution, which divides decode time and memory for
+    large photos.
+    
     Args:
         img (PIL.Image): The source image
         target_width (int): Target width in pixels
         target_height (int): Target height in pixels
+        draft_oversampling (float, optional): Minimum ratio between the decoded crop
+            and the target size for reduced JPEG decoding (None to always decode fully)
+        reducing_gap (float, optional): Minimum ratio left for the resampling pass after
+            the integer reduce() (None to resample the whole way)
+        resample (int): Resampling filter (see QUALITY_TIERS for the presets)
         
     Returns:
         PIL.Image: Resized and cropped image
@@ -32,6 +76,23 @@ def crop_to_fit(img, target_width, target_height):
     src_width, src_height = img.size
     logger.debug(f"Source image dimensions: {src_width}x{src_height}")
     
+    crop_box = _crop_box(src_width, src_height, target_width, target_height)
+    
+    scale = 1
+    if draft_oversampling:
+        scale = _draft_jpeg(img, crop_box, target_width, target_height, draft_oversampling)
+    
+    # Resize the crop box directly (fractional once scaled, so the framing is the
+    # same at any decoding scale)
+    final_width, final_height = int(target_width), int(target_height)
+    logger.debug(f"Resizing cropped image to: {final_width}x{final_height}")
+    return img.resize(
+        (final_width, final_height), resample,
+        box=tuple(c / scale for c in crop_box), reducing_gap=reducing_gap or None
+    )
+
+def _crop_box(src_width, src_height, target_width, target_height):
+    """Get the centered box of the source with the target aspect ratio"""
     src_aspect = src_width / src_height
     target_aspect = target_width / target_height
     
@@ -40,18 +101,103 @@ def crop_to_fit(img, target_width, target_height):
         new_width = int(target_aspect * src_height)
         offset = (src_width - new_width) // 2
         logger.debug(f"Horizontal crop chosen. new_width={new_width}, offset={offset}")
-        cropped = img.crop((offset, 0, offset + new_width, src_height))
-    else:
-        # Source image is taller than target aspect ratio
-        new_height = int(src_width / target_aspect)
-        offset = (src_height - new_height) // 2
-        logger.debug(f"Vertical crop chosen. new_height={new_height}, offset={offset}")
-        cropped = img.crop((0, offset, src_width, offset + new_height))
+        return (offset, 0, offset + new_width, src_height)
     
-    # Resize to target dimensions
-    final_width, final_height = int(target_width), int(target_height)
-    logger.debug(f"Resizing cropped image to: {final_width}x{final_height}")
-    return cropped.resize((final_width, final_height), Image.LANCZOS)
+    # Source image is taller than target aspect ratio
+    new_height = int(src_width / target_aspect)
+    offset = (src_height - new_height) // 2
+    logger.debug(f"Vertical crop chosen. new_height={new_height}, offset={offset}")
+    return (0, offset, src_width, offset + new_height)
+
+def _draft_request_size(img_size, crop_box, target_width, target_height, oversampling):
+    """
+    Get the size to request from Image.draft so that crop_box keeps oversampling
+    times the target size, or None if no reduced scale could be used
+    """
+    crop_width = crop_box[2] - crop_box[0]
+    crop_height = crop_box[3] - crop_box[1]
+    requested_size = (
+        max(1, math.ceil(img_size[0] * target_width * oversampling / crop_width)),
+        max(1, math.ceil(img_size[1] * target_height * oversampling / crop_height))
+    )
+    if requested_size[0] >= img_size[0] and requested_size[1] >= img_size[1]:
+        return None
+    return requested_size
+
+def _draft_jpeg(img, crop_box, target_width, target_height, oversampling):
+    """
+    Configure a JPEG that has not been loaded yet to decode at the smallest
+    DCT scale that keeps crop_box at oversampling times the target size
+    
+    Returns:
+        float: Factor by which the decoded image is smaller than img.size was
+        (1 for other formats, loaded images or crops without enough resolution)
+    """
+    requested_size = _draft_request_size(img.size, crop_box, target_width, target_height, oversampling)
+    if requested_size is None:
+        return 1
+    
+    original_width = img.width
+    result = img.draft(img.mode, requested_size)
+    if result is None:
+        return 1
+    
+    scale = original_width / result[1][2]
+    if scale > 1:
+        logger.debug(f"Decoding JPEG at 1/{scale:g} scale: {img.width}x{img.height}")
+    return scale
+
+def _bytes_per_pixel(mode):
+    """Bytes per pixel Pillow allocates for an image mode (3-band modes are padded to 4)"""
+    if mode in ('1', 'L', 'P'):
+        return 1
+    if mode.startswith('I;16'):
+        return 2
+    return 4
+
+def probe_image(img, target_width=None, target_height=None, draft_oversampling=DEFAULT_DRAFT_OVERSAMPLING):
+    """
+    Describe an opened image from its header, without decoding any pixels
+    
+    Image.open only parses the header, so this is cheap and safe for any
+    size. The decoded size takes into account the reduced JPEG decoding
+    crop_to_fit does when resizing to the target size with the same
+    draft_oversampling, so it can be checked against a memory budget
+    before the image is loaded.
+    
+    Args:
+        img (PIL.Image): Image returned by Image.open (not loaded)
+        target_width (int, optional): Width the image will be cropped/resized to
+        target_height (int, optional): Height the image will be cropped/resized to
+        draft_oversampling (float, optional): Value that will be passed to crop_to_fit
+        
+    Returns:
+        dict: format, mime_type, width, height, mode, pixels and decoded_bytes (estimated
+        size of the decoded pixel buffer)
+    """
+    width, height = img.size
+    decoded_width, decoded_height = width, height
+    
+    resized = target_width and target_height and (target_width, target_height) != img.size
+    if resized and draft_oversampling and img.format == 'JPEG':
+        crop_box = _crop_box(width, height, target_width, target_height)
+        requested_size = _draft_request_size(img.size, crop_box, target_width, target_height, draft_oversampling)
+        if requested_size is not None:
+            # Same choice as JpegImageFile.draft: the largest 1/8, 1/4 or 1/2 scale that
+            # still gives at least the requested size
+            limit = min(width // requested_size[0], height // requested_size[1])
+            scale = next(s for s in (8, 4, 2, 1) if limit >= s)
+            decoded_width, decoded_height = -(-width // scale), -(-height // scale)
+    
+    return {
+        'format': img.format,
+        'mime_type': img.get_format_mimetype(),
+        'width': width,
+        'height': height,
+        'mode': img.mode,
+        'pixels': width * height,
+        'decoded_bytes': decoded_width * decoded_height * _bytes_per_pixel(img.mode)
+    }
 
 def _process_padding(padding):
     """
@@ -79,6 +225,8 @@ def _process_padding(padding):
             'left': padding_value
         }
 
+GRADIENT_DIRECTIONS = ('vertical', 'horizontal', 'diagonal', 'radial')
+
 def create_gradient_background(width, height, colors, direction="vertical"):
     """
     Create a gradient background image
@@ -86,162 +234,394 @@ def create_gradient_background(width, height, colors, direction="vertical"):
     Args:
         width (int): Width of the background
         height (int): Height of the background
-        colors (list): List of RGB or RGBA color tuples
-        direction (str): Gradient direction ('vertical', 'horizontal', 'diagonal')
+        colors (list): Color stops, see parse_gradient_stops
+        direction: Gradient direction ('vertical', 'horizontal', 'diagonal', 'radial'),
+            or the angle of a linear gradient in degrees as in CSS (0 = to top, 90 = to right)
         
     Returns:
         PIL.Image: Gradient background image
     """
     if not colors or len(colors) < 2:
         logger.warning("Not enough colors provided for gradient, falling back to single color")
-        bg = Image.new('RGBA', (width, height), colors[0] if colors else (0, 0, 0, 255))
+        stops = parse_gradient_stops(colors) if colors else [(0.0, (0, 0, 0, 255))]
+        bg = Image.new('RGBA', (width, height), stops[0][1])
         return bg
     
-    # Create a blank RGBA image
-    gradient = Image.new('RGBA', (width, height), (0, 0, 0, 0))
-    draw = ImageDraw.Draw(gradient)
+    return _render_gradient(width, height, parse_gradient_stops(colors), direction)
+
+def _render_gradient(width, height, stops, direction):
+    """Render a gradient from parsed stops, see create_gradient_background"""
+    if direction == "radial":
+        return _radial_gradient(width, height, stops)
+    if direction == "vertical":
+        return _linear_gradient(width, height, stops, 0, 1)
+    if direction == "horizontal":
+        return _linear_gradient(width, height, stops, 1, 0)
+    if direction == "diagonal":
+        # The color depends on x + y, so lines at 45 degrees share a color whatever the aspect ratio
+        return _linear_gradient(width, height, stops, 1, 1)
+    
+    angle = math.radians(float(direction))
+    return _linear_gradient(width, height, stops, math.sin(angle), -math.cos(angle))
+
+def parse_gradient_stops(colors):
+    """
+    Parse gradient color stops
     
-    # Convert hex colors to RGBA if needed
+    A stop is a color (hex string, color name or RGB(A) tuple) or a dict with
+    'color' and an optional 'position' from 0 to 1. As in CSS, the first and
+    last stops default to 0 and 1, other missing positions are spread evenly
+    between their neighbours, and a position before an earlier stop's is
+    moved up to it (giving a hard color change).
+    
+    Args:
+        colors (list): Color stops
+        
+    Returns:
+        list: (position, (r, g, b, a)) pairs in order
+        
+    Raises:
+        ValueError: If a color or position is invalid
+    """
+    positions = []
     rgba_colors = []
-    for color in colors:
-        if isinstance(color, str) and color.startswith('#'):
-            if len(color) == 7:  # #RRGGBB
-                r = int(color[1:3], 16)
-                g = int(color[3:5], 16)
-                b = int(color[5:7], 16)
-                rgba_colors.append((r, g, b, 255))
-            elif len(color) == 9:  # #RRGGBBAA
-                r = int(color[1:3], 16)
-                g = int(color[3:5], 16)
-                b = int(color[5:7], 16)
-                a = int(color[7:9], 16)
-                rgba_colors.append((r, g, b, a))
+    for stop in colors:
+        if isinstance(stop, dict):
+            color, position = stop.get('color'), stop.get('position')
+        else:
+            color, position = stop, None
+        
+        # Convert hex colors to RGBA if needed
+        if isinstance(color, str):
+            rgba_colors.append(ImageColor.getcolor(color, 'RGBA'))
         else:
-            rgba_colors.append(color)
+            color = tuple(int(channel) for channel in color)
+            if len(color) not in (3, 4):
+                raise ValueError(f"Gradient color must have 3 or 4 channels: {color}")
+            rgba_colors.append(color if len(color) == 4 else color + (255,))
+        
+        if position is not None:
+            position = float(position)
+            if not 0 <= position <= 1:
+                raise ValueError(f"Gradient stop position must be between 0 and 1: {position}")
+        positions.append(position)
     
-    # Ensure we have at least 2 colors
-    if len(rgba_colors) < 2:
-        rgba_colors.append(rgba_colors[0])
+    if positions[0] is None:
+        positions[0] = 0.0
+    if positions[-1] is None:
+        positions[-1] = 1.0
     
-    # Draw the gradient
-    if direction == "vertical":
-        for y in range(height):
-            # Calculate the color at this position
-            r = int(rgba_colors[0][0] + (rgba_colors[1][0] - rgba_colors[0][0]) * y / height)
-            g = int(rgba_colors[0][1] + (rgba_colors[1][1] - rgba_colors[0][1]) * y / height)
-            b = int(rgba_colors[0][2] + (rgba_colors[1][2] - rgba_colors[0][2]) * y / height)
-            a = int(rgba_colors[0][3] + (rgba_colors[1][3] - rgba_colors[0][3]) * y / height)
-            
-            color = (r, g, b, a)
-            draw.line([(0, y), (width, y)], fill=color)
-    
-    elif direction == "horizontal":
-        for x in range(width):
-            # Calculate the color at this position
-            r = int(rgba_colors[0][0] + (rgba_colors[1][0] - rgba_colors[0][0]) * x / width)
-            g = int(rgba_colors[0][1] + (rgba_colors[1][1] - rgba_colors[0][1]) * x / width)
-            b = int(rgba_colors[0][2] + (rgba_colors[1][2] - rgba_colors[0][2]) * x / width)
-            a = int(rgba_colors[0][3] + (rgba_colors[1][3] - rgba_colors[0][3]) * x / width)
-            
-            color = (r, g, b, a)
-            draw.line([(x, 0), (x, height)], fill=color)
-    
-    else:  # diagonal
-        for i in range(width + height):
-            # Calculate the color at this position
-            progress = i / (width + height)
-            r = int(rgba_colors[0][0] + (rgba_colors[1][0] - rgba_colors[0][0]) * progress)
-            g = int(rgba_colors[0][1] + (rgba_colors[1][1] - rgba_colors[0][1]) * progress)
-            b = int(rgba_colors[0][2] + (rgba_colors[1][2] - rgba_colors[0][2]) * progress)
-            a = int(rgba_colors[0][3] + (rgba_colors[1][3] - rgba_colors[0][3]) * progress)
-            
-            color = (r, g, b, a)
-            draw.line([(0, i), (i, 0)], fill=color)
-    
-    return gradient
-
-def draw_rounded_rectangle(draw, xy, corner_radius, fill=None, outline=None):
-    """
-    Draw a rounded rectangle
+    # Stops never go backwards
+    furthest = 0.0
+    for index, position in enumerate(positions):
+        if position is not None:
+            furthest = positions[index] = max(position, furthest)
+    
+    # Spread missing positions evenly between the known ones around them
+    index = 1
+    while index < len(positions):
+        if positions[index] is None:
+            end = index
+            while positions[end] is None:
+                end += 1
+            first, last = positions[index - 1], positions[end]
+            for missing in range(index, end):
+                positions[missing] = first + (last - first) * (missing - index + 1) / (end - index + 1)
+            index = end
+        index += 1
+    
+    return list(zip(positions, rgba_colors))
+
+# 256x256 ramp from 0 (top) to 255 (bottom)
+_LINEAR_RAMP = Image.linear_gradient('L')
+
+# 256x256 distance from the centre, 0 in the middle to 255 in the corners
+_RADIAL_RAMP = Image.radial_gradient('L')
+
+def _gradient_strip(length, stops):
+    """
+    Get a length x 1 RGBA strip of a gradient, colored position x / length at x
+    
+    Each segment between two stops is blended from its start to its end
+    color with a ramp sampled from Image.linear_gradient as the blend mask,
+    so no Python code runs per pixel, row or column.
     
     Args:
-        draw (PIL.ImageDraw.Draw): Draw object
+        length (int): Length of the strip in pixels
+        stops (list): (position, color) pairs from parse_gradient_stops
+        
+    Returns:
+        PIL.Image: The strip
+    """
+    strip = Image.new('RGBA', (length, 1), stops[0][1])
+    for (start_position, start_color), (end_position, end_color) in zip(stops, stops[1:]):
+        start_x = int(round(start_position * length))
+        end_x = int(round(end_position * length))
+        if end_x <= start_x:
+            continue
+        # Row x * 255 / length of the ramp (rounded) at x, so the segment starts at exactly its start color
+        step = 255 / (end_x - start_x)
+        ramp = _LINEAR_RAMP.transform(
+            (end_x - start_x, 1), Image.AFFINE, (0, 0, 0, step, 0, 0.5 - step / 2), Image.NEAREST
+        )
+        start = Image.new('RGBA', ramp.size, start_color)
+        end = Image.new('RGBA', ramp.size, end_color)
+        strip.paste(Image.composite(end, start, ramp), (start_x, 0))
+    
+    last_x = int(round(stops[-1][0] * length))
+    if last_x < length:
+        strip.paste(stops[-1][1], (last_x, 0, length, 1))
+    return strip
+
+def _linear_gradient(width, height, stops, dx, dy):
+    """
+    Render a linear gradient along the direction (dx, dy)
+    
+    As in CSS, the gradient runs between the projections of the corners onto
+    the direction. The color of a pixel only depends on the projection of its
+    centre, so the image is a single affine sampling of a gradient strip.
+    """
+    corners = [dx * x + dy * y for x in (0, width) for y in (0, height)]
+    start, end = min(corners), max(corners)
+    length = max(1, int(math.ceil(end - start)))
+    scale = length / max(end - start, 1e-9)
+    
+    # One pixel of padding at either end for samples that round just outside the strip
+    strip = Image.new('RGBA', (length + 2, 1), stops[-1][1])
+    strip.paste(stops[0][1], (0, 0, 1, 1))
+    strip.paste(_gradient_strip(length, stops), (1, 0))
+    
+    return strip.transform(
+        (width, height), Image.AFFINE,
+        (dx * scale, dy * scale, 1 - start * scale, 0, 0, 0), Image.NEAREST
+    )
+
+def _radial_gradient(width, height, stops):
+    """
+    Render a radial gradient from the centre to the corners
+    
+    The gradient is an ellipse with the aspect ratio of the image that
+    reaches the last stop in the corners (CSS 'farthest-corner'). Distances
+    are resampled from Image.radial_gradient and colored through a 256-color
+    palette, so cost does not depend on the number of stops.
+    """
+    positions = _RADIAL_RAMP.resize((width, height), Image.BILINEAR, box=(1, 1, 256, 256))
+    positions.putpalette(_gradient_strip(256, stops).tobytes(), 'RGBA')
+    return positions.convert('RGBA')
+
+DEFAULT_BACKGROUND_CACHE_MAX_BYTES = 8 * 1024 * 1024
+DEFAULT_BACKGROUND_CACHE_SIZE = 256
+
+def _image_bytes(entry):
+    images = entry if isinstance(entry, tuple) else (entry,)
+    return sum(img.width * img.height * len(img.getbands()) for img in images)
+
+# Gradient tiles and rounded-corner masks of recently drawn containers. Entries
+# are shared between requests, so they are never modified after being cached.
+_background_cache = LRUCache(DEFAULT_BACKGROUND_CACHE_SIZE, 'backgrounds',
+                             max_bytes=DEFAULT_BACKGROUND_CACHE_MAX_BYTES, sizeof=_image_bytes)
+
+def get_background_cache_stats():
+    """
+    Get hit/miss/eviction statistics and memory use of the container background cache
+    
+    Returns:
+        dict: Cache statistics
+    """
+    return _background_cache.stats()
+
+# Corners are rendered at this scale and averaged down for anti-aliasing
+_CORNER_SUPERSAMPLING = 4
+
+def _corner_masks(corner_radius):
+    """
+    Get anti-aliased coverage masks of the four corners of a rounded rectangle, cached
+    
+    Only the radius x radius corner quadrant is supersampled, so the cost
+    does not depend on the size of the rectangle.
+    
+    Returns:
+        tuple: Top-left, top-right, bottom-left and bottom-right L masks (shared, do not modify)
+    """
+    def build():
+        size = corner_radius * _CORNER_SUPERSAMPLING
+        quadrant = Image.new('L', (size, size), 0)
+        ImageDraw.Draw(quadrant).ellipse((0, 0, 2 * size - 1, 2 * size - 1), fill=255)
+        top_left = quadrant.reduce(_CORNER_SUPERSAMPLING)
+        return (
+            top_left,
+            top_left.transpose(Image.Transpose.FLIP_LEFT_RIGHT),
+            top_left.transpose(Image.Transpose.FLIP_TOP_BOTTOM),
+            top_left.transpose(Image.Transpose.ROTATE_180)
+        )
+    
+    return _background_cache.get_or_create(('corners', corner_radius), build)
+
+def fill_rounded_rectangle(img, xy, corner_radius, fill):
+    """
+    Fill a rounded rectangle with anti-aliased corners
+    
+    The straight parts are plain rectangles and the corners are pasted
+    through cached supersampled masks, so it costs about as much as drawing
+    pie slices for them. Like ImageDraw, fractional coordinates are
+    truncated and the rectangle includes x1 and y1. The radius is limited
+    to half the width and height.
+    
+    Args:
+        img (PIL.Image): Image to draw on
         xy (tuple): Position (x0, y0, x1, y1)
         corner_radius (int): Radius of the corners
         fill: Fill color
-        outline: Outline color
     """
-    x0, y0, x1, y1 = xy
-    
+    x0, y0, x1, y1 = (int(c) for c in xy)
+    draw = ImageDraw.Draw(img)
+    corner_radius = min(int(corner_radius), (x1 - x0 + 1) // 2, (y1 - y0 + 1) // 2)
     if corner_radius <= 0:
-        draw.rectangle(xy, fill=fill, outline=outline)
+        draw.rectangle((x0, y0, x1, y1), fill=fill)
         return
     
-    # Draw the main rectangle
-    draw.rectangle((x0, y0 + corner_radius, x1, y1 - corner_radius), fill=fill, outline=None)
-    draw.rectangle((x0 + corner_radius, y0, x1 - corner_radius, y1), fill=fill, outline=None)
-    
-    # Draw the four corners
-    draw.pieslice((x0, y0, x0 + corner_radius * 2, y0 + corner_radius * 2), 180, 270, fill=fill, outline=None)
-    draw.pieslice((x1 - corner_radius * 2, y0, x1, y0 + corner_radius * 2), 270, 360, fill=fill, outline=None)
-    draw.pieslice((x0, y1 - corner_radius * 2, x0 + corner_radius * 2, y1), 90, 180, fill=fill, outline=None)
-    draw.pieslice((x1 - corner_radius * 2, y1 - corner_radius * 2, x1, y1), 0, 90, fill=fill, outline=None)
-    
-    # Draw outline if specified
-    if outline:
-        draw.arc((x0, y0, x0 + corner_radius * 2, y0 + corner_radius * 2), 180, 270, fill=outline)
-        draw.arc((x1 - corner_radius * 2, y0, x1, y0 + corner_radius * 2), 270, 360, fill=outline)
-        draw.arc((x0, y1 - corner_radius * 2, x0 + corner_radius * 2, y1), 90, 180, fill=outline)
-        draw.arc((x1 - corner_radius * 2, y1 - corner_radius * 2, x1, y1), 0, 90, fill=outline)
-        draw.line((x0, y0 + corner_radius, x0, y1 - corner_radius), fill=outline)
-        draw.line((x1, y0 + corner_radius, x1, y1 - corner_radius), fill=outline)
-        draw.line((x0 + corner_radius, y0, x1 - corner_radius, y0), fill=outline)
-        draw.line((x0 + corner_radius, y1, x1 - corner_radius, y1), fill=outline)
+    # Middle band at full width, then the parts of the top and bottom bands between the corners
+    r = corner_radius
+    if y1 - r >= y0 + r:
+        draw.rectangle((x0, y0 + r, x1, y1 - r), fill=fill)
+    if x1 - r >= x0 + r:
+        draw.rectangle((x0 + r, y0, x1 - r, y0 + r - 1), fill=fill)
+        draw.rectangle((x0 + r, y1 - r + 1, x1 - r, y1), fill=fill)
+    
+    top_left, top_right, bottom_left, bottom_right = _corner_masks(r)
+    img.paste(fill, (x0, y0), top_left)
+    img.paste(fill, (x1 - r + 1, y0), top_right)
+    img.paste(fill, (x0, y1 - r + 1), bottom_left)
+    img.paste(fill, (x1 - r + 1, y1 - r + 1), bottom_right)
 
-def apply_custom_text(img, text, language, font_family, font_size, text_color, bg_color,
-                     text_position=None, alignment='bottom-center', padding=20, 
-                     bg_curve=0, container_margin=0, container_width_percent=90,
-                     gradient_colors=None, gradient_direction="vertical"):
+def _rounded_mask(size, box, corner_radius):
     """
-    Apply text overlay with custom styling to an image
+    Get an L mask of a rounded rectangle (255 inside, anti-aliased corners), cached
+    
+    The mask is shared and must not be modified.
     
     Args:
-        img (PIL.Image): The source image
+        size (tuple): (width, height) of the mask
+        box (tuple): Rectangle (x0, y0, x1, y1) within the mask, may be fractional
+        corner_radius (int): Radius of the corners
+    """
+    def build():
+        mask = Image.new('L', size, 0)
+        fill_rounded_rectangle(mask, box, corner_radius, 255)
+        return mask
+    
+    return _background_cache.get_or_create(('mask', size, box, corner_radius), build)
+
+def _gradient_tile(width, height, colors, direction, corner_radius=0):
+    """
+    Get a gradient background with rounded corners cut out of its alpha, cached
+    
+    The tile is shared and must not be modified.
+    
+    Args:
+        width (int): Width of the background
+        height (int): Height of the background
+        colors (list): Color stops, see parse_gradient_stops
+        direction: Gradient direction, see create_gradient_background
+        corner_radius (int): Radius of the corners (0 for square corners)
+    """
+    stops = tuple(parse_gradient_stops(colors))
+    if direction not in GRADIENT_DIRECTIONS:
+        direction = float(direction)
+    
+    def build():
+        if corner_radius <= 0:
+            return _render_gradient(width, height, stops, direction)
+        tile = _gradient_tile(width, height, colors, direction).copy()
+        mask = _rounded_mask(tile.size, (0, 0, width - 1, height - 1), corner_radius)
+        tile.putalpha(ImageChops.multiply(tile.getchannel('A'), mask))
+        return tile
+    
+    key = ('gradient', width, height, stops, direction, corner_radius)
+    return _background_cache.get_or_create(key, build)
+
+RTL_LANGUAGES = ['ar', 'arabic', 'ckb', 'kurdish', 'he', 'hebrew', 'ur', 'urdu']
+
+DEFAULT_LAYOUT_CACHE_SIZE = 512
+
+# Layouts of recently rendered captions, keyed by text, font and container geometry
+_layout_cache = LRUCache(DEFAULT_LAYOUT_CACHE_SIZE, 'layouts')
+
+def configure_image_processing(config):
+    """
+    Apply image processing settings (cache sizes, balanced quality tier) from the application config.
+    
+    Args:
+        config (dict): Flask config (or any mapping) with image processing settings
+        
+    Raises:
+        ValueError: If DEFAULT_QUALITY is not one of the quality tiers
+    """
+    default_quality = config.get('DEFAULT_QUALITY', DEFAULT_QUALITY)
+    if default_quality not in QUALITY_TIERS:
+        raise ValueError(f"Invalid DEFAULT_QUALITY '{default_quality}'. Must be one of: {', '.join(QUALITY_TIERS)}")
+    
+    _layout_cache.resize(config.get('LAYOUT_CACHE_SIZE', DEFAULT_LAYOUT_CACHE_SIZE))
+    configure_glyph_cache(config.get('GLYPH_CACHE_MAX_BYTES', DEFAULT_GLYPH_CACHE_MAX_BYTES))
+    configure_shaping_cache(config.get('SHAPING_CACHE_SIZE', DEFAULT_SHAPING_CACHE_SIZE))
+    _background_cache.resize(
+        config.get('BACKGROUND_CACHE_SIZE', DEFAULT_BACKGROUND_CACHE_SIZE),
+        config.get('BACKGROUND_CACHE_MAX_BYTES', DEFAULT_BACKGROUND_CACHE_MAX_BYTES)
+    )
+    QUALITY_TIERS['balanced']['resize'].update(
+        draft_oversampling=config.get('JPEG_DRAFT_OVERSAMPLING', DEFAULT_DRAFT_OVERSAMPLING),
+        reducing_gap=config.get('RESIZE_REDUCING_GAP', DEFAULT_REDUCING_GAP)
+    )
+
+def get_layout_cache_stats():
+    """
+    Get hit/miss/eviction statistics of the text layout cache
+    
+    Returns:
+        dict: Cache statistics
+    """
+    return _layout_cache.stats()
+
+def layout_custom_text(img_size, text, language, font_family, font_size, alignment='bottom-center',
+                       padding=20, container_margin=0, container_width_percent=90,
+                       font_weight=400, font_style='normal', fit=None, max_height=None,
+                       min_font_size=12, max_font_size=200):
+    """
+    Lay out a text overlay: wrap the text and measure the lines and container.
+    
+    Layouts only depend on the text, font and container geometry, so they
+    are cached; recurring captions skip wrapping and measurement entirely.
+    
+    Args:
+        img_size (tuple): (width, height) of the image the text is drawn on
         text (str): Text content to overlay
         language (str): Language code
         font_family (str): Font family name
         font_size (int): Font size in pixels
-        text_color (tuple): RGB(A) tuple for text color
-        bg_color (tuple): RGB(A) tuple for background color
-        text_position (dict, optional): Manual position for text
         alignment (str): Alignment position (e.g. 'bottom-center')
         padding (int or dict): Padding values
-        bg_curve (int): Corner radius for text background
         container_margin (int): Margin for text container
         container_width_percent (int): Width of text container as percentage of image width
-        gradient_colors (list, optional): List of colors for gradient background
-        gradient_direction (str): Direction of gradient
+        font_weight (int): Font weight (e.g., 400, 700)
+        font_style (str): Font style ('normal', 'italic')
+        fit (str, optional): 'shrink' or 'fill', see apply_custom_text
+        max_height (int, optional): Maximum container height when fitting
+        min_font_size (int): Smallest font size when fitting
+        max_font_size (int): Largest font size when fitting with 'fill'
         
     Returns:
-        PIL.Image: Image with text overlay applied
+        TextLayout: The (shared, read-only) layout
     """
-    logger.info(f"Applying text overlay: '{text[:30]}...' in {language}")
-    logger.debug(f"Parameters: font={font_family}, size={font_size}, alignment={alignment}, "
-                f"container_margin={container_margin}, container_width_percent={container_width_percent}")
-    
-    # Create a copy of the image to avoid modifying the original
-    result_img = img.copy()
-    draw = ImageDraw.Draw(result_img)
-    img_width, img_height = img.size
+    img_width, img_height = img_size
     
     # Handle RTL languages (Arabic, Kurdish, etc.)
-    is_rtl = False
-    if language and language.lower() in ['ar', 'arabic', 'ckb', 'kurdish', 'he', 'hebrew', 'ur', 'urdu']:
-        is_rtl = True
+    is_rtl = bool(language) and language.lower() in RTL_LANGUAGES
+    if is_rtl:
         logger.info(f"Processing RTL text for language: {language}")
     
-    # Load the font
-    font = get_font(font_family, font_size)
+    # Load the font (rendering with the configured fallback while it is being fetched)
+    fallback_family = get_fallback_font_family(is_rtl)
+    font = get_font(font_family, font_size, font_weight, font_style, fallback_family=fallback_family)
     if font is None:
         logger.warning(f"Failed to load font: {font_family}. Using default font.")
     
@@ -251,6 +631,107 @@ def apply_custom_text(img, text, language, font_family, font_size, text_color, b
     # Calculate text container width based on percentage
     container_width = int((img_width - (2 * container_margin)) * (container_width_percent / 100))
     
+    if fit not in ('shrink', 'fill'):
+        fit = max_height = min_font_size = max_font_size = None
+    elif max_height is None:
+        max_height = img_height - 2 * container_margin
+    
+    # The resolved font file is part of the key, so a layout made with the fallback
+    # font is not reused once the requested font has been downloaded
+    key = (
+        text, (language or '').lower(), getattr(font, 'path', None), font_family, font_weight, font_style, font_size,
+        container_width, tuple(padding_dict[side] for side in ('top', 'right', 'bottom', 'left')),
+        fit, max_height, min_font_size, max_font_size
+    )
+    
+    # Lines are measured and drawn shaped (contextual forms, visual order)
+    shaper = LineShaper(language, is_rtl, font)
+    
+    def build():
+        return _compute_text_layout(
+            text, shaper, font, font_family, font_size, font_weight, font_style, fallback_family,
+            container_width, padding_dict, fit, max_height, min_font_size, max_font_size
+        )
+    
+    return _layout_cache.get_or_create(key, build)
+
+def _compute_text_layout(text, shaper, font, font_family, font_size, font_weight, font_style,
+                         fallback_family, container_width, padding_dict, fit, max_height,
+                         min_font_size, max_font_size):
+    """Wrap and measure text for layout_custom_text (uncached)"""
+    # Fonts used for the characters the requested font does not cover
+    font_chain = get_font_chain(font, font_size, font_weight, font_style)
+    
+    # Split text into lines that fit within the container width
+    max_width = container_width - padding_dict['left'] - padding_dict['right']
+    
+    def measurer_for_size(size, probe=False):
+        sized_font = get_font(font_family, size, font_weight, font_style, fallback_family=fallback_family,
+                              probe=probe)
+        return TextMeasurer(get_font_chain(sized_font, size, font_weight, font_style, probe), shaper)
+    
+    if fit in ('shrink', 'fill'):
+        # Largest font size whose lines fit the container width and height; the
+        # sizes tried are measured with fonts from the probe cache, and only the
+        # chosen size is loaded into the font cache
+        upper_size = font_size if fit == 'shrink' else max_font_size
+        font_size, lines, _ = fit_text(
+            text, lambda size: measurer_for_size(size, probe=True), max_width,
+            max_height - padding_dict['top'] - padding_dict['bottom'],
+            min(min_font_size, upper_size), upper_size
+        )
+        measurer = measurer_for_size(font_size)
+        logger.info(f"Fitted text ({fit}) at font size {font_size}")
+    else:
+        def shrink_font():
+            # If a single character is too wide, reduce the font size by 20%
+            adjusted_font_size = int(font_size * 0.8)
+            logger.warning(f"Text too wide, reducing font size from {font_size} to {adjusted_font_size}")
+            return measurer_for_size(adjusted_font_size)
+        
+        initial_measurer = TextMeasurer(font_chain, shaper)
+        lines, measurer = wrap_text(text, initial_measurer, max_width, shrink_font)
+        if measurer is not initial_measurer:
+            # Lines before the shrink were wrapped with the larger font
+            lines, measurer = wrap_text(text, measurer, max_width)
+            font_size = int(font_size * 0.8)
+    font_chain = measurer.font_chain
+    
+    # Shape the lines for display and measure them for alignment
+    display_lines = [shaper.shape(line) for line in lines]
+    line_boxes = [font_chain.getbbox(line, shaper.direction, shaper.language) for line in display_lines]
+    
+    # Calculate text height
+    total_text_height = text_block_height(line_boxes, LINE_SPACING)
+    
+    # Calculate container height
+    container_height = total_text_height + padding_dict['top'] + padding_dict['bottom']
+    
+    return TextLayout(font_chain, font_size, shaper.is_rtl, display_lines, line_boxes,
+                      container_width, container_height, padding_dict,
+                      shaper.direction, shaper.language, text_lines=lines,
+                      overlong_words=has_overlong_words(text, measurer, max_width),
+                      max_height=max_height)
+
+def position_text_container(layout, img_size, text_position=None, alignment='bottom-center',
+                            container_margin=0):
+    """
+    Place the container of a text layout on an image
+    
+    Args:
+        layout (TextLayout): Layout of the text
+        img_size (tuple): (width, height) of the image
+        text_position (dict, optional): Manual position for text
+        alignment (str): Alignment position (e.g. 'bottom-center')
+        container_margin (int): Margin for text container
+        
+    Returns:
+        tuple: (x, y, width, height) of the container, clipped to the image
+    """
+    img_width, img_height = img_size
+    container_width = layout.container_width
+    container_height = layout.container_height
+    
     # Calculate text position
     if text_position:
         # Use manual positioning if provided
@@ -274,75 +755,6 @@ def apply_custom_text(img, text, language, font_family, font_size, text_color, b
         else:  # center
             container_x = (img_width - container_width) // 2
     
-    # Split text into lines that fit within the container width
-    lines = []
-    current_line = ""
-    words = text.split()
-    
-    for word in words:
-        # RTL languages need special handling
-        if is_rtl:
-            # Skip reshaping for RTL languages as it can cause issues with mixed scripts
-            test_line = current_line + " " + word if current_line else word
-        else:
-            test_line = current_line + " " + word if current_line else word
-        
-        # Check if the line fits
-        text_width = font.getbbox(test_line)[2] - font.getbbox(test_line)[0]
-        max_width = container_width - padding_dict['left'] - padding_dict['right']
-        
-        if text_width <= max_width:
-            current_line = test_line
-        else:
-            if current_line:
-                lines.append(current_line)
-                current_line = word
-            else:
-                # If a single word is too long, we need to split it
-                if len(word) > 1:
-                    logger.warning(f"Word too long for container: {word}")
-                    chars = list(word)
-                    current_part = ""
-                    
-                    for char in chars:
-                        test_part = current_part + char
-                        text_width = font.getbbox(test_part)[2] - font.getbbox(test_part)[0]
-                        
-                        if text_width <= max_width:
-                            current_part = test_part
-                        else:
-                            lines.append(current_part)
-                            current_part = char
-                    
-                    if current_part:
-                        current_line = current_part
-                else:
-                    # If it's a single character that's too wide, we need to reduce font size
-                    original_font_size = font_size
-                    adjusted_font_size = int(font_size * 0.8)  # Reduce by 20%
-                    logger.warning(f"Text too wide, reducing font size from {original_font_size} to {adjusted_font_size}")
-                    font = get_font(font_family, adjusted_font_size)
-                    lines.append(word)
-    
-    # Add the last line if there is one
-    if current_line:
-        lines.append(current_line)
-    
-    # Calculate text height
-    line_spacing = 1.2
-    total_text_height = 0
-    for line in lines:
-        bbox = font.getbbox(line)
-        line_height = bbox[3] - bbox[1]
-        total_text_height += line_height * line_spacing
-    
-    # Adjust total_text_height to account for last line's spacing
-    if lines:
-        total_text_height -= (font.getbbox(lines[-1])[3] - font.getbbox(lines[-1])[1]) * (line_spacing - 1)
-    
-    # Calculate container height
-    container_height = total_text_height + padding_dict['top'] + padding_dict['bottom']
-    
     # Adjust container position for alignment
     if alignment.startswith('bottom'):
         container_y = container_y - container_height
@@ -359,9 +771,215 @@ def apply_custom_text(img, text, language, font_family, font_size, text_color, b
     if container_y + container_height > img_height:
         container_height = img_height - container_y
     
+    return container_x, container_y, container_width, container_height
+
+def apply_custom_text(img, text, language, font_family, font_size, text_color, bg_color,
+                     text_position=None, alignment='bottom-center', padding=20, 
+                     bg_curve=0, container_margin=0, container_width_percent=90,
+                     gradient_colors=None, gradient_direction="vertical",
+                     font_weight=400, font_style='normal', fit=None, max_height=None,
+                     min_font_size=12, max_font_size=200, in_place=False):
+    """
+    Apply text overlay with custom styling to an image
+    
+    Args:
+        img (PIL.Image): The source image
+        text (str): Text content to overlay
+        language (str): Language code
+        font_family (str): Font family name
+        font_size (int): Font size in pixels
+        text_color (tuple): RGB(A) tuple for text color
+        bg_color (tuple): RGB(A) tuple for background color
+        text_position (dict, optional): Manual position for text
+        alignment (str): Alignment position (e.g. 'bottom-center')
+        padding (int or dict): Padding values
+        bg_curve (int): Corner radius for text background
+        container_margin (int): Margin for text container
+        container_width_percent (int): Width of text container as percentage of image width
+        gradient_colors (list, optional): List of colors for gradient background
+        gradient_direction (str): Direction of gradient
+        font_weight (int): Font weight (e.g., 400, 700)
+        font_style (str): Font style ('normal', 'italic')
+        fit (str, optional): 'shrink' to use the largest size up to font_size that fits
+            the container, 'fill' to use the largest size up to max_font_size
+        max_height (int, optional): Maximum container height when fitting
+            (defaults to the image height minus the container margins)
+        min_font_size (int): Smallest font size when fitting
+        max_font_size (int): Largest font size when fitting with 'fill'
+        in_place (bool): Draw onto img itself instead of a copy, for callers that
+            hand over the image (RGB and RGBA images only; others are converted)
+        
+    Returns:
+        PIL.Image: Image with text overlay applied; the font size used is stored
+        in its info dict under 'font_size'
+    """
+    logger.info(f"Applying text overlay: '{text[:30]}...' in {language}")
+    logger.debug(f"Parameters: font={font_family}, size={font_size}, alignment={alignment}, "
+                f"container_margin={container_margin}, container_width_percent={container_width_percent}")
+    
+    layout = layout_custom_text(
+        img.size, text, language, font_family, font_size, alignment, padding,
+        container_margin, container_width_percent, font_weight, font_style,
+        fit, max_height, min_font_size, max_font_size
+    )
+    
+    return render_text_layout(
+        img, layout, text_color, bg_color, text_position, alignment, bg_curve,
+        container_margin, container_width_percent, gradient_colors, gradient_direction, in_place
+    )
+
+def apply_text_layers(img, layers, min_font_size=12, max_font_size=200, in_place=False):
+    """
+    Apply several text overlays (e.g. title, subtitle and badge) to an image in one pass
+    
+    The layers are laid out and drawn in order, later layers on top, onto a
+    single overlay that is blended onto a copy of the image once, so the
+    image is copied (and later encoded) once instead of once per overlay.
+    
+    Args:
+        img (PIL.Image): The source image
+        layers (list): One dict per layer with the keyword arguments of
+            apply_custom_text (text, language, font_family, font_size, text_color,
+            bg_color, alignment, padding, ...)
+        min_font_size (int): Smallest font size when fitting
+        max_font_size (int): Largest font size when fitting with 'fill'
+        in_place (bool): Draw onto img itself instead of a copy (see apply_custom_text)
+        
+    Returns:
+        PIL.Image: Image with all overlays applied; the font size used by each
+        layer is stored in its info dict under 'font_sizes'
+    """
+    logger.info(f"Applying {len(layers)} text layers")
+    placed_layers = [_place_text_layer(img.size, layer, min_font_size, max_font_size) for layer in layers]
+    
+    result_img = _composite_text_layers(img, placed_layers, in_place)
+    result_img.info['font_sizes'] = [placed['layout'].font_size for placed in placed_layers]
+    return result_img
+
+def measure_text_layers(img_size, layers, min_font_size=12, max_font_size=200):
+    """
+    Lay out text layers without drawing them (dry run of apply_text_layers)
+    
+    Resolves fonts, wraps and positions the text exactly like
+    apply_text_layers, using the same layout cache, but does not touch any
+    pixels, so no image is needed.
+    
+    Args:
+        img_size (tuple): (width, height) of the image the text would be drawn on
+        layers (list): Layers as for apply_text_layers (colours are ignored)
+        min_font_size (int): Smallest font size when fitting
+        max_font_size (int): Largest font size when fitting with 'fill'
+        
+    Returns:
+        list: One dict per layer with the font size, the lines (logical order),
+        their boxes and the container as (x, y, width, height) in image
+        pixels, and overflow flags
+    """
+    results = []
+    for layer in layers:
+        placed = _place_text_layer(img_size, dict(layer, text_color=None, bg_color=None),
+                                   min_font_size, max_font_size)
+        layout = placed['layout']
+        x0, y0, x1, y1 = placed['container_box']
+        
+        line_boxes = []
+        for bbox, (text_x, text_y) in zip(layout.line_boxes, placed['line_origins']):
+            line_boxes.append((text_x + bbox[0], text_y + bbox[1], bbox[2] - bbox[0], bbox[3] - bbox[1]))
+        
+        results.append({
+            'font_size': layout.font_size,
+            'lines': list(layout.text_lines),
+            'line_boxes': [_rounded_box(box) for box in line_boxes],
+            'container': _rounded_box((x0, y0, x1 - x0, y1 - y0)),
+            'overflow': {
+                # Container cut off by the image edges (by more than float rounding)
+                'clipped': x1 - x0 < layout.container_width - 0.5 or y1 - y0 < layout.container_height - 0.5,
+                # Ink of a line outside the (clipped) container
+                'text_outside_container': any(
+                    x < x0 or y < y0 or x + width > x1 or y + height > y1
+                    for x, y, width, height in line_boxes
+                ),
+                # A word wider than the container was split across lines
+                'overlong_words': layout.overlong_words,
+                # Fitted text that is still taller than max_height at the minimum font size
+                'exceeds_max_height': layout.max_height is not None and layout.container_height > layout.max_height
+            }
+        })
+    return results
+
+def _rounded_box(box):
+    return {key: round(value) for key, value in zip(('x', 'y', 'width', 'height'), box)}
+
+def render_text_layout(img, layout, text_color, bg_color, text_position=None, alignment='bottom-center',
+                       bg_curve=0, container_margin=0, container_width_percent=90,
+                       gradient_colors=None, gradient_direction="vertical", in_place=False):
+    """
+    Draw a text layout with its background container onto a copy of an image
+    
+    Args:
+        img (PIL.Image): The source image
+        layout (TextLayout): Layout from layout_custom_text
+        text_color (tuple): RGB(A) tuple for text color
+        bg_color (tuple): RGB(A) tuple for background color
+        text_position (dict, optional): Manual position for text
+        alignment (str): Alignment position (e.g. 'bottom-center')
+        bg_curve (int): Corner radius for text background
+        container_margin (int): Margin for text container
+        container_width_percent (int): Width of text container as percentage of image width
+        gradient_colors (list, optional): List of colors for gradient background
+        gradient_direction (str): Direction of gradient
+        in_place (bool): Draw onto img itself instead of a copy (see apply_custom_text)
+        
+    Returns:
+        PIL.Image: Image with text overlay applied
+    """
+    placed = _place_text_layout(
+        layout, img.size, text_color, bg_color, text_position, alignment, bg_curve,
+        container_margin, container_width_percent, gradient_colors, gradient_direction
+    )
+    result_img = _composite_text_layers(img, [placed], in_place)
+    result_img.info['font_size'] = layout.font_size
+    return result_img
+
+def _place_text_layer(img_size, layer, min_font_size, max_font_size):
+    """Lay out and position one layer of apply_text_layers"""
+    options = dict(layer)
+    text = options.pop('text', '')
+    language = options.pop('language', 'en')
+    text_color = options.pop('text_color')
+    bg_color = options.pop('bg_color')
+    text_position = options.pop('text_position', None)
+    bg_curve = options.pop('bg_curve', 0)
+    gradient_colors = options.pop('gradient_colors', None)
+    gradient_direction = options.pop('gradient_direction', 'vertical')
+    options.setdefault('min_font_size', min_font_size)
+    options.setdefault('max_font_size', max_font_size)
+    
+    layout = layout_custom_text(img_size, text, language, **options)
+    return _place_text_layout(
+        layout, img_size, text_color, bg_color, text_position,
+        options.get('alignment', 'bottom-center'), bg_curve, options.get('container_margin', 0),
+        options.get('container_width_percent', 90), gradient_colors, gradient_direction
+    )
+
+def _place_text_layout(layout, img_size, text_color, bg_color, text_position, alignment, bg_curve,
+                       container_margin, container_width_percent, gradient_colors, gradient_direction):
+    """
+    Position a text layout and its lines on an image
+    
+    Returns:
+        dict: Everything _composite_text_layers needs to draw the layer, including
+        'bounds', the (x0, y0, x1, y1) box covering its container and text ink
+    """
+    padding_dict = layout.padding
+    is_rtl = layout.is_rtl
+    
+    container_x, container_y, container_width, container_height = position_text_container(
+        layout, img_size, text_position, alignment, container_margin
+    )
+    
     logger.debug(f"Container position: x={container_x}, y={container_y}, width={container_width}, height={container_height}")
     
-    # Draw the text background
     container_box = (container_x, container_y, container_x + container_width, container_y + container_height)
     
     # For full-width containers, only apply corner radius if explicitly requested
@@ -371,50 +989,14 @@ def apply_custom_text(img, text, language, font_family, font_size, text_color, b
         logger.debug("Full-width container detected, skipping corner radius")
         apply_curve = 0
     
-    # Create background with gradient if colors are provided
-    if gradient_colors:
-        # Create gradient background
-        gradient_bg = create_gradient_background(
-            container_width, 
-            container_height, 
-            gradient_colors, 
-            gradient_direction
-        )
-        
-        # Create mask for rounded corners if needed
-        if apply_curve > 0:
-            mask = Image.new('L', (container_width, container_height), 0)
-            mask_draw = ImageDraw.Draw(mask)
-            draw_rounded_rectangle(
-                mask_draw,
-                (0, 0, container_width, container_height),
-                apply_curve,
-                fill=255
-            )
-            
-            # Apply mask to gradient
-            gradient_bg.putalpha(mask)
-        
-        # Paste gradient onto image
-        result_img.paste(gradient_bg, (container_x, container_y), gradient_bg)
-    else:
-        # Draw standard background
-        if apply_curve > 0:
-            draw_rounded_rectangle(draw, container_box, apply_curve, fill=bg_color)
-        else:
-            draw.rectangle(container_box, fill=bg_color)
+    # Rectangles are drawn including their right and bottom edge
+    bounds = [container_box[0], container_box[1], container_box[2] + 1, container_box[3] + 1]
     
-    # Draw text
+    # Position the lines
+    line_origins = []
     current_y = container_y + padding_dict['top']
-    for line in lines:
-        # Process line for RTL if needed
-        display_line = line
-        if is_rtl:
-            # Skip reshaping for better compatibility with mixed scripts
-            display_line = get_display(line)
-        
+    for bbox in layout.line_boxes:
         # Calculate line width for alignment
-        bbox = font.getbbox(display_line)
         line_width = bbox[2] - bbox[0]
         line_height = bbox[3] - bbox[1]
         
@@ -426,10 +1008,171 @@ def apply_custom_text(img, text, language, font_family, font_size, text_color, b
         else:  # center
             text_x = container_x + (container_width - line_width) // 2
         
-        # Draw the line
-        draw.text((text_x, current_y), display_line, font=font, fill=text_color)
+        # The ink of the line starts at current_y (as the container height assumes),
+        # not the origin it is drawn from
+        text_y = current_y - bbox[1]
+        line_origins.append((text_x, text_y))
+        
+        # Text can overflow its container, so its ink is part of the bounds too
+        # (with a pixel of slack for the fractional start position)
+        bounds[0] = min(bounds[0], text_x + bbox[0] - 1)
+        bounds[1] = min(bounds[1], text_y + bbox[1] - 1)
+        bounds[2] = max(bounds[2], text_x + bbox[2] + 2)
+        bounds[3] = max(bounds[3], text_y + bbox[3] + 2)
         
         # Move to next line
-        current_y += line_height * line_spacing
+        current_y += line_height * LINE_SPACING
+    
+    return {
+        'layout': layout,
+        'container_box': container_box,
+        'curve': apply_curve,
+        'line_origins': line_origins,
+        'bounds': bounds,
+        'text_color': text_color,
+        'bg_color': bg_color,
+        'gradient_colors': gradient_colors,
+        'gradient_direction': gradient_direction
+    }
+
+def _composite_text_layers(img, placed_layers, in_place=False):
+    """
+    Draw placed text layers onto a copy of an image, or onto the image itself
+    
+    Backgrounds, gradients and text of overlapping layers are drawn onto one
+    RGBA overlay that only covers the union of their bounds. Each overlay is
+    then blended onto its region of the image once. Semi-transparent
+    backgrounds therefore blend with the image (ImageDraw fills on an RGB
+    image ignore alpha), and the full image is never redrawn.
+    
+    Args:
+        img (PIL.Image): The source image
+        placed_layers (list): Layers from _place_text_layout, bottom to top
+        in_place (bool): Modify img instead of a copy (RGB and RGBA images only)
+        
+    Returns:
+        PIL.Image: Image with the layers applied
+    """
+    # Blending needs true colour; palette and greyscale images are converted
+    if img.mode in ('RGB', 'RGBA'):
+        # Only the overlay regions change, so a full copy is only needed when
+        # the caller keeps using the original image
+        result_img = img if in_place else img.copy()
+    else:
+        has_alpha = 'A' in img.mode or 'transparency' in img.info
+        result_img = img.convert('RGBA' if has_alpha else 'RGB')
+    
+    for bounds, group in _group_overlapping_layers(placed_layers):
+        # Union of the group's bounds, clipped to the image
+        left = max(0, int(math.floor(bounds[0])))
+        top = max(0, int(math.floor(bounds[1])))
+        right = min(result_img.width, int(math.ceil(bounds[2])))
+        bottom = min(result_img.height, int(math.ceil(bounds[3])))
+        if right <= left or bottom <= top:
+            continue
+        
+        overlay = Image.new('RGBA', (right - left, bottom - top), (0, 0, 0, 0))
+        overlay_draw = ImageDraw.Draw(overlay)
+        
+        drawn_bounds = []
+        for placed in group:
+            # A background over a still transparent part of the overlay can be drawn
+            # directly instead of being composited
+            blank = not any(_boxes_overlap(placed['bounds'], drawn) for drawn in drawn_bounds)
+            _draw_placed_layer(overlay, overlay_draw, placed, left, top, blank)
+            drawn_bounds.append(placed['bounds'])
+        
+        if result_img.mode == 'RGBA':
+            result_img.alpha_composite(overlay, (left, top))
+        else:
+            # Over an opaque image, pasting with the overlay's alpha as mask is
+            # the alpha composite, without converting the region to RGBA and back
+            result_img.paste(overlay, (left, top), overlay)
+    return result_img
+
+def _boxes_overlap(box, other):
+    return box[0] < other[2] and other[0] < box[2] and box[1] < other[3] and other[1] < box[3]
+
+def _group_overlapping_layers(placed_layers):
+    """
+    Group placed layers whose bounds overlap (directly or through other layers)
+    
+    Layers far apart (e.g. a title at the top and a badge at the bottom) get
+    separate overlays instead of one spanning the image between them.
+    
+    Returns:
+        list: (bounds, layers) pairs; layers keep their drawing order
+    """
+    groups = []
+    for index, placed in enumerate(placed_layers):
+        bounds = list(placed['bounds'])
+        members = [index]
+        # Merging can grow the bounds into further groups, so repeat until none overlaps
+        overlapping = [group for group in groups if _boxes_overlap(group[0], bounds)]
+        while overlapping:
+            for group in overlapping:
+                groups.remove(group)
+                bounds = [min(bounds[0], group[0][0]), min(bounds[1], group[0][1]),
+                          max(bounds[2], group[0][2]), max(bounds[3], group[0][3])]
+                members.extend(group[1])
+            overlapping = [group for group in groups if _boxes_overlap(group[0], bounds)]
+        groups.append((bounds, members))
+    return [(bounds, [placed_layers[index] for index in sorted(members)]) for bounds, members in groups]
+
+def _draw_placed_layer(overlay, overlay_draw, placed, offset_x, offset_y, blank):
+    """
+    Draw the background and text of a placed layer onto the overlay at (offset_x, offset_y)
+    
+    Args:
+        blank (bool): Whether the overlay is still transparent within the layer's bounds
+    """
+    layout = placed['layout']
+    x0, y0, x1, y1 = placed['container_box']
+    apply_curve = placed['curve']
+    
+    if blank and not placed['gradient_colors']:
+        # Nothing to blend with: draw the background straight onto the overlay
+        box = (x0 - offset_x, y0 - offset_y, x1 - offset_x, y1 - offset_y)
+        if apply_curve > 0:
+            fill_rounded_rectangle(overlay, box, apply_curve, placed['bg_color'])
+        else:
+            overlay_draw.rectangle(box, fill=placed['bg_color'])
+    else:
+        _composite_background(overlay, placed, offset_x, offset_y)
+    
+    # Draw text
+    font_chain = layout.font_chain
+    for display_line, (text_x, text_y) in zip(layout.lines, placed['line_origins']):
+        font_chain.draw_text(overlay, overlay_draw, (text_x - offset_x, text_y - offset_y), display_line,
+                             fill=placed['text_color'], direction=layout.direction, language=layout.language)
+
+def _composite_background(overlay, placed, offset_x, offset_y):
+    """Draw the background of a placed layer on its own layer and blend it onto the overlay"""
+    x0, y0, x1, y1 = placed['container_box']
+    apply_curve = placed['curve']
+    
+    # The background is drawn at the same fractional position as on the overlay,
+    # so both paths rasterize the container identically
+    origin_x = int(math.floor(x0))
+    origin_y = int(math.floor(y0))
+    box = (x0 - origin_x, y0 - origin_y, x1 - origin_x, y1 - origin_y)
+    size = (int(math.ceil(box[2])) + 1, int(math.ceil(box[3])) + 1)
     
-    return result_img 
\ No newline at end of file
+    # Create background with gradient if colors are provided
+    if placed['gradient_colors']:
+        # Gradient tiles (with their rounded corners) recur across requests, so they are cached
+        background = _gradient_tile(
+            int(x1 - x0),
+            int(y1 - y0),
+            placed['gradient_colors'],
+            placed['gradient_direction'],
+            apply_curve
+        )
+    else:
+        # Draw standard background (rasterizing a solid shape is cheaper than blending a cached mask)
+        background = Image.new('RGBA', size, (0, 0, 0, 0))
+        if apply_curve > 0:
+            fill_rounded_rectangle(background, box, apply_curve, placed['bg_color'])
+        else:
+            ImageDraw.Draw(background).rectangle(box, fill=placed['bg_color'])
+    overlay.alpha_composite(background, (origin_x - offset_x, origin_y - offset_y))
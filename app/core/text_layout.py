@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+Text layout for Dila Headless Image Editor
+
+Line wrapping and text measurement used by the text overlay.
+"""
+
+import bisect
+import logging
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+# Estimate tolerance in pixels for fonts without a size, e.g. the default bitmap font
+_DEFAULT_MARGIN = 16
+
+# Line height multiplier used when stacking lines
+LINE_SPACING = 1.2
+
+_ZWJ = '\u200d'
+_JOINERS = (_ZWJ, '\u200c')
+_ZWSP = '\u200b'
+
+# Small kana, which do not start a line (UAX #14 classes NS/CJ); the
+# iteration and prolonged sound marks are matched by category (Lm, Sk)
+_NONSTARTERS = frozenset(
+    'ぁぃぅぇぉっゃゅょゎゕゖァィゥェォッャュョヮヵヶㇰㇱㇲㇳㇴㇵㇶㇷㇸㇹㇺㇻㇼㇽㇾㇿｧｨｩｪｫｬｭｮｯ'
+)
+
+_break_properties = {}
+
+class TextMeasurer:
+    """
+    Measures text for line wrapping, memoizing advances per distinct string.
+
+    Line widths are estimated by accumulating word and space advances. The
+    estimate differs from the exact ink width (getbbox) only by the side
+    bearings of the first and last glyph and kerning across word
+    boundaries, which stay well below one em. The exact width is therefore
+    only measured when the estimate lies within one em of the limit, where
+    it could decide a line break.
+
+    Text is measured in the form it is drawn in, as produced by the line
+    shaper (e.g. with Arabic presentation forms).
+    """
+
+    def __init__(self, font_chain, shaper=None):
+        """
+        Args:
+            font_chain (FontChain): Fonts used to measure (and later draw) the text
+            shaper (LineShaper, optional): Shaper converting logical text to its drawn form
+        """
+        self.font_chain = font_chain
+        self.shaper = shaper
+        self.direction = shaper.direction if shaper else None
+        self.language = shaper.language if shaper else None
+        self.margin = getattr(font_chain.font, 'size', _DEFAULT_MARGIN)
+        self.exact_measurements = 0
+        self._advances = {}
+        self.space_advance = self.advance(' ')
+
+    def shape(self, text):
+        """Return the drawn form of a logical-order text"""
+        return self.shaper.shape(text) if self.shaper else text
+
+    def advance(self, text):
+        """Return the (memoized) advance width of text"""
+        advance = self._advances.get(text)
+        if advance is None:
+            advance = self._advances[text] = self.font_chain.getlength(
+                self.shape(text), self.direction, self.language
+            )
+        return advance
+
+    def box(self, text):
+        """Return the (left, top, right, bottom) box of text as drawn"""
+        return self.font_chain.getbbox(self.shape(text), self.direction, self.language)
+
+    def width(self, text):
+        """Return the exact ink width of text"""
+        self.exact_measurements += 1
+        left, _, right, _ = self.box(text)
+        return right - left
+
+    def fits(self, text, advance, max_width):
+        """
+        Check whether text fits in max_width
+
+        Args:
+            text (str): Text to check
+            advance (float): Estimated advance width of text
+            max_width (int): Available width in pixels
+
+        Returns:
+            bool: True if the exact ink width of text is at most max_width
+        """
+        if advance <= max_width - self.margin:
+            return True
+        if advance > max_width + self.margin:
+            return False
+        return self.width(text) <= max_width
+
+def grapheme_clusters(text):
+    """
+    Split text into grapheme clusters.
+
+    A cluster is a base character followed by its combining marks (e.g.
+    Arabic harakat or the Kurdish diacritics written as marks); zero width
+    joiners also join the characters on either side.
+
+    Args:
+        text (str): Text to split
+
+    Returns:
+        list: Clusters in text order
+    """
+    clusters = []
+    join_next = False
+    for ch in text:
+        if clusters and (join_next or ch in _JOINERS or unicodedata.category(ch).startswith('M')):
+            clusters[-1] += ch
+        else:
+            clusters.append(ch)
+        join_next = ch == _ZWJ
+    return clusters
+
+def _line_break_properties(ch):
+    """
+    Get the (memoized) line break properties of a character
+
+    Returns:
+        tuple: (ideographic, no_break_before, no_break_after)
+    """
+    properties = _break_properties.get(ch)
+    if properties is None:
+        category = unicodedata.category(ch)
+        # Ideographs, kana, hangul and full/half-width forms (UAX #14 classes ID, H2, H3);
+        # emoji are wide too but stay unbroken like the words around them
+        ideographic = unicodedata.east_asian_width(ch) in ('W', 'F', 'H') and category != 'So'
+        no_break_before = (
+            ch == _ZWSP or ch in _NONSTARTERS
+            or (category.startswith('P') and category not in ('Ps', 'Pi'))
+            or (ideographic and category in ('Lm', 'Sk'))
+        )
+        no_break_after = category in ('Ps', 'Pi')
+        properties = _break_properties[ch] = (ideographic, no_break_before, no_break_after)
+    return properties
+
+def break_segments(word):
+    """
+    Split a word (text without spaces) at its line break opportunities.
+
+    Follows the UAX #14 rules for ideographic text: a line may break before
+    or after an ideograph, kana or hangul syllable, except before closing
+    punctuation and small kana and after opening punctuation. A zero width
+    space always allows a break after it. Breaks fall between grapheme
+    clusters only, and words of scripts written with spaces are returned
+    whole.
+
+    Args:
+        word (str): Text without whitespace
+
+    Returns:
+        list: Segments of the word, in text order
+    """
+    if word.isascii() and _ZWSP not in word:
+        return [word]
+
+    segments = []
+    start = 0
+    offset = 0
+    previous = None
+    previous_char = None
+    for cluster in grapheme_clusters(word):
+        properties = _line_break_properties(cluster[0])
+        if previous is not None and (
+            previous_char == _ZWSP
+            or (not properties[1] and not previous[2] and (properties[0] or previous[0]))
+        ):
+            segments.append(word[start:offset])
+            start = offset
+        previous, previous_char = properties, cluster[0]
+        offset += len(cluster)
+    segments.append(word[start:])
+    return segments
+
+def _split_word(word, measurer, max_width):
+    """
+    Split a word that is wider than max_width into parts that fit.
+
+    Parts are broken between grapheme clusters only. The break position of
+    each part is found by an exponential then binary search over exact
+    prefix widths, starting from the position estimated by a cumulative
+    advance array, so a part costs a few measurements instead of one per
+    character.
+
+    Returns:
+        list: Parts of the word; the last one may be continued by the next word
+    """
+    clusters = grapheme_clusters(word)
+    offsets = [0]
+    cumulative = [0]
+    for cluster in clusters:
+        offsets.append(offsets[-1] + len(cluster))
+        cumulative.append(cumulative[-1] + measurer.advance(cluster))
+
+    def fits(first, last):
+        return measurer.width(word[offsets[first]:offsets[last]]) <= max_width
+
+    parts = []
+    start = 0
+    count = len(clusters)
+    while start < count:
+        remaining = count - start
+        guess = bisect.bisect_right(cumulative, cumulative[start] + max_width, start) - 1 - start
+        guess = min(max(guess, 1), remaining)
+
+        # Gallop away from the estimate until the break position is bracketed
+        # by low (clusters known to fit) and high (clusters known not to fit)
+        step = 1
+        if fits(start, start + guess):
+            low, high = guess, remaining + 1
+            while low < remaining:
+                probe = min(low + step, remaining)
+                if not fits(start, start + probe):
+                    high = probe
+                    break
+                low = probe
+                step *= 2
+        else:
+            low, high = 0, guess
+            while high > 1:
+                probe = max(high - step, 1)
+                if fits(start, start + probe):
+                    low = probe
+                    break
+                high = probe
+                step *= 2
+
+        while low + 1 < high and low < remaining:
+            probe = (low + high) // 2
+            if fits(start, start + probe):
+                low = probe
+            else:
+                high = probe
+
+        # Always make progress, even if a single cluster is too wide
+        end = start + max(low, 1)
+        parts.append(word[offsets[start]:offsets[end]])
+        start = end
+    return parts
+
+def has_overlong_words(text, measurer, max_width):
+    """
+    Check whether text has a word (or segment of unspaced text) wider than max_width
+
+    Such words are split across lines by wrap_text.
+
+    Args:
+        text (str): Text to check
+        measurer (TextMeasurer): Measurer for the font the text is drawn with
+        max_width (int): Available line width in pixels
+
+    Returns:
+        bool: True if a word does not fit on a line of its own
+    """
+    segments = {segment for word in text.split() for segment in break_segments(word)}
+    return not all(measurer.fits(segment, measurer.advance(segment), max_width) for segment in segments)
+
+def wrap_text(text, measurer, max_width, shrink_font=None):
+    """
+    Split text into lines that fit within max_width.
+
+    Lines break at spaces and at the break opportunities inside words
+    found by break_segments, so unspaced scripts (Chinese, Japanese) wrap
+    like spaced ones. Each distinct segment is measured once, and the
+    width of the line being built is accumulated from the segment and
+    space advances instead of re-measuring the whole line for every
+    segment, so wrapping takes time linear in the length of the text.
+
+    Args:
+        text (str): Text to wrap
+        measurer (TextMeasurer): Measurer for the font the text is drawn with
+        max_width (int): Available line width in pixels
+        shrink_font (callable, optional): Called when a single character does not
+            fit; returns the TextMeasurer of a smaller font used from then on
+
+    Returns:
+        tuple: (lines, measurer) where measurer is the one in use after any shrinking
+    """
+    lines = []
+    current_line = ""
+    current_advance = 0
+
+    for word in text.split():
+        for index, segment in enumerate(break_segments(word)):
+            if not current_line:
+                test_line = segment
+                test_advance = measurer.advance(segment)
+            elif index == 0:
+                test_line = current_line + " " + segment
+                test_advance = current_advance + measurer.space_advance + measurer.advance(segment)
+            else:
+                test_line = current_line + segment
+                test_advance = current_advance + measurer.advance(segment)
+
+            if measurer.fits(test_line, test_advance, max_width):
+                current_line, current_advance = test_line, test_advance
+                continue
+
+            if current_line:
+                lines.append(current_line)
+                current_line, current_advance = "", 0
+                segment_advance = measurer.advance(segment)
+                if measurer.fits(segment, segment_advance, max_width):
+                    current_line, current_advance = segment, segment_advance
+                    continue
+
+            if len(grapheme_clusters(segment)) > 1:
+                # If a single word is too long, we need to split it
+                logger.warning(f"Word too long for container: {segment}")
+                parts = _split_word(segment, measurer, max_width)
+                lines.extend(parts[:-1])
+                current_line, current_advance = parts[-1], measurer.advance(parts[-1])
+            else:
+                # If it's a single character that's too wide, we need to reduce font size
+                if shrink_font:
+                    measurer = shrink_font()
+                lines.append(segment)
+
+    # Add the last line if there is one
+    if current_line:
+        lines.append(current_line)
+
+    return lines, measurer
+
+def text_block_height(line_boxes, line_spacing=LINE_SPACING):
+    """
+    Get the height of lines stacked with line_spacing (without spacing after the last one)
+
+    Args:
+        line_boxes (list): (left, top, right, bottom) box of each line
+        line_spacing (float): Line height multiplier
+
+    Returns:
+        float: Height in pixels
+    """
+    total_height = 0
+    line_height = 0
+    for bbox in line_boxes:
+        line_height = bbox[3] - bbox[1]
+        total_height += line_height * line_spacing
+    if line_boxes:
+        total_height -= line_height * (line_spacing - 1)
+    return total_height
+
+def fit_text(text, measurer_for_size, max_width, max_height, min_size, max_size):
+    """
+    Find the largest font size at which text fits a box.
+
+    Text fits when no word (or segment of unspaced text) has to be split
+    across lines and the wrapped lines are at most max_height tall. Sizes
+    are binary searched, so only O(log(max_size - min_size)) layouts are
+    computed, each with its own memoizing TextMeasurer.
+
+    Args:
+        text (str): Text to fit
+        measurer_for_size (callable): Returns the TextMeasurer for a font size
+        max_width (int): Available line width in pixels
+        max_height (float): Available height in pixels
+        min_size (int): Smallest font size; used even if the text does not fit
+        max_size (int): Largest font size
+
+    Returns:
+        tuple: (font_size, lines, measurer)
+    """
+    layouts = {}
+
+    def layout(size):
+        if size not in layouts:
+            measurer = measurer_for_size(size)
+            words_fit = not has_overlong_words(text, measurer, max_width)
+            lines, measurer = wrap_text(text, measurer, max_width)
+            line_boxes = [measurer.box(line) for line in lines]
+            fits = words_fit and text_block_height(line_boxes) <= max_height
+            layouts[size] = (fits, lines, measurer)
+        return layouts[size]
+
+    low, high = min_size, max(min_size, max_size)
+    if not layout(low)[0]:
+        logger.warning(f"Text does not fit at the minimum font size {low}")
+    else:
+        while low < high:
+            size = (low + high + 1) // 2
+            if layout(size)[0]:
+                low = size
+            else:
+                high = size - 1
+
+    _, lines, measurer = layout(low)
+    logger.debug(f"Fitted text at font size {low} after {len(layouts)} layouts")
+    return low, lines, measurer
+
+class TextLayout:
+    """
+    Layout of a text overlay, independent of the image it is drawn on.
+
+    Holds the shaped lines (as passed to the fonts) with their bounding boxes and the size of
+    the container around them. Layouts are cached and shared between
+    requests, so they must not be modified after creation.
+    """
+
+    def __init__(self, font_chain, font_size, is_rtl, lines, line_boxes, container_width,
+                 container_height, padding, direction=None, language=None, text_lines=None,
+                 overlong_words=False, max_height=None):
+        """
+        Args:
+            font_chain (FontChain): Fonts the lines are drawn with
+            font_size (int): Font size used (after fitting or shrinking)
+            is_rtl (bool): Whether the text is right-to-left
+            lines (list): Shaped lines, as drawn
+            line_boxes (list): getbbox() box of each line
+            container_width (int): Container width in pixels
+            container_height (float): Container height in pixels, including padding
+            padding (dict): Padding with top, right, bottom and left keys
+            direction (str, optional): Direction to draw the lines with (Raqm layout only)
+            language (str, optional): Language tag to draw the lines with (Raqm layout only)
+            text_lines (list, optional): The lines in logical order, as wrapped (defaults to lines)
+            overlong_words (bool): Whether a word was wider than a line (and was split)
+            max_height (float, optional): Height limit the text was fitted to, if any
+        """
+        self.font_chain = font_chain
+        self.font_size = font_size
+        self.is_rtl = is_rtl
+        self.lines = lines
+        self.line_boxes = line_boxes
+        self.container_width = container_width
+        self.container_height = container_height
+        self.padding = padding
+        self.direction = direction
+        self.language = language
+        self.text_lines = text_lines if text_lines is not None else lines
+        self.overlong_words = overlong_words
+        self.max_height = max_height
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Text shaping for Dila Headless Image Editor
+
+Converts logical-order lines into the form they are drawn in. With Pillow's
+Raqm layout, shaping and bidi reordering happen inside Pillow, so lines are
+passed through with their direction. With the basic layout, Arabic-script
+letters are replaced by their contextual presentation forms
+(arabic_reshaper) and lines are reordered to visual order (python-bidi).
+Letters without presentation forms (most Kurdish-specific ones) cannot be
+joined that way, so lines containing them are only reordered.
+Shaped lines are memoized, since the same captions recur across requests.
+"""
+
+import logging
+import unicodedata
+from PIL import ImageFont
+from arabic_reshaper import ArabicReshaper
+from arabic_reshaper.letters import LETTERS_ARABIC
+from bidi.algorithm import get_display
+
+from app.utils.cache import LRUCache
+from app.core.font_fallback import has_rtl
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHAPING_CACHE_SIZE = 4096
+
+# Language codes accepted by the API mapped to the BCP 47 tags Raqm expects
+_LANGUAGE_TAGS = {
+    'arabic': 'ar',
+    'kurdish': 'ckb',
+    'hebrew': 'he',
+    'urdu': 'ur',
+    'english': 'en'
+}
+
+# Keep harakat (they are positioned correctly without shifting once the line is reordered)
+_reshaper = ArabicReshaper(configuration={'delete_harakat': False})
+
+# Arabic-script letters arabic_reshaper has no contextual forms for, such as the Kurdish
+# U+06B5, U+06CE, U+06D5 and U+0695. Reshaping a line with one of them leaves it
+# unjoined and breaks the joining of its neighbours as well.
+_UNSHAPEABLE_LETTERS = frozenset(
+    ch for block in ((0x0600, 0x0700), (0x0750, 0x0780), (0x08A0, 0x0900)) for ch in map(chr, range(*block))
+    if unicodedata.category(ch) == 'Lo' and ch not in LETTERS_ARABIC
+)
+
+_shaping_cache = LRUCache(DEFAULT_SHAPING_CACHE_SIZE, 'shaping')
+
+def configure_shaping_cache(max_entries=DEFAULT_SHAPING_CACHE_SIZE):
+    """
+    Set the number of shaped lines kept in memory
+
+    Args:
+        max_entries (int): Maximum number of cached lines
+    """
+    _shaping_cache.resize(max_entries)
+
+def get_shaping_cache_stats():
+    """
+    Get hit/miss/eviction statistics of the shaped line cache
+
+    Returns:
+        dict: Cache statistics
+    """
+    return _shaping_cache.stats()
+
+class LineShaper:
+    """
+    Shapes lines of one language for one font layout engine.
+
+    shape() returns the text to measure and draw, and direction/language
+    are the values to pass to Pillow along with it (None with the basic
+    layout, which does not accept them).
+    """
+
+    def __init__(self, language, is_rtl, font=None):
+        """
+        Args:
+            language (str): Language code of the text
+            is_rtl (bool): Whether the paragraph direction is right-to-left
+            font (PIL.ImageFont.FreeTypeFont, optional): Primary font; shaping is
+                left to Pillow if it uses the Raqm layout
+        """
+        self.is_rtl = is_rtl
+        self.language_code = (language or '').lower()
+        self.raqm = getattr(font, 'layout_engine', None) == ImageFont.Layout.RAQM
+        if self.raqm:
+            self.direction = 'rtl' if is_rtl else 'ltr'
+            self.language = _LANGUAGE_TAGS.get(self.language_code, self.language_code or None)
+        else:
+            self.direction = None
+            self.language = None
+
+    def shape(self, text):
+        """
+        Get the form of a logical-order line that is measured and drawn
+
+        Args:
+            text (str): Line in logical order
+
+        Returns:
+            str: Text in visual order with presentation forms (basic layout), or
+            text unchanged (Raqm layout, or no right-to-left characters)
+        """
+        if self.raqm or not (self.is_rtl or has_rtl(text)):
+            return text
+        key = (text, self.language_code, self.is_rtl)
+        return _shaping_cache.get_or_create(key, lambda: self._shape(text))
+
+    def _shape(self, text):
+        # Lines arabic_reshaper cannot fully join are drawn with isolated letters, which
+        # reads better than some letters joined and others not (Raqm shapes them all)
+        if _UNSHAPEABLE_LETTERS.isdisjoint(text):
+            text = _reshaper.reshape(text)
+        return get_display(text, base_dir='R' if self.is_rtl else 'L')
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+In-process caching utilities for Dila Headless Image Editor
+"""
+
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+class LRUCache:
+    """
+    Bounded, thread-safe least-recently-used cache.
+
+    Keeps hit/miss/eviction counters so cache effectiveness can be
+    inspected at runtime. Besides the entry cap, an optional byte budget
+    bounds the total size of the values as reported by sizeof.
+    """
+
+    def __init__(self, max_entries=128, name='cache', max_bytes=None, sizeof=None):
+        """
+        Args:
+            max_entries (int): Maximum number of entries kept before evicting
+            name (str): Name used when reporting statistics
+            max_bytes (int, optional): Maximum total size of the values in bytes
+            sizeof (callable, optional): Returns the size of a value in bytes
+                (required for max_bytes to have an effect)
+        """
+        self.name = name
+        self._max_entries = max(1, int(max_entries))
+        self._max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._sizes = {}
+        self._bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        """Return the cached value for key (marking it recently used) or default"""
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Store value under key, evicting the least recently used entries if needed"""
+        with self._lock:
+            self._store(key, value)
+
+    def get_or_create(self, key, factory):
+        """
+        Return the cached value for key, creating it with factory() on a miss.
+
+        The factory runs outside the lock so a slow build does not block
+        lookups of other keys. If two threads race on the same key, the
+        first stored value wins and is returned to both.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        value = factory()
+        with self._lock:
+            existing = self._data.get(key, _MISSING)
+            if existing is not _MISSING:
+                self._data.move_to_end(key)
+                return existing
+            self._store(key, value)
+        return value
+
+    def resize(self, max_entries=None, max_bytes=None):
+        """Change the entry cap and/or byte budget, evicting immediately if the cache is over them"""
+        with self._lock:
+            if max_entries is not None:
+                self._max_entries = max(1, int(max_entries))
+            if max_bytes is not None:
+                self._max_bytes = int(max_bytes)
+            self._evict()
+
+    def clear(self):
+        """Drop all entries (counters are kept)"""
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        Get cache statistics
+
+        Returns:
+            dict: Entry count, capacity, hits, misses, evictions and hit rate
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'name': self.name,
+                'entries': len(self._data),
+                'max_entries': self._max_entries,
+                'bytes': self._bytes,
+                'max_bytes': self._max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+    def _store(self, key, value):
+        # Caller must hold the lock
+        if key in self._data:
+            self._bytes -= self._sizes.pop(key, 0)
+        if self._sizeof is not None:
+            size = self._sizeof(value)
+            if self._max_bytes is not None and size > self._max_bytes:
+                # Never worth evicting everything else for
+                self._data.pop(key, None)
+                return
+            self._sizes[key] = size
+            self._bytes += size
+        self._data[key] = value
+        self._data.move_to_end(key)
+        self._evict()
+
+    def _evict(self):
+        # Caller must hold the lock
+        while len(self._data) > self._max_entries or (
+            self._max_bytes is not None and self._bytes > self._max_bytes
+        ):
+            key, _ = self._data.popitem(last=False)
+            self._bytes -= self._sizes.pop(key, 0)
+            self.evictions += 1
@@ -69,13 +69,19 @@ def _cleanup_directory(directory, max_age_seconds):
         if os.path.isdir(filepath) or not is_image_file(filename):
             continue
         
-        # Check file age
-        file_age_seconds = current_time - os.path.getmtime(filepath)
+        # Check file age (each gunicorn worker runs the cleanup, so another one
+        # may have removed the file already)
+        try:
+            file_age_seconds = current_time - os.path.getmtime(filepath)
+        except FileNotFoundError:
+            continue
         if file_age_seconds > max_age_seconds:
             try:
                 os.remove(filepath)
                 removed_count += 1
                 logger.info(f"Removed old image: {filepath} (age: {file_age_seconds/60:.2f} minutes)")
+            except FileNotFoundError:
+                continue
             except Exception as e:
                 logger.error(f"Error removing {filepath}: {e}")
     
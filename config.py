@@ -31,10 +31,85 @@ IMAGE_FORMAT = 'PNG'
 IMAGE_MAX_AGE = 20  # Maximum age of images in minutes before cleanup
 
 # API settings
-MAX_IMAGE_SIZE = 10 * 1024 * 1024  # 10 MB
-ALLOWED_IMAGE_TYPES = ['image/jpeg', 'image/png', 'image/gif']
+MAX_IMAGE_SIZE = int(os.environ.get('MAX_IMAGE_SIZE', 10 * 1024 * 1024))  # Downloaded bytes, 10 MB
+ALLOWED_IMAGE_TYPES = os.environ.get('ALLOWED_IMAGE_TYPES', 'image/jpeg,image/png,image/gif').split(',')
+
+# Budgets checked against the image header before any pixel is decoded: source pixels, and
+# bytes of the decoded source (at its reduced JPEG scale, if any) plus the output frame
+MAX_IMAGE_PIXELS = int(os.environ.get('MAX_IMAGE_PIXELS', 64 * 1000 * 1000))
+MAX_DECODED_BYTES = int(os.environ.get('MAX_DECODED_BYTES', 100 * 1024 * 1024))
+MAX_TEXT_LAYERS = int(os.environ.get('MAX_TEXT_LAYERS', 10))  # Text layers per process_custom request
 
 # Font settings
 DEFAULT_FONT_FAMILY = 'Roboto'
 DEFAULT_FONT_SIZE = 36
-RTL_FONT_FAMILY = 'Noto Sans Arabic' 
\ No newline at end of file
+RTL_FONT_FAMILY = 'Noto Sans Arabic'
+
+# Font size range searched when a request asks for the text to be fitted ("fit": "shrink"/"fill")
+FIT_MIN_FONT_SIZE = int(os.environ.get('FIT_MIN_FONT_SIZE', 12))
+FIT_MAX_FONT_SIZE = int(os.environ.get('FIT_MAX_FONT_SIZE', 200))
+
+# Default resampling quality tier of /api/process_custom ('fast', 'balanced' or 'best';
+# the app refuses to start with any other value)
+DEFAULT_QUALITY = os.environ.get('DEFAULT_QUALITY', 'balanced')
+
+# Balanced tier: large JPEGs are decoded at 1/2, 1/4 or 1/8 scale when the cropped area
+# still has this many times the output resolution (0 to always decode at full size)
+JPEG_DRAFT_OVERSAMPLING = float(os.environ.get('JPEG_DRAFT_OVERSAMPLING', 1.5))
+
+# Balanced tier: downscales by more than twice this ratio start with an integer reduce(),
+# leaving at least this ratio for the LANCZOS pass (0 to resize with LANCZOS only)
+RESIZE_REDUCING_GAP = float(os.environ.get('RESIZE_REDUCING_GAP', 3.0))
+
+# Number of text layouts (wrapped and measured captions) kept in memory per worker
+LAYOUT_CACHE_SIZE = int(os.environ.get('LAYOUT_CACHE_SIZE', 512))
+
+# Number of shaped (reshaped and bidi-reordered) RTL lines and words kept in memory per worker
+SHAPING_CACHE_SIZE = int(os.environ.get('SHAPING_CACHE_SIZE', 4096))
+
+# Memory budget in bytes for cached text line masks per worker (4 workers share the
+# 512M container limit, so keep this well below 128M)
+GLYPH_CACHE_MAX_BYTES = int(os.environ.get('GLYPH_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+
+# Memory budget in bytes and entry cap for cached gradient container backgrounds and
+# rounded-corner masks per worker
+BACKGROUND_CACHE_MAX_BYTES = int(os.environ.get('BACKGROUND_CACHE_MAX_BYTES', 8 * 1024 * 1024))
+BACKGROUND_CACHE_SIZE = int(os.environ.get('BACKGROUND_CACHE_SIZE', 256))
+
+# Number of loaded font objects (family/size/weight variants) kept in memory per worker
+FONT_CACHE_SIZE = int(os.environ.get('FONT_CACHE_SIZE', 64))
+
+# Minimum seconds between checks of the font mapping/directory mtimes
+FONT_INDEX_CHECK_INTERVAL = float(os.environ.get('FONT_INDEX_CHECK_INTERVAL', 5))
+
+# Google Fonts download settings (downloads run on a background worker)
+GOOGLE_FONTS_CSS_URL = os.environ.get('GOOGLE_FONTS_CSS_URL', 'https://fonts.googleapis.com/css2')
+FONT_DOWNLOAD_TIMEOUT = float(os.environ.get('FONT_DOWNLOAD_TIMEOUT', 10))
+FONT_NEGATIVE_CACHE_TTL = int(os.environ.get('FONT_NEGATIVE_CACHE_TTL', 3600))  # seconds before a failed family is retried
+
+# Set by docker-entrypoint.sh when gunicorn creates the app once in its master (--preload)
+# and forks the workers from it: the preloaded fonts are then frozen out of the garbage
+# collector, and gunicorn.conf.py starts the image cleanup scheduler in each worker
+PRELOAD_APP = os.environ.get('PRELOAD_APP', 'False').lower() == 'true'
+
+# Fonts loaded into the font cache at worker boot, as "Family:size[:weight]" entries
+# separated by commas (e.g. "Roboto:36,Noto Sans Arabic:36:700")
+def _parse_font_preload(value):
+    preload = []
+    for entry in value.split(','):
+        parts = [part.strip() for part in entry.split(':')]
+        if len(parts) < 2 or not parts[0]:
+            continue
+        family, size = parts[0], int(parts[1])
+        weight = int(parts[2]) if len(parts) > 2 else 400
+        preload.append((family, size, weight))
+    return preload
+
+FONT_PRELOAD = _parse_font_preload(os.environ.get('FONT_PRELOAD', f'{DEFAULT_FONT_FAMILY}:{DEFAULT_FONT_SIZE},{RTL_FONT_FAMILY}:{DEFAULT_FONT_SIZE}'))
+
+# Fallback chain for characters the requested font does not cover: family names or
+# absolute font file paths, comma separated (missing files are skipped)
+FONT_FALLBACK_CHAIN = [entry.strip() for entry in os.environ.get(
+    'FONT_FALLBACK_CHAIN',
+    f'{RTL_FONT_FAMILY},Noto Sans,/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc'
+).split(',') if entry.strip()]
@@ -46,5 +46,9 @@ if [ "$1" = "dev" ]; then
     exec python -m run --port $PORT --debug --request-timeout $REQUEST_TIMEOUT --task-timeout $TASK_TIMEOUT
 else
     echo "Running in production mode with timeouts: REQUEST=$REQUEST_TIMEOUT, TASK=$TASK_TIMEOUT, SESSION=$SESSION_TIMEOUT"
-    exec gunicorn --bind 0.0.0.0:$PORT --workers 4 --timeout $REQUEST_TIMEOUT "run:create_app()"
+    # --preload creates the app (and warms the font cache) once in the master,
+    # so the forked workers share the loaded fonts copy-on-write; PRELOAD_APP
+    # tells the app, and gunicorn.conf.py starts the cleanup scheduler per worker
+    export PRELOAD_APP=true
+    exec gunicorn --config gunicorn.conf.py --bind 0.0.0.0:$PORT --workers 4 --preload --timeout $REQUEST_TIMEOUT "run:create_app()"
 fi 
\ No newline at end of file
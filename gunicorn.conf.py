@@ -0,0 +1,14 @@
+#!/usr/bin/env python3
+"""
+Gunicorn settings for Dila Headless Image Editor
+
+With --preload the app is created once in the master, where a background
+thread would not be inherited by the forked workers, so the image cleanup
+scheduler is started in each worker after the fork.
+"""
+
+def post_fork(server, worker):
+    """Start the image cleanup scheduler in a newly forked worker"""
+    if server.cfg.preload_app:
+        from app import start_scheduler
+        start_scheduler(worker.app.wsgi())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+JPEG Decode Benchmark
+
+Times decoding plus crop_to_fit for large phone-camera sized JPEGs, with
+full-size decoding and with reduced-scale (draft) decoding, and reports the
+size of the decoded pixel buffer. As a quality guard, the draft result is
+compared against the full-decode result (PSNR); the script exits with
+status 1 if any case falls below --min-psnr.
+
+The sources are synthesized from static/sample.jpg (upscaled, with some
+grain and fine lines so the downscale has detail to lose).
+
+Usage: python tools/diagnostics/benchmark_decode.py [--repeat N] [--oversampling X] [--min-psnr DB]
+"""
+
+import os
+import sys
+import math
+import time
+import argparse
+import logging
+from io import BytesIO
+from PIL import Image, ImageChops, ImageDraw, ImageStat
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+project_root = os.path.abspath(os.path.join(script_dir, '../..'))
+sys.path.insert(0, project_root)
+os.chdir(project_root)
+
+from app.core.image_processing import crop_to_fit, DEFAULT_DRAFT_OVERSAMPLING
+
+SAMPLE_IMAGE = os.path.join(project_root, 'static', 'sample.jpg')
+
+# 12 MP and 24 MP landscape photos, and a 12 MP portrait one
+SOURCES = [(4032, 3024), (6000, 4000), (3024, 4032)]
+TARGETS = [(1200, 630), (1080, 1920), (540, 960)]
+
+def make_photo(width, height):
+    """Encode a photo-like JPEG of the given size"""
+    base = Image.open(SAMPLE_IMAGE).convert('RGB').resize((width, height), Image.BICUBIC)
+    grain = Image.effect_noise((width, height), 24).convert('RGB')
+    img = Image.blend(base, grain, 0.05)
+    draw = ImageDraw.Draw(img)
+    for x in range(0, width, 41):
+        draw.line((x, 0, x + height // 3, height), fill=(255, 255, 255), width=1)
+    output = BytesIO()
+    img.save(output, format='JPEG', quality=90)
+    return output.getvalue()
+
+def psnr(a, b):
+    """Peak signal-to-noise ratio between two RGB images in dB"""
+    mse = sum(rms * rms for rms in ImageStat.Stat(ImageChops.difference(a, b)).rms) / 3
+    return float('inf') if mse == 0 else 20 * math.log10(255 / math.sqrt(mse))
+
+def decode_and_crop(data, width, height, oversampling):
+    """Open, decode and crop_to_fit one image; returns the result and the decoded size"""
+    img = Image.open(BytesIO(data))
+    result = crop_to_fit(img, width, height, draft_oversampling=oversampling)
+    return result, img.size
+
+def timed(function, repeat):
+    function()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return result, (time.perf_counter() - start) * 1000 / repeat
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark reduced-scale JPEG decoding')
+    parser.add_argument('--repeat', type=int, default=3, help='Repetitions per case')
+    parser.add_argument('--oversampling', type=float, default=DEFAULT_DRAFT_OVERSAMPLING,
+                        help='draft_oversampling passed to crop_to_fit')
+    parser.add_argument('--min-psnr', type=float, default=38.0,
+                        help='Lowest acceptable PSNR against the full decode (dB)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    failures = 0
+    print(f"{'source':<12}{'target':<12}{'full ms':>9}{'draft ms':>10}{'decoded':>12}"
+          f"{'full MiB':>10}{'draft MiB':>11}{'PSNR dB':>9}")
+    for source_width, source_height in SOURCES:
+        data = make_photo(source_width, source_height)
+        for width, height in TARGETS:
+            (full, full_size), full_ms = timed(
+                lambda: decode_and_crop(data, width, height, None), args.repeat)
+            (draft, draft_size), draft_ms = timed(
+                lambda: decode_and_crop(data, width, height, args.oversampling), args.repeat)
+            quality = psnr(full, draft)
+            if quality < args.min_psnr:
+                failures += 1
+
+            # Pillow stores RGB pixels in 4 bytes
+            full_mib = full_size[0] * full_size[1] * 4 / 2 ** 20
+            draft_mib = draft_size[0] * draft_size[1] * 4 / 2 ** 20
+            print(f"{f'{source_width}x{source_height}':<12}{f'{width}x{height}':<12}{full_ms:>9.0f}{draft_ms:>10.0f}"
+                  f"{f'{draft_size[0]}x{draft_size[1]}':>12}{full_mib:>10.1f}{draft_mib:>11.1f}{quality:>9.1f}"
+                  f"{'  below --min-psnr' if quality < args.min_psnr else ''}")
+
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
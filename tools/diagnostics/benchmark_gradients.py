@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Gradient Benchmark
+
+Compares create_gradient_background against the previous implementation,
+which drew one line per row, column or diagonal from Python, across
+container sizes and directions. Reports timings and the largest
+per-channel difference between both outputs, then times gradient specs
+the previous implementation did not support (multi-stop, angled, radial).
+
+Usage: python tools/diagnostics/benchmark_gradients.py [--repeat N]
+"""
+
+import os
+import sys
+import time
+import argparse
+import logging
+from PIL import Image, ImageChops, ImageDraw
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+project_root = os.path.abspath(os.path.join(script_dir, '../..'))
+sys.path.insert(0, project_root)
+os.chdir(project_root)
+
+from app.core.image_processing import create_gradient_background
+
+# Caption containers (small, typical landscape and portrait) up to a full portrait frame
+SIZES = [(200, 60), (540, 120), (972, 168), (1080, 600), (1080, 1920)]
+DIRECTIONS = ['vertical', 'horizontal', 'diagonal']
+COLORS = [(255, 60, 172, 255), (120, 75, 160, 128)]
+STOPS = ['#FF3CAC', {'color': '#784BA0CC', 'position': 0.6}, '#2B86C5', '#FFFFFF', '#000000']
+NEW_DIRECTIONS = [120, 'radial']
+
+def reference_gradient(width, height, colors, direction):
+    """The previous implementation: one draw.line per row, column or diagonal"""
+    gradient = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(gradient)
+    start, end = colors
+
+    def color_at(progress):
+        return tuple(int(start[channel] + (end[channel] - start[channel]) * progress) for channel in range(4))
+
+    if direction == 'vertical':
+        for y in range(height):
+            draw.line([(0, y), (width, y)], fill=color_at(y / height))
+    elif direction == 'horizontal':
+        for x in range(width):
+            draw.line([(x, 0), (x, height)], fill=color_at(x / width))
+    else:
+        for i in range(width + height):
+            draw.line([(0, i), (i, 0)], fill=color_at(i / (width + height)))
+    return gradient
+
+def timed(function, repeat):
+    function()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return result, (time.perf_counter() - start) * 1000 / repeat
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark gradient generation')
+    parser.add_argument('--repeat', type=int, default=10, help='Repetitions per case')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    print(f"{'size':<12}{'direction':<12}{'old ms':>9}{'new ms':>9}{'speedup':>9}{'max diff':>10}")
+    for width, height in SIZES:
+        for direction in DIRECTIONS:
+            old, old_ms = timed(lambda: reference_gradient(width, height, COLORS, direction), args.repeat)
+            new, new_ms = timed(lambda: create_gradient_background(width, height, COLORS, direction), args.repeat)
+            max_diff = max(high for _, high in ImageChops.difference(old, new).getextrema())
+            print(f"{f'{width}x{height}':<12}{direction:<12}{old_ms:>9.2f}{new_ms:>9.2f}"
+                  f"{old_ms / new_ms:>8.0f}x{max_diff:>10}")
+
+    print(f"\n{len(STOPS)} stops")
+    print(f"{'size':<12}{'direction':<12}{'ms':>9}")
+    for width, height in SIZES:
+        for direction in NEW_DIRECTIONS:
+            _, ms = timed(lambda: create_gradient_background(width, height, STOPS, direction), args.repeat)
+            print(f"{f'{width}x{height}':<12}{str(direction):<12}{ms:>9.2f}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Text Overlay Memory Benchmark
+
+Measures the peak memory of one process_custom style request (decode,
+crop, text overlay, PNG encode) with the overlay drawn on a copy of the
+image and drawn in place. Each measurement runs in a fresh process, and
+reports both the tracemalloc peak and the growth of the peak RSS
+(ru_maxrss) during the request, since Pillow's pixel buffers are not
+allocated through the Python allocator that tracemalloc traces.
+
+Usage: python tools/diagnostics/benchmark_memory.py [--width W] [--height H]
+"""
+
+import os
+import sys
+import json
+import argparse
+import logging
+import resource
+import subprocess
+import tracemalloc
+from io import BytesIO
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+project_root = os.path.abspath(os.path.join(script_dir, '../..'))
+sys.path.insert(0, project_root)
+os.chdir(project_root)
+
+SAMPLE_IMAGE = os.path.join(project_root, 'static', 'sample.jpg')
+
+def peak_rss_kb():
+    """Peak resident set size of this process in KiB (Linux reports ru_maxrss in KiB)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def run_request(width, height, in_place):
+    """Measure one request in this process and print the result as JSON"""
+    from PIL import Image
+    from app.core.image_processing import apply_text_layers, crop_to_fit
+
+    layers = [
+        {'text': 'Summer Sale', 'language': 'en', 'font_family': 'Roboto', 'font_size': 72,
+         'text_color': (255, 255, 255, 255), 'bg_color': (0, 0, 0, 160), 'alignment': 'top-center'},
+        {'text': 'مرحبا بالعالم', 'language': 'ar', 'font_family': 'Noto Sans Arabic', 'font_size': 48,
+         'text_color': (255, 255, 255, 255), 'bg_color': (0, 0, 0, 255), 'alignment': 'bottom-center'},
+    ]
+
+    # Warm the font, layout and glyph caches on a small image, so only the
+    # per-request allocations are measured
+    warm = Image.new('RGB', (width // 8, height // 8))
+    apply_text_layers(warm, layers, in_place=True)
+
+    with open(SAMPLE_IMAGE, 'rb') as f:
+        data = f.read()
+
+    rss_before = peak_rss_kb()
+    tracemalloc.start()
+
+    img = Image.open(BytesIO(data))
+    img = crop_to_fit(img, width, height)
+    result = apply_text_layers(img, layers, in_place=in_place)
+    output = BytesIO()
+    result.save(output, format='PNG')
+
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = peak_rss_kb()
+
+    print(json.dumps({
+        'tracemalloc_peak_kb': traced_peak // 1024,
+        'rss_growth_kb': rss_after - rss_before,
+        'peak_rss_kb': rss_after
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark text overlay memory use')
+    parser.add_argument('--width', type=int, default=1080, help='Output width')
+    parser.add_argument('--height', type=int, default=1920, help='Output height')
+    parser.add_argument('--child', choices=['copy', 'in_place'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    if args.child:
+        run_request(args.width, args.height, args.child == 'in_place')
+        return 0
+
+    # Pillow stores RGB pixels in 4 bytes
+    frame_kb = args.width * args.height * 4 // 1024
+    print(f"{args.width}x{args.height} RGB frame: {frame_kb} KiB\n")
+    print(f"{'mode':<10}{'tracemalloc peak KiB':>22}{'peak RSS growth KiB':>22}{'peak RSS KiB':>15}")
+    for mode in ['copy', 'in_place']:
+        output = subprocess.run(
+            [sys.executable, os.path.realpath(__file__), '--child', mode,
+             '--width', str(args.width), '--height', str(args.height)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:<10}{result['tracemalloc_peak_kb']:>22}{result['rss_growth_kb']:>22}{result['peak_rss_kb']:>15}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Quality Tier Benchmark
+
+Times a process_custom style request (decode, crop_to_fit, text overlay,
+PNG encode) for each quality tier on the sample images and on a 12 MP
+photo-like JPEG (see benchmark_decode.py), and reports the output size and
+the PSNR of the result against the best tier.
+
+Usage: python tools/diagnostics/benchmark_quality.py [--repeat N]
+"""
+
+import os
+import sys
+import math
+import time
+import argparse
+import logging
+from io import BytesIO
+from PIL import Image, ImageChops, ImageStat
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+project_root = os.path.abspath(os.path.join(script_dir, '../..'))
+sys.path.insert(0, project_root)
+os.chdir(project_root)
+
+from app.core.image_processing import QUALITY_TIERS, apply_text_layers, crop_to_fit
+from tools.diagnostics.benchmark_decode import make_photo
+
+SAMPLE_IMAGES = ['static/sample.jpg', 'test_image.jpg']
+
+# Default output size, a portrait story and a preview thumbnail
+TARGETS = [(1200, 630), (1080, 1920), (540, 960), (300, 300)]
+
+LAYERS = [{'text': 'Summer Sale', 'language': 'en', 'font_family': 'Roboto', 'font_size': 48,
+           'text_color': (255, 255, 255, 255), 'bg_color': (0, 0, 0, 180), 'alignment': 'bottom-center',
+           'bg_curve': 10, 'container_margin': 20}]
+
+def process(data, width, height, tier):
+    """Run one request at a quality tier; returns the image and the encoded PNG size"""
+    img = Image.open(BytesIO(data))
+    img = crop_to_fit(img, width, height, **tier['resize'])
+    img = apply_text_layers(img, LAYERS, in_place=True)
+    output = BytesIO()
+    img.save(output, format='PNG', dpi=(300, 300), **tier['save'])
+    return img, output.tell()
+
+def psnr(a, b):
+    """Peak signal-to-noise ratio between two images in dB"""
+    mse = sum(rms * rms for rms in ImageStat.Stat(ImageChops.difference(a, b)).rms) / len(a.getbands())
+    return float('inf') if mse == 0 else 20 * math.log10(255 / math.sqrt(mse))
+
+def timed(function, repeat):
+    function()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return result, (time.perf_counter() - start) * 1000 / repeat
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the quality tiers')
+    parser.add_argument('--repeat', type=int, default=10, help='Repetitions per case')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    sources = []
+    for path in SAMPLE_IMAGES:
+        with open(path, 'rb') as f:
+            sources.append((os.path.basename(path), f.read()))
+    sources.append(('photo', make_photo(4032, 3024)))
+
+    print(f"{'image':<26}{'target':<12}{'tier':<10}{'ms':>8}{'PNG KiB':>9}{'PSNR dB':>9}")
+    for name, data in sources:
+        source_size = Image.open(BytesIO(data)).size
+        label = f"{name} {source_size[0]}x{source_size[1]}"
+        for width, height in TARGETS:
+            results = {}
+            for quality, tier in QUALITY_TIERS.items():
+                results[quality] = timed(lambda: process(data, width, height, tier), args.repeat)
+            reference = results['best'][0][0]
+            for quality, ((img, png_bytes), ms) in results.items():
+                print(f"{label:<26}{f'{width}x{height}':<12}{quality:<10}{ms:>8.1f}{png_bytes / 1024:>9.0f}"
+                      f"{psnr(reference, img):>9.1f}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
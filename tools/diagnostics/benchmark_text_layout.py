@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Text Layout Benchmark
+
+Compares the line wrapping of apply_custom_text against the previous
+per-word getbbox implementation on the repository's sample texts, checks
+that both produce identical lines and reports timings and the number of
+getbbox calls. Unspaced (Chinese/Japanese) samples are only timed: the
+previous implementation did not break them at ideographs, so their lines
+are expected to differ.
+
+Overlong words (wider than the line) are now split even when they follow
+other words on a line, and at grapheme cluster boundaries. Samples listed
+in OVERLONG_WORD_SAMPLES may differ where they contain such a word; those
+cases are listed separately as expected differences, and any other
+difference fails the run.
+
+Usage: python tools/diagnostics/benchmark_text_layout.py [--repeat N]
+"""
+
+import os
+import sys
+import time
+import argparse
+import logging
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+project_root = os.path.abspath(os.path.join(script_dir, '../..'))
+sys.path.insert(0, project_root)
+os.chdir(project_root)
+
+from app.core.font_utils import get_font, get_font_chain
+from app.core.text_layout import TextMeasurer, wrap_text
+
+SAMPLE_TEXTS = {
+    'english': "Hello, this is a test of English text rendering.",
+    'arabic': "مرحبا، هذا اختبار لعرض النص العربي.",
+    'kurdish': "سڵاو، ئەمە تاقیکردنەوەی دەرخستنی دەقی کوردییە.",
+    'mixed': "Hello مرحبا, this is a mixed نص مختلط with English and Arabic.",
+    'kurdish_long': "ئەو کەسەی لە هەڵەکانی نەترسێت، سەرکەوتوو دەبێت. گرنگ ئەوەیە کە بەردەوام بین لە فێربوون و گەشەکردن. سەرکەوتن پرۆسەیەکە، نەک مەنزڵێک.",
+    'kurdish_latin': "توێژینەوەی قوڵی OpenAI: یاریدەدەرێکی شۆڕشگێڕی زیرەکی دەستکرد بۆ توێژینەوە",
+    'caption_long': " ".join(["The quick brown fox jumps over the lazy dog while five boxing wizards jump quickly."] * 8),
+    'url': "Read more at https://example.com/" + "articles/image-editing-" * 12 + "guide",
+    'hashtag': "#" + "کوردستان" * 25,
+    'chinese': "我们每天都在学习新的东西，图像编辑器可以自动为社交媒体生成带有文字的图片。" * 3,
+    'japanese': "「東京」は日本の首都です。ちょっとした写真にも、キャプションを自動で追加できます。" * 3,
+    'cjk_latin': "新しいPythonライブラリでImage Editorを使って、毎日のSNS投稿を作成しましょう。" * 2,
+}
+
+# Samples the previous implementation treated as single overlong words
+UNSPACED_SAMPLES = ('chinese', 'japanese', 'cjk_latin')
+
+# Samples with words wider than some of the benchmarked line widths, which the previous
+# implementation left unsplit after other words (overflowing the container) or split
+# between a letter and its combining marks
+OVERLONG_WORD_SAMPLES = ('kurdish', 'kurdish_latin', 'url', 'hashtag')
+
+class CountingChain:
+    """Wraps a font chain and counts getbbox calls"""
+
+    def __init__(self, font_chain):
+        self.font_chain = font_chain
+        self.font = font_chain.font
+        self.bbox_calls = 0
+
+    def getbbox(self, text, direction=None, language=None):
+        self.bbox_calls += 1
+        return self.font_chain.getbbox(text, direction, language)
+
+    def getlength(self, text, direction=None, language=None):
+        return self.font_chain.getlength(text, direction, language)
+
+def reference_wrap(text, font_chain, max_width):
+    """The previous wrapping loop: two getbbox calls on the whole candidate line per word"""
+    lines = []
+    current_line = ""
+    for word in text.split():
+        test_line = current_line + " " + word if current_line else word
+        text_width = font_chain.getbbox(test_line)[2] - font_chain.getbbox(test_line)[0]
+        if text_width <= max_width:
+            current_line = test_line
+        elif current_line:
+            lines.append(current_line)
+            current_line = word
+        else:
+            current_part = ""
+            for char in word:
+                test_part = current_part + char
+                text_width = font_chain.getbbox(test_part)[2] - font_chain.getbbox(test_part)[0]
+                if text_width <= max_width:
+                    current_part = test_part
+                else:
+                    lines.append(current_part)
+                    current_part = char
+            if current_part:
+                current_line = current_part
+    if current_line:
+        lines.append(current_line)
+    return lines
+
+def has_overlong_word(text, font_chain, max_width):
+    """Whether any word of the text is wider than max_width"""
+    return any(font_chain.getbbox(word)[2] - font_chain.getbbox(word)[0] > max_width for word in text.split())
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark text wrapping')
+    parser.add_argument('--repeat', type=int, default=20, help='Repetitions per case')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    print(f"{'case':<16}{'font':<20}{'size':>5}{'width':>7}{'lines':>6}"
+          f"{'old ms':>9}{'new ms':>9}{'old bbox':>10}{'new bbox':>10}  same")
+    all_identical = True
+    expected_differences = []
+    for font_family in ['Noto Sans Arabic', 'Roboto']:
+        for font_size in [36, 64]:
+            font = get_font(font_family, font_size)
+            font_chain = get_font_chain(font, font_size)
+            for name, text in SAMPLE_TEXTS.items():
+                for max_width in [400, 1040]:
+                    old_chain = CountingChain(font_chain)
+                    start = time.perf_counter()
+                    for _ in range(args.repeat):
+                        old_lines = reference_wrap(text, old_chain, max_width)
+                    old_ms = (time.perf_counter() - start) * 1000 / args.repeat
+
+                    new_chain = CountingChain(font_chain)
+                    start = time.perf_counter()
+                    for _ in range(args.repeat):
+                        new_lines, _ = wrap_text(text, TextMeasurer(new_chain), max_width)
+                    new_ms = (time.perf_counter() - start) * 1000 / args.repeat
+
+                    if name in UNSPACED_SAMPLES:
+                        same = '-'
+                    elif old_lines == new_lines:
+                        same = 'yes'
+                    elif name in OVERLONG_WORD_SAMPLES and has_overlong_word(text, font_chain, max_width):
+                        expected_differences.append((name, font_family, font_size, max_width))
+                        same = 'expected'
+                    else:
+                        all_identical = False
+                        same = 'NO'
+                    print(f"{name:<16}{font_family:<20}{font_size:>5}{max_width:>7}{len(new_lines):>6}"
+                          f"{old_ms:>9.2f}{new_ms:>9.2f}{old_chain.bbox_calls // args.repeat:>10}"
+                          f"{new_chain.bbox_calls // args.repeat:>10}  {same}")
+
+    if expected_differences:
+        print("\nExpected differences (overlong words now split, including after other words):")
+        for name, font_family, font_size, max_width in expected_differences:
+            print(f"  {name:<16}{font_family:<20}{font_size:>5}{max_width:>7}")
+
+    print("\nAll other cases identical" if all_identical else "\nSOME CASES DIFFER")
+    return 0 if all_identical else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
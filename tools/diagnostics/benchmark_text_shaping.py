@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Text Shaping Benchmark
+
+Measures the cost of shaping RTL captions (arabic_reshaper + python-bidi,
+or Raqm where Pillow has it) on the Kurdish and Arabic test samples:
+without caches, with the shaped-line cache warm, and with the whole
+layout cached, plus the old unshaped get_display-only baseline.
+
+It also checks that every shaped line is joined consistently: with the
+basic layout a line must be either fully joined (presentation forms only)
+or left isolated (no presentation forms), never partly joined, which
+happens when a Kurdish letter missing from arabic_reshaper's table is
+reshaped. The script exits with status 1 if any line is partly joined.
+
+Usage: python tools/diagnostics/benchmark_text_shaping.py [--repeat N]
+"""
+
+import os
+import sys
+import time
+import unicodedata
+import argparse
+import logging
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+project_root = os.path.abspath(os.path.join(script_dir, '../..'))
+sys.path.insert(0, project_root)
+os.chdir(project_root)
+
+from bidi.algorithm import get_display
+from app.core import image_processing, text_shaping
+from app.core.image_processing import layout_custom_text
+from app.core.font_utils import get_font
+
+# Samples from tools/diagnostics/test_kurdish.py and docs/language_rendering_test.md
+SAMPLES = {
+    'kurdish': ('ckb', "توێژینەوەی قوڵی OpenAI: یاریدەدەرێکی شۆڕشگێڕی زیرەکی دەستکرد بۆ توێژینەوە"),
+    'kurdish_long': ('ckb', "ئەو کەسەی لە هەڵەکانی نەترسێت، سەرکەوتوو دەبێت. گرنگ ئەوەیە کە بەردەوام بین لە فێربوون و گەشەکردن. سەرکەوتن پرۆسەیەکە، نەک مەنزڵێک."),
+    'arabic': ('ar', "مرحبا، هذا اختبار لعرض النص العربي."),
+    'mixed': ('en', "Hello مرحبا, this is a mixed نص مختلط with English and Arabic."),
+}
+
+FONT_FAMILY = 'Noto Sans Arabic'
+IMAGE_SIZE = (1080, 1920)
+
+def joining(line):
+    """
+    Classify how the Arabic-script letters of a shaped line are joined
+
+    Returns:
+        str: 'joined' (presentation forms only), 'isolated' (no presentation forms),
+        'partial' (both) or '-' (no Arabic-script letters)
+    """
+    forms = sum(1 for ch in line if 0xFB50 <= ord(ch) <= 0xFDFF or 0xFE70 <= ord(ch) <= 0xFEFF)
+    letters = sum(1 for ch in line if 0x0600 <= ord(ch) <= 0x08FF and unicodedata.category(ch) == 'Lo')
+    if forms and letters:
+        return 'partial'
+    return 'joined' if forms else 'isolated' if letters else '-'
+
+def timed(function, repeat):
+    """Return the best time of function() over repeat runs in ms"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark RTL text shaping')
+    parser.add_argument('--repeat', type=int, default=50, help='Repetitions per measurement')
+    parser.add_argument('--font-size', type=int, default=48, help='Font size')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    font = get_font(FONT_FAMILY, args.font_size)
+    raqm = text_shaping.LineShaper('ar', True, font).raqm
+    print(f"Layout engine: {'raqm' if raqm else 'basic'}\n")
+    print(f"{'sample':<14}{'lines':>6}{'get_display':>13}{'uncached':>10}{'shaped':>10}{'layout hit':>12}  joining")
+    print(f"{'':<14}{'':>6}{'only (ms)':>13}{'(ms)':>10}{'warm (ms)':>10}{'(ms)':>12}")
+    partial = 0
+
+    for name, (language, text) in SAMPLES.items():
+        def layout():
+            return layout_custom_text(IMAGE_SIZE, text, language, FONT_FAMILY, args.font_size)
+
+        def uncached():
+            image_processing._layout_cache.clear()
+            text_shaping._shaping_cache.clear()
+            layout()
+
+        def shaped_warm():
+            image_processing._layout_cache.clear()
+            layout()
+
+        lines = layout().lines
+        # With Raqm the lines stay in logical order and Pillow joins the letters
+        states = ['raqm'] if raqm else sorted({joining(line) for line in lines})
+        partial += 'partial' in states
+        baseline = timed(lambda: [get_display(line) for line in lines], args.repeat)
+        print(f"{name:<14}{len(lines):>6}{baseline:>13.3f}{timed(uncached, args.repeat):>10.3f}"
+              f"{timed(shaped_warm, args.repeat):>10.3f}{timed(layout, args.repeat):>12.4f}  {', '.join(states)}")
+
+    print(f"\nShaping cache: {text_shaping.get_shaping_cache_stats()}")
+    if partial:
+        print(f"{partial} sample(s) have partly joined lines")
+    return 1 if partial else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
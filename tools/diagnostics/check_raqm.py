@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Raqm Layout Check
+
+Checks that Pillow has the Raqm text layout (libraqm with FriBiDi and
+HarfBuzz), which the fonts are then loaded with. Without it, text takes the
+basic layout path, where Kurdish letters that have no Unicode presentation
+forms are drawn unjoined. Run by the Docker build, which fails if Raqm is
+missing.
+
+Usage: python tools/diagnostics/check_raqm.py
+"""
+
+import os
+import sys
+import logging
+from PIL import features
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+project_root = os.path.abspath(os.path.join(script_dir, '../..'))
+sys.path.insert(0, project_root)
+os.chdir(project_root)
+
+from app.core.font_utils import get_font
+from app.core.text_shaping import LineShaper
+
+def main():
+    logging.basicConfig(level=logging.ERROR)
+    for feature in ('raqm', 'fribidi', 'harfbuzz'):
+        print(f"{feature:<10}{features.version_feature(feature) or 'not available'}")
+
+    if not features.check('raqm'):
+        print("Raqm is not available: install libraqm0 and libfribidi0")
+        return 1
+    if not LineShaper('ckb', True, get_font('Noto Sans Arabic', 36)).raqm:
+        print("Fonts are not loaded with the Raqm layout")
+        return 1
+    print("Raqm layout in use")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
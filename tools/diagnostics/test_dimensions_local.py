@@ -4,12 +4,39 @@ Local Dimension Testing Script for Dila Headless Image Editor
 
 This script tests image dimension handling with visual verification
 using the local image processing functions directly.
+
+With --benchmark, it instead times crop_to_fit (one resize of the crop box)
+against cropping a copy and resizing it, across source/target ratios, and
+reports the peak memory of each in a fresh process.
 """
 
 import argparse
 import os
+import sys
+import json
+import time
+import resource
+import subprocess
 from PIL import Image, ImageDraw, ImageFont
-from image_processing import crop_to_fit, apply_custom_text
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+project_root = os.path.abspath(os.path.join(script_dir, '../..'))
+sys.path.insert(0, project_root)
+os.chdir(project_root)
+
+from app.core.image_processing import crop_to_fit, apply_custom_text
+
+# Source and target sizes for --benchmark: phone photos to the usual output sizes,
+# large reductions, and near 1:1 resizes
+BENCHMARK_CASES = [
+    ((4032, 3024), (1200, 630)),
+    ((4032, 3024), (1080, 1920)),
+    ((6000, 4000), (1080, 1920)),
+    ((6000, 4000), (540, 960)),
+    ((6000, 4000), (300, 300)),
+    ((1200, 630), (1080, 1920)),
+    ((1080, 1920), (1080, 1350))
+]
 
 def create_dimension_test_image(width, height, output_path="dimension_test.jpg"):
     """Create a test image with gridlines to verify dimensions"""
@@ -98,16 +125,87 @@ def test_dimensions_locally(width, height, text, language="ckb", container_width
     print(f"Resized image saved to {resized_output}")
     print(f"Resized dimensions: {resized_img.width}x{resized_img.height}")
 
+def crop_then_resize(img, target_width, target_height):
+    """The previous crop_to_fit: crop a copy of the centered box, then LANCZOS-resize it"""
+    src_width, src_height = img.size
+    target_aspect = target_width / target_height
+    if src_width / src_height > target_aspect:
+        new_width = int(target_aspect * src_height)
+        offset = (src_width - new_width) // 2
+        cropped = img.crop((offset, 0, offset + new_width, src_height))
+    else:
+        new_height = int(src_width / target_aspect)
+        offset = (src_height - new_height) // 2
+        cropped = img.crop((0, offset, src_width, offset + new_height))
+    return cropped.resize((target_width, target_height), Image.LANCZOS)
+
+def run_benchmark_case(method, source_size, target_size, repeat):
+    """Time one crop/resize method in this process and print the result as JSON"""
+    resize = crop_to_fit if method == 'fused' else crop_then_resize
+    
+    # A decoded photo-sized source (loaded, so only the crop and resize are measured)
+    source = Image.open(os.path.join(project_root, 'static', 'sample.jpg')).convert('RGB')
+    source = source.resize(source_size, Image.BICUBIC)
+    
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    for _ in range(repeat):
+        resize(source, *target_size)
+    elapsed_ms = (time.perf_counter() - start) * 1000 / repeat
+    rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+    
+    print(json.dumps({'ms': elapsed_ms, 'rss_growth_kb': rss_growth}))
+
+def benchmark_crop_to_fit(repeat):
+    """Compare crop_to_fit against crop-then-resize across source/target ratios"""
+    print(f"{'source':<12}{'target':<12}{'ratio':>7}{'crop+resize ms':>16}{'fused ms':>10}"
+          f"{'crop+resize peak KiB':>22}{'fused peak KiB':>16}")
+    for source_size, target_size in BENCHMARK_CASES:
+        results = {}
+        for method in ['crop', 'fused']:
+            output = subprocess.run(
+                [sys.executable, os.path.realpath(__file__), '--benchmark-child', method,
+                 '--source', f'{source_size[0]}x{source_size[1]}',
+                 '--target', f'{target_size[0]}x{target_size[1]}', '--repeat', str(repeat)],
+                capture_output=True, text=True, check=True
+            ).stdout
+            results[method] = json.loads(output.strip().splitlines()[-1])
+        
+        # Linear downscale factor of the crop
+        ratio = min(source_size[0] / target_size[0], source_size[1] / target_size[1])
+        print(f"{f'{source_size[0]}x{source_size[1]}':<12}{f'{target_size[0]}x{target_size[1]}':<12}{ratio:>7.2f}"
+              f"{results['crop']['ms']:>16.1f}{results['fused']['ms']:>10.1f}"
+              f"{results['crop']['rss_growth_kb']:>22}{results['fused']['rss_growth_kb']:>16}")
+
+def _size(value):
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
 def main():
     parser = argparse.ArgumentParser(description="Test image dimensions with visual verification")
-    parser.add_argument("width", type=int, help="Width in pixels")
-    parser.add_argument("height", type=int, help="Height in pixels")
+    parser.add_argument("width", type=int, nargs="?", help="Width in pixels")
+    parser.add_argument("height", type=int, nargs="?", help="Height in pixels")
     parser.add_argument("--text", default="بەرەو خۆر هەنگاو بنێ، سێبەرەکان دەکەونە پشتت", 
                         help="Text to overlay on the image")
     parser.add_argument("--language", default="ckb", help="Language code")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Benchmark crop_to_fit across source/target ratios instead")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions per benchmark case")
+    parser.add_argument("--benchmark-child", choices=["crop", "fused"], help=argparse.SUPPRESS)
+    parser.add_argument("--source", type=_size, help=argparse.SUPPRESS)
+    parser.add_argument("--target", type=_size, help=argparse.SUPPRESS)
     
     args = parser.parse_args()
     
+    if args.benchmark_child:
+        run_benchmark_case(args.benchmark_child, args.source, args.target, args.repeat)
+        return
+    if args.benchmark:
+        benchmark_crop_to_fit(args.repeat)
+        return
+    if args.width is None or args.height is None:
+        parser.error("width and height are required unless --benchmark is given")
+    
     test_dimensions_locally(args.width, args.height, args.text, args.language)
 
 if __name__ == "__main__":
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Tests for the background Google Fonts download
+
+Serves a stand-in for the Google Fonts CSS API and font files from a local
+http.server thread (slow, failing or hanging per family) and checks that
+get_font never waits for a download, that failed downloads are not retried
+while negatively cached, that a font is used once its download is done, and
+that the latin subset is picked from CSS split into subsets.
+
+Usage: python tools/diagnostics/test_font_download.py
+"""
+
+import os
+import sys
+import time
+import shutil
+import logging
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+project_root = os.path.abspath(os.path.join(script_dir, '../..'))
+sys.path.insert(0, project_root)
+os.chdir(project_root)
+
+from app.core import font_utils
+
+FONTS_DIR = Path(project_root) / 'fonts'
+
+# Served as the downloaded font; the bundled Regular is the fallback
+FALLBACK_FONT = 'NotoSansArabic-Regular.ttf'
+SERVED_FONT = 'NotoSansArabic-Bold.ttf'
+FALLBACK_FAMILY = 'Noto Sans Arabic'
+
+class _StandInServer:
+    """
+    Local stand-in for the Google Fonts CSS API
+
+    /css2?family=<name> answers 404 for families in failing, waits
+    delays[family] seconds for others, and points at /font/<name>, which is
+    held back until release is set. Families in subsetted get the CSS
+    browsers get, with a @font-face rule per unicode-range subset.
+    """
+
+    def __init__(self):
+        self.failing = set()
+        self.subsetted = set()
+        self.delays = {}
+        self.release = threading.Event()
+        self.requests = []
+        self.font_data = (FONTS_DIR / SERVED_FONT).read_bytes()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                server.requests.append(url.path + '?' + url.query if url.query else url.path)
+                if url.path == '/css2':
+                    family = parse_qs(url.query)['family'][0].split(':')[0]
+                    time.sleep(server.delays.get(family, 0))
+                    if family in server.failing:
+                        self._reply(404, b'Not found', 'text/plain')
+                        return
+                    font_url = f"http://127.0.0.1:{server.port}/font/{family}"
+                    if family in server.subsetted:
+                        css = ''.join(
+                            f"/* {subset} */\n@font-face {{\n  font-family: '{family}';\n"
+                            f"  src: url({font_url}-{subset}.woff2) format('woff2');\n}}\n"
+                            for subset in ('cyrillic-ext', 'greek', 'latin-ext', 'latin')
+                        )
+                    else:
+                        css = f"@font-face {{\n  font-family: '{family}';\n  src: url({font_url}.ttf) format('truetype');\n}}\n"
+                    self._reply(200, css.encode(), 'text/css')
+                elif url.path.startswith('/font/'):
+                    server.release.wait(10)
+                    self._reply(200, server.font_data, 'font/ttf')
+                else:
+                    self._reply(404, b'Not found', 'text/plain')
+
+            def _reply(self, status, body, content_type):
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', content_type)
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except OSError:
+                    pass  # The client gave up (timeout)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def font_requests(self):
+        """Paths of the font files requested"""
+        return [path for path in self.requests if path.startswith('/font/')]
+
+    def css_requests(self, family):
+        """Number of CSS requests made for a family"""
+        query = f"family={family.replace(' ', '+')}"
+        return sum(1 for path in self.requests if path.startswith('/css2?' + query))
+
+    def close(self):
+        self.release.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+class TestFontDownload(unittest.TestCase):
+    """get_font with Google Fonts downloads served by a local stand-in server"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        fonts_dir = Path(self.temp_dir.name)
+        self.google_fonts_dir = fonts_dir / 'google_fonts'
+        self.google_fonts_dir.mkdir()
+        shutil.copy(FONTS_DIR / FALLBACK_FONT, fonts_dir / FALLBACK_FONT)
+        self.fallback_path = os.path.abspath(fonts_dir / FALLBACK_FONT)
+
+        self.server = _StandInServer()
+        self.addCleanup(self.server.close)
+
+        # Throwaway fonts directory, stand-in server, and a fresh index and downloader
+        self.downloader = font_utils._FontDownloader(negative_ttl=60)
+        patches = [
+            mock.patch.multiple(
+                font_utils,
+                FONTS_DIR=fonts_dir,
+                GOOGLE_FONTS_CACHE_DIR=self.google_fonts_dir,
+                GOOGLE_FONTS_MAPPING_FILE=fonts_dir / 'google_fonts_mapping.json',
+                FONT_CATALOG_FILE=fonts_dir / 'font_catalog.json',
+                GOOGLE_FONTS_CSS_URL=f"http://127.0.0.1:{self.server.port}/css2",
+                _download_timeout=1
+            ),
+            mock.patch.object(font_utils, '_font_index', font_utils._FontIndex()),
+            mock.patch.object(font_utils, '_font_downloader', self.downloader)
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def get_font(self, font_family):
+        """get_font with the bundled fallback; returns the font and the seconds it took"""
+        start = time.perf_counter()
+        font = font_utils.get_font(font_family, 36, fallback_family=FALLBACK_FAMILY)
+        return font, time.perf_counter() - start
+
+    def test_fallback_returned_while_downloading(self):
+        """get_font does not wait for a slow download and picks the font up once it is done"""
+        font, elapsed = self.get_font('Lobster')
+        self.assertEqual(font.path, self.fallback_path)
+        self.assertLess(elapsed, 0.5)
+
+        # Still downloading (the font file is held back): no second request, same fallback
+        font, elapsed = self.get_font('Lobster')
+        self.assertEqual(font.path, self.fallback_path)
+        self.assertLess(elapsed, 0.5)
+
+        self.server.release.set()
+        self.downloader.join()
+        font, _ = self.get_font('Lobster')
+        self.assertEqual(font.path, os.path.abspath(self.google_fonts_dir / 'lobster_400_normal.ttf'))
+        self.assertEqual(self.server.css_requests('Lobster'), 1)
+        self.assertEqual(self.server.font_requests(), ['/font/Lobster.ttf'])
+        self.assertEqual(os.listdir(self.google_fonts_dir), ['lobster_400_normal.ttf'])
+
+    def test_subsetted_css_uses_latin_subset(self):
+        """Of CSS split into subsets, the latin subset is downloaded rather than the first one"""
+        self.server.subsetted.add('Lobster')
+        self.server.release.set()
+        self.get_font('Lobster')
+        self.downloader.join()
+        self.assertEqual(self.server.font_requests(), ['/font/Lobster-latin.woff2'])
+        self.assertEqual(os.listdir(self.google_fonts_dir), ['lobster_400_normal.ttf'])
+
+    def test_failed_download_is_negatively_cached(self):
+        """A failed download is not retried until its negative cache entry expires"""
+        self.downloader.negative_ttl = 1
+        self.server.failing.add('Missing Family')
+        font, elapsed = self.get_font('Missing Family')
+        self.assertEqual(font.path, self.fallback_path)
+        self.assertLess(elapsed, 0.5)
+        self.downloader.join()
+
+        for _ in range(5):
+            font, _ = self.get_font('Missing Family')
+            self.assertEqual(font.path, self.fallback_path)
+        self.downloader.join()
+        self.assertEqual(self.server.css_requests('Missing Family'), 1)
+
+        # Once the entry has expired the download is tried again
+        time.sleep(1.1)
+        self.server.failing.discard('Missing Family')
+        self.server.release.set()
+        self.get_font('Missing Family')
+        self.downloader.join()
+        font, _ = self.get_font('Missing Family')
+        self.assertEqual(self.server.css_requests('Missing Family'), 2)
+        self.assertEqual(font.path, os.path.abspath(self.google_fonts_dir / 'missingfamily_400_normal.ttf'))
+
+    def test_timed_out_download_is_negatively_cached(self):
+        """A server slower than the download timeout counts as a failed download"""
+        self.server.delays['Slow Family'] = 3
+        font, elapsed = self.get_font('Slow Family')
+        self.assertEqual(font.path, self.fallback_path)
+        self.assertLess(elapsed, 0.5)
+
+        self.downloader.join()
+        self.assertTrue(self.downloader.is_failed(font_utils._google_font_id('Slow Family')))
+        self.get_font('Slow Family')
+        self.downloader.join()
+        self.assertEqual(self.server.css_requests('Slow Family'), 1)
+        self.assertEqual(os.listdir(self.google_fonts_dir), [])
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.ERROR)
+    unittest.main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Tests for font path resolution with bundled and downloaded Google Fonts
+
+Builds a throwaway fonts directory holding both bundled Noto Sans Arabic
+files and downloaded Google Fonts variants of the same family, and checks
+that get_font_path resolves to the bundled files whatever has been
+downloaded.
+
+Usage: python tools/diagnostics/test_font_resolution.py
+"""
+
+import os
+import sys
+import shutil
+import logging
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+project_root = os.path.abspath(os.path.join(script_dir, '../..'))
+sys.path.insert(0, project_root)
+os.chdir(project_root)
+
+from app.core import font_utils
+
+FONTS_DIR = Path(project_root) / 'fonts'
+
+BUNDLED_FONTS = ['NotoSansArabic-Regular.ttf', 'NotoSansArabic-Bold.ttf']
+DOWNLOADED_FONTS = ['notosansarabic_400_normal.ttf', 'notosansarabic_700_normal.ttf', 'roboto_400_normal.ttf']
+
+class TestFontResolution(unittest.TestCase):
+    """get_font_path with a family present both locally and in google_fonts"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.fonts_dir = Path(self.temp_dir.name)
+        google_fonts_dir = self.fonts_dir / 'google_fonts'
+        google_fonts_dir.mkdir()
+        for name in BUNDLED_FONTS:
+            shutil.copy(FONTS_DIR / name, self.fonts_dir / name)
+        for name in DOWNLOADED_FONTS:
+            shutil.copy(FONTS_DIR / 'google_fonts' / name, google_fonts_dir / name)
+
+        paths_patch = mock.patch.multiple(
+            font_utils,
+            FONTS_DIR=self.fonts_dir,
+            GOOGLE_FONTS_CACHE_DIR=google_fonts_dir,
+            GOOGLE_FONTS_MAPPING_FILE=self.fonts_dir / 'google_fonts_mapping.json',
+            FONT_CATALOG_FILE=self.fonts_dir / 'font_catalog.json'
+        )
+        paths_patch.start()
+        self.addCleanup(paths_patch.stop)
+
+        # A fresh index over the throwaway directory, and no downloads
+        index_patch = mock.patch.object(font_utils, '_font_index', font_utils._FontIndex())
+        index_patch.start()
+        self.addCleanup(index_patch.stop)
+        download_patch = mock.patch.object(font_utils._font_downloader, 'request', return_value=False)
+        self.request = download_patch.start()
+        self.addCleanup(download_patch.stop)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_bundled_family_prefers_local_files(self):
+        """A family with bundled files never resolves to its downloaded variants"""
+        regular = font_utils.get_font_path('Noto Sans Arabic', 400)
+        bold = font_utils.get_font_path('Noto Sans Arabic', 700)
+        self.assertEqual(regular, os.path.abspath(self.fonts_dir / 'NotoSansArabic-Regular.ttf'))
+        self.assertEqual(bold, os.path.abspath(self.fonts_dir / 'NotoSansArabic-Bold.ttf'))
+        self.request.assert_not_called()
+
+    def test_downloaded_family_uses_download(self):
+        """A family without bundled files resolves to its downloaded variant"""
+        font_path = font_utils.get_font_path('Roboto', 400)
+        self.assertEqual(font_path, os.path.abspath(self.fonts_dir / 'google_fonts' / 'roboto_400_normal.ttf'))
+        self.request.assert_not_called()
+
+    def test_unknown_family_is_downloaded(self):
+        """A family that is neither bundled nor downloaded is queued for download"""
+        self.assertIsNone(font_utils.get_font_path('Lobster', 400))
+        self.request.assert_called_once_with('Lobster', 400, 'normal')
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.ERROR)
+    unittest.main()
@@ -20,7 +20,7 @@ project_root = os.path.abspath(os.path.join(script_dir, '../..'))
 sys.path.insert(0, project_root)
 
 from PIL import Image, ImageDraw, ImageFont
-from app.core.image_processing import apply_custom_text, crop_to_fit
+from app.core.image_processing import DEFAULT_QUALITY, QUALITY_TIERS, apply_custom_text, crop_to_fit
 from app.core.font_utils import get_font, get_available_fonts
 
 # Configure logging
@@ -45,7 +45,8 @@ def process_local_image(image_path, text, language, output_path,
                        container_margin=20,
                        container_width_percent=90,
                        target_width=None,
-                       target_height=None):
+                       target_height=None,
+                       quality=DEFAULT_QUALITY):
     """
     Process a local image by adding text overlay
     
@@ -65,10 +66,18 @@ def process_local_image(image_path, text, language, output_path,
         container_width_percent (int, optional): Width percentage of container
         target_width (int, optional): Target width for resizing
         target_height (int, optional): Target height for resizing
+        quality (str, optional): Quality tier ('fast', 'balanced' or 'best') setting the
+            resampling filter, JPEG decoding scale and encoder effort
     
     Returns:
         str: Path to the processed image
+        
+    Raises:
+        ValueError: If quality is not one of the quality tiers
     """
+    if quality not in QUALITY_TIERS:
+        raise ValueError(f"Invalid quality '{quality}'. Must be one of: {', '.join(QUALITY_TIERS)}")
+    
     logger.info(f"Processing local image: {image_path}")
     
     # Set default font family if not provided
@@ -86,19 +95,22 @@ def process_local_image(image_path, text, language, output_path,
         logger.error(f"Error loading image: {e}")
         return None
     
+    tier = QUALITY_TIERS[quality]
+    
     # Resize/crop if target dimensions are provided
     if target_width and target_height:
-        image = crop_to_fit(image, target_width, target_height)
+        image = crop_to_fit(image, target_width, target_height, **tier['resize'])
         logger.info(f"Image resized to {target_width}x{target_height}")
     
     # Apply text overlay
     result = apply_custom_text(
         image, text, language, font_family, font_size, text_color, bg_color,
-        None, alignment, padding, bg_curve, container_margin, container_width_percent
+        None, alignment, padding, bg_curve, container_margin, container_width_percent,
+        in_place=True
     )
     
     # Save the result
-    result.save(output_path, dpi=(300, 300))
+    result.save(output_path, dpi=(300, 300), **tier['save'])
     logger.info(f"Processed image saved to: {output_path}")
     
     return output_path
@@ -167,6 +179,8 @@ def main():
     parser.add_argument('--size', type=int, default=36, help='Font size')
     parser.add_argument('--width', type=int, help='Target width')
     parser.add_argument('--height', type=int, help='Target height')
+    parser.add_argument('--quality', choices=sorted(QUALITY_TIERS), default=DEFAULT_QUALITY,
+                        help='Quality tier (resampling filter, decoding scale, encoder effort)')
     parser.add_argument('--verify', action='store_true', help='Add verification overlay')
     
     args = parser.parse_args()
@@ -184,7 +198,7 @@ def main():
     result_path = process_local_image(
         args.image, args.text, args.language, str(output_path),
         font_family=args.font, font_size=args.size,
-        target_width=args.width, target_height=args.height
+        target_width=args.width, target_height=args.height, quality=args.quality
     )
     
     # Add verification overlay if requested